@@ -0,0 +1,104 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import Utility.DBConnector as Connector
+import Solution
+
+'''
+    asyncio versions of the Solution functions: "await AsyncSolution.getPlayerProfile(1)".
+    each call runs the Solution function itself on a worker thread, so the event loop never blocks on
+    psycopg2 and the ReturnValues and exception handling are exactly the synchronous ones.
+    there are as many workers as the connection pool has connections, so a worker never waits for one
+'''
+
+_executor = None
+_executorLock = threading.Lock()
+
+
+# sets the number of worker threads (default: the connection pool's max size). calls already running finish
+# on the old workers
+def configure(maxWorkers: int = None):
+    global _executor
+    with _executorLock:
+        old = _executor
+        _executor = ThreadPoolExecutor(maxWorkers or _poolSize(), thread_name_prefix="AsyncSolution")
+    if old is not None:
+        old.shutdown(wait=False)
+
+
+# waits for the running calls and stops the workers, the next call starts new ones
+async def shutdown():
+    global _executor
+    with _executorLock:
+        old, _executor = _executor, None
+    if old is not None:
+        await asyncio.get_running_loop().run_in_executor(None, old.shutdown)
+
+
+def _poolSize() -> int:
+    pool = Connector.getPool()
+    return pool.stats()["max_size"] if pool is not None else 10
+
+
+def _getExecutor() -> ThreadPoolExecutor:
+    global _executor
+    with _executorLock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(_poolSize(), thread_name_prefix="AsyncSolution")
+        return _executor
+
+
+def _mirror(function):
+    @functools.wraps(function)
+    async def mirrored(*args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(_getExecutor(),
+                                                                functools.partial(function, *args, **kwargs))
+    return mirrored
+
+
+migrate = _mirror(Solution.migrate)
+createTables = _mirror(Solution.createTables)
+clearTables = _mirror(Solution.clearTables)
+dropTables = _mirror(Solution.dropTables)
+
+addTeam = _mirror(Solution.addTeam)
+addMatch = _mirror(Solution.addMatch)
+getMatchProfile = _mirror(Solution.getMatchProfile)
+deleteMatch = _mirror(Solution.deleteMatch)
+addPlayer = _mirror(Solution.addPlayer)
+getPlayerProfile = _mirror(Solution.getPlayerProfile)
+deletePlayer = _mirror(Solution.deletePlayer)
+addStadium = _mirror(Solution.addStadium)
+getStadiumProfile = _mirror(Solution.getStadiumProfile)
+deleteStadium = _mirror(Solution.deleteStadium)
+
+addTeams = _mirror(Solution.addTeams)
+addMatches = _mirror(Solution.addMatches)
+addPlayers = _mirror(Solution.addPlayers)
+addStadiums = _mirror(Solution.addStadiums)
+addMatchBatch = _mirror(Solution.addMatchBatch)
+addPlayerBatch = _mirror(Solution.addPlayerBatch)
+addStadiumBatch = _mirror(Solution.addStadiumBatch)
+getMatchProfiles = _mirror(Solution.getMatchProfiles)
+getPlayerProfiles = _mirror(Solution.getPlayerProfiles)
+getStadiumProfiles = _mirror(Solution.getStadiumProfiles)
+
+playerScoredInMatch = _mirror(Solution.playerScoredInMatch)
+playerDidntScoreInMatch = _mirror(Solution.playerDidntScoreInMatch)
+matchInStadium = _mirror(Solution.matchInStadium)
+matchNotInStadium = _mirror(Solution.matchNotInStadium)
+playersScoredInMatches = _mirror(Solution.playersScoredInMatches)
+matchesInStadiums = _mirror(Solution.matchesInStadiums)
+
+averageAttendanceInStadium = _mirror(Solution.averageAttendanceInStadium)
+stadiumTotalGoals = _mirror(Solution.stadiumTotalGoals)
+playerIsWinner = _mirror(Solution.playerIsWinner)
+getActiveTallTeams = _mirror(Solution.getActiveTallTeams)
+getActiveTallRichTeams = _mirror(Solution.getActiveTallRichTeams)
+popularTeams = _mirror(Solution.popularTeams)
+getMostAttractiveStadiums = _mirror(Solution.getMostAttractiveStadiums)
+checkStadiumStats = _mirror(Solution.checkStadiumStats)
+rebuildStadiumStats = _mirror(Solution.rebuildStadiumStats)
+mostGoalsForTeam = _mirror(Solution.mostGoalsForTeam)
+getClosePlayers = _mirror(Solution.getClosePlayers)
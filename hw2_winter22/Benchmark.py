@@ -0,0 +1,722 @@
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+import Utility.DBConnector as Connector
+from Solution import *
+import AsyncSolution
+
+'''
+    Micro benchmarks against the database configured in Utility/database.ini
+    run all of them with "python Benchmark.py", or pick some: "python Benchmark.py pool"
+'''
+
+
+# calls fn(i) for i = 0, 1, 2, ... for the given number of seconds, returns calls per second
+def callsPerSecond(fn, seconds=3.0) -> float:
+    calls = 0
+    start = time.perf_counter()
+    end = start + seconds
+    while time.perf_counter() < end:
+        fn(calls)
+        calls += 1
+    return calls / (time.perf_counter() - start)
+
+
+def report(name, before, after, unit="calls/s"):
+    print(f"{name:<40} before: {before:>10.1f} {unit}   after: {after:>10.1f} {unit}   x{after / before:.2f}")
+
+
+def benchPool():
+    print("--------- CONNECTION POOL ---------")
+    dropTables()
+    createTables()
+    addTeam(1)
+    addPlayer(Player(1, 1, 20, 180, "Left"))
+    results = {}
+    for enabled in (False, True):
+        Connector.configurePool(enabled=enabled)
+        lookup = callsPerSecond(lambda i: getPlayerProfile(1))
+        insert = callsPerSecond(lambda i: addTeam(i + 2 + int(enabled) * 10 ** 7))
+        results[enabled] = (lookup, insert)
+    report("getPlayerProfile", results[False][0], results[True][0])
+    report("addTeam", results[False][1], results[True][1])
+    dropTables()
+
+
+def benchPrepared():
+    print("--------- PREPARED STATEMENTS ---------")
+    dropTables()
+    createTables()
+    addTeam(1)
+    for i in range(1, 1001):
+        addPlayer(Player(i, 1, 20, 180, "Left"))
+    conn = Connector.DBConnector()
+    literal = callsPerSecond(lambda i: conn.execute(sql.SQL(
+        "SELECT id, team_id, age, height, preferred_foot FROM Players WHERE id = {id}").format(
+        id=sql.Literal(i % 1000 + 1))))
+    prepared = callsPerSecond(lambda i: conn.executePrepared("get_player", (i % 1000 + 1,)))
+    report("player lookup, one connection", literal, prepared)
+    literal = callsPerSecond(lambda i: conn.execute(sql.SQL(
+        "INSERT INTO Players(id, team_id, age, height, preferred_foot) VALUES({id}, 1, 20, 180, 'Left')").format(
+        id=sql.Literal(i + 10 ** 6))))
+    prepared = callsPerSecond(lambda i: conn.executePrepared("add_player", (i + 10 ** 7, 1, 20, 180, "Left")))
+    report("player insert, one connection", literal, prepared)
+    conn.close()
+    dropTables()
+
+
+def benchBulk(rows=5000):
+    print("--------- BULK INSERT ---------")
+    players = [Player(i, 1, 20, 180, "Left") for i in range(1, rows + 1)]
+    timings = []
+    for bulk in (False, True):
+        dropTables()
+        createTables()
+        addTeam(1)
+        start = time.perf_counter()
+        if bulk:
+            addPlayers(players)
+        else:
+            for player in players:
+                addPlayer(player)
+        timings.append(rows / (time.perf_counter() - start))
+    report(f"add {rows} players", timings[0], timings[1], "rows/s")
+    dropTables()
+
+
+def benchEvents(sizes=(10000, 100000), sample=2000):
+    print("--------- BULK EVENTS ---------")
+    players = [Player(i, 1, 20, 180, "Left") for i in range(1, 101)]
+    for size in sizes:
+        matches = [Match(i, "Domestic", 1, 2) for i in range(1, size + 1)]
+        stadium = Stadium(1, 100000, 1)
+        goals = [(matches[i // len(players)], players[i % len(players)], 1) for i in range(size)]
+        attendance = [(match, stadium, 50000) for match in matches]
+        dropTables()
+        createTables()
+        addTeams([1, 2])
+        addMatches(matches)
+        addPlayers(players)
+        addStadium(stadium)
+        # the single-row rate is measured on a sample, a full 100k run one by one takes minutes
+        start = time.perf_counter()
+        for event in goals[:sample]:
+            playerScoredInMatch(*event)
+        scoredSingle = sample / (time.perf_counter() - start)
+        start = time.perf_counter()
+        for event in attendance[:sample]:
+            matchInStadium(*event)
+        attendedSingle = sample / (time.perf_counter() - start)
+        start = time.perf_counter()
+        playersScoredInMatches(goals[sample:])
+        scoredBulk = (size - sample) / (time.perf_counter() - start)
+        start = time.perf_counter()
+        matchesInStadiums(attendance[sample:])
+        attendedBulk = (size - sample) / (time.perf_counter() - start)
+        report(f"{size} goal events", scoredSingle, scoredBulk, "events/s")
+        report(f"{size} attendance events", attendedSingle, attendedBulk, "events/s")
+    dropTables()
+
+
+def benchMultiGet(squad=25):
+    print("--------- MULTI-GET ---------")
+    dropTables()
+    createTables()
+    addTeam(1)
+    addPlayers([Player(i, 1, 20, 180, "Left") for i in range(1, squad + 1)])
+    ids = list(range(1, squad + 1))
+    loop = callsPerSecond(lambda i: [getPlayerProfile(playerID) for playerID in ids])
+    batched = callsPerSecond(lambda i: getPlayerProfiles(ids))
+    report(f"{squad} player profiles", loop, batched, "squads/s")
+    dropTables()
+
+
+def benchCache(players=1000):
+    print("--------- ENTITY CACHE ---------")
+    dropTables()
+    createTables()
+    addTeam(1)
+    addPlayers([Player(i, 1, 20, 180, "Left") for i in range(1, players + 1)])
+    disableCache()
+    uncached = callsPerSecond(lambda i: getPlayerProfile(i % players + 1))
+    enableCache(maxSize=players)
+    cached = callsPerSecond(lambda i: getPlayerProfile(i % players + 1))
+    print(cacheStats())
+    disableCache()
+    report("getPlayerProfile", uncached, cached)
+    dropTables()
+
+
+def benchStadiumStats(matches=50000, stadiums=100):
+    print("--------- STADIUM STATISTICS ---------")
+    dropTables()
+    createTables()
+    addTeams([1, 2])
+    addPlayers([Player(i, 1, 20, 180, "Left") for i in range(1, 11)])
+    addStadiums([Stadium(i, 100000, None) for i in range(1, stadiums + 1)])
+    addMatches([Match(i, "Domestic", 1, 2) for i in range(1, matches + 1)])
+    matchesInStadiums([(Match(i), Stadium(i % stadiums + 1), 1000 + i % 500) for i in range(1, matches + 1)])
+    playersScoredInMatches([(Match(i), Player(j), 1) for i in range(1, matches + 1) for j in range(1, 3)])
+    conn = Connector.DBConnector()
+    views = [
+        lambda i: conn.execute(sql.SQL("SELECT avg FROM AverageAttendance WHERE stadium_id = {id}").format(
+            id=sql.Literal(i % stadiums + 1))),
+        lambda i: conn.execute(sql.SQL(
+            "SELECT total_goals FROM TotalStadiumGoalsIncludingZeros WHERE stad_id = {id}").format(
+            id=sql.Literal(i % stadiums + 1))),
+        lambda i: conn.execute(
+            "SELECT stad_id from TotalStadiumGoalsIncludingZeros ORDER BY total_goals DESC, stad_id ASC"),
+    ]
+    stored = [
+        lambda i: averageAttendanceInStadium(i % stadiums + 1),
+        lambda i: stadiumTotalGoals(i % stadiums + 1),
+        lambda i: getMostAttractiveStadiums(),
+    ]
+    for name, before, after in zip(["averageAttendanceInStadium", "stadiumTotalGoals", "getMostAttractiveStadiums"],
+                                   views, stored):
+        report(name, callsPerSecond(before), callsPerSecond(after))
+    conn.close()
+    print("inconsistent stadiums:", checkStadiumStats())
+    dropTables()
+
+
+# the Winners view before it was rewritten with a window function
+CORRELATED_WINNERS = "CREATE VIEW CorrelatedWinners AS SELECT Scores.match_id, Scores.player_id FROM Scores WHERE Scores.goals >= 0.5 *(SELECT sum(sum_goals) FROM TotalMatchGoals WHERE TotalMatchGoals.m_id = Scores.match_id)"
+
+
+def benchWinners(sizes=(10000, 100000, 1000000), playersPerMatch=20, players=1000):
+    print("--------- WINNERS ---------")
+    dropTables()
+    createTables()
+    addTeams([1, 2])
+    addPlayers([Player(i, 1, 20, 180, "Left") for i in range(1, players + 1)])
+    conn = Connector.DBConnector()
+    conn.execute(CORRELATED_WINNERS)
+    loaded = 0
+    for size in sizes:
+        first, last = loaded // playersPerMatch + 1, size // playersPerMatch
+        addMatches([Match(i, "Domestic", 1, 2) for i in range(first, last + 1)])
+        playersScoredInMatches([(Match(m), Player((m * 7 + j) % players + 1), j % 4)
+                                for m in range(first, last + 1) for j in range(playersPerMatch)])
+        loaded = size
+        conn.execute("ANALYZE Scores")
+        matches = last
+        correlated = callsPerSecond(lambda i: conn.execute(sql.SQL(
+            "SELECT * FROM CorrelatedWinners WHERE player_id={pID} AND match_id = {mID}").format(
+            pID=sql.Literal(i % players + 1), mID=sql.Literal(i % matches + 1))), seconds=2.0)
+        window = callsPerSecond(lambda i: playerIsWinner(i % players + 1, i % matches + 1), seconds=2.0)
+        report(f"playerIsWinner, {size} Scores rows", correlated, window)
+        print(f"{'':<40} latency: {1000 / correlated:.3f} ms -> {1000 / window:.3f} ms")
+        start = time.perf_counter()
+        conn.execute("SELECT count(*) FROM CorrelatedWinners")
+        correlated = time.perf_counter() - start
+        start = time.perf_counter()
+        conn.execute("SELECT count(*) FROM Winners")
+        window = time.perf_counter() - start
+        report(f"all winners, {size} Scores rows", 1 / correlated, 1 / window, "scans/s")
+    conn.execute("DROP VIEW CorrelatedWinners")
+    conn.close()
+    dropTables()
+
+
+# the query getClosePlayers ran over the AllMatchesPlayers view
+ALL_PAIRS_CLOSE_PLAYERS = "select player_id from AllMatchesPlayers where b_player_id={pID} and player_id <> {pID} and count >= (select count from SameMatchesByPlayer where player_id={pID} and b_player_id={pID})/2 ORDER BY player_id ASC LIMIT 10"
+
+
+def benchClosePlayers(sizes=(1000, 10000, 100000), playersPerMatch=11, matchesPerPlayer=30, viewLimit=10000):
+    print("--------- CLOSE PLAYERS ---------")
+    dropTables()
+    createTables()
+    addTeams([1, 2])
+    conn = Connector.DBConnector()
+    loaded = 0
+    for size in sizes:
+        # every player appears in matchesPerPlayer matches with playersPerMatch players each, plus some without any
+        addPlayers([Player(i, 1, 20, 180, "Left") for i in range(loaded + 1, size + 1)])
+        scorers = size * 9 // 10
+        matches = scorers * matchesPerPlayer // playersPerMatch
+        firstMatch = loaded * 9 // 10 * matchesPerPlayer // playersPerMatch + 1
+        addMatches([Match(i, "Domestic", 1, 2) for i in range(firstMatch, matches + 1)])
+        playersScoredInMatches([(Match(m), Player((m * 7919 + j * 104729) % scorers + 1), 1)
+                                for m in range(firstMatch, matches + 1) for j in range(playersPerMatch)])
+        loaded = size
+        conn.execute("ANALYZE")
+        # the view is quadratic, past viewLimit players it takes too long to measure
+        if size <= viewLimit:
+            view = callsPerSecond(lambda i: conn.execute(sql.SQL(ALL_PAIRS_CLOSE_PLAYERS).format(
+                pID=sql.Literal(i * 7 % size + 1))), seconds=2.0)
+        else:
+            view = float("nan")
+        direct = callsPerSecond(lambda i: getClosePlayers(i * 7 % size + 1), seconds=2.0)
+        if size <= viewLimit:
+            report(f"getClosePlayers, {size} players", view, direct)
+        else:
+            print(f"{f'getClosePlayers, {size} players':<40} before: {'skipped':>10}          after: {direct:>10.1f} calls/s")
+    conn.close()
+    dropTables()
+
+
+# runs fn() and returns (seconds, peak MB allocated by Python while it ran)
+def peakMemory(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def benchStream(rows=500000, players=100):
+    print("--------- STREAMING EXPORT ---------")
+    dropTables()
+    createTables()
+    addTeams([1, 2])
+    addPlayers([Player(i, 1, 20, 180, "Left") for i in range(1, players + 1)])
+    addMatches([Match(i, "Domestic", 1, 2) for i in range(1, rows // players + 1)])
+    playersScoredInMatches([(Match(i // players + 1), Player(i % players + 1), 1) for i in range(rows)])
+
+    def fetchAll():
+        conn = Connector.DBConnector()
+        total = sum([row[2] for row in conn.execute("SELECT match_id, player_id, goals FROM Scores ORDER BY match_id, player_id")[1].rows])
+        conn.close()
+        assert total == rows
+
+    def stream():
+        assert sum(row[2] for row in iterScores()) == rows
+
+    before = peakMemory(fetchAll)
+    after = peakMemory(stream)
+    report(f"export {rows} Scores rows, peak memory", before[1], after[1], "MB")
+    report(f"export {rows} Scores rows", rows / before[0], rows / after[0], "rows/s")
+    dropTables()
+
+
+def benchColumnar(rows=1000000):
+    print("--------- COLUMNAR RESULT SET ---------")
+    query = sql.SQL("SELECT g AS match_id, g % 1000 AS player_id, g % 5 AS goals FROM generate_series(1, {rows}) AS g").format(
+        rows=sql.Literal(rows))
+    conn = Connector.DBConnector()
+    results = []
+    for columnar in (False, True):
+        tracemalloc.start()
+        start = time.perf_counter()
+        res = conn.executeColumnar(query) if columnar else conn.execute(query)[1]
+        load = time.perf_counter() - start
+        kept, peak = [size / 2 ** 20 for size in tracemalloc.get_traced_memory()]
+        tracemalloc.stop()
+        start = time.perf_counter()
+        total = sum(res.column("goals")) if columnar else sum([row[2] for row in res.rows])
+        scan = time.perf_counter() - start
+        start = time.perf_counter()
+        count = res.where("goals", ">=", 3).size() if columnar else len([row for row in res.rows if row[2] >= 3])
+        filtered = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in range(0, rows, 10):
+            res[i]["goals"]
+        lookups = time.perf_counter() - start
+        assert total == rows // 5 * 10 and count == rows * 2 // 5
+        results.append((kept, peak, rows / load, rows / scan, rows / filtered, rows / 10 / lookups))
+        del res
+    before, after = results
+    for index, (name, unit) in enumerate([(f"{rows} rows, memory kept", "MB"), (f"{rows} rows, peak memory", "MB"),
+                                          ("load", "rows/s"), ("sum a column", "rows/s"), ("filter a column", "rows/s"),
+                                          ("res[i][name]", "rows/s")]):
+        report(name, before[index], after[index], unit)
+    conn.close()
+
+
+# ResultSet[i] before rows became ResultSetRow views: a ResultSetDict per access, and a print on a miss
+def legacyRow(res, row):
+    if len(res.rows) <= row:
+        print('Invalid row ' + str(row))
+        return Connector.ResultSetDict()
+    row_to_return = Connector.ResultSetDict()
+    for val, col in zip(res.rows[row], res.cols_header):
+        row_to_return[col] = val
+    return row_to_return
+
+
+def benchRows(rows=1000, columns=5):
+    print("--------- RESULT SET ROWS ---------")
+    conn = Connector.DBConnector()
+    res = conn.execute(sql.SQL("SELECT " + ", ".join([f"g + {i} AS col{i}" for i in range(columns)]) +
+                               " FROM generate_series(1, {rows}) AS g").format(rows=sql.Literal(rows)))[1]
+    conn.close()
+    report(f"res[i][name], {columns} columns", callsPerSecond(lambda i: legacyRow(res, i % rows)["col3"]),
+           callsPerSecond(lambda i: res[i % rows]["col3"]))
+
+    def miss(i):
+        try:
+            res[rows]
+        except IndexError:
+            pass
+
+    # stdout is sent nowhere so this measures the print itself, not the terminal
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        legacy = callsPerSecond(lambda i: legacyRow(res, rows))
+    report("res[i] out of range", legacy, callsPerSecond(miss))
+
+
+# the same class with a per instance __dict__, like the Business classes were before __slots__
+def withoutSlots(cls):
+    namespace = {name: value for name, value in vars(cls).items()
+                 if name != "__slots__" and type(value).__name__ != "member_descriptor"}
+    return type(cls.__name__, (), namespace)
+
+
+def benchEntities(count=1000000):
+    print("--------- BUSINESS ENTITIES ---------")
+    rows = {Player: [(i, 1, 20, 180, "Left") for i in range(count)],
+            Match: [(i, "Domestic", 1, 2) for i in range(count)],
+            Stadium: [(i, 50000, None) for i in range(count)]}
+    for cls, clsRows in rows.items():
+        results = []
+        for build in (withoutSlots(cls), cls):
+            tracemalloc.start()
+            start = time.perf_counter()
+            entities = [build.fromRow(row) for row in clsRows]
+            seconds = time.perf_counter() - start
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del entities
+            # the list itself holds 8 bytes per entity, and the row values are shared
+            results.append((size / count - 8, count / seconds))
+        report(f"{cls.__name__}, bytes per instance", results[0][0], results[1][0], "B")
+        report(f"{cls.__name__}.fromRow", results[0][1], results[1][1], "obj/s")
+
+
+def benchBatch(rows=100000, badRates=(0, 10)):
+    print("--------- ENTITY BATCHES ---------")
+    for badEvery in badRates:
+        # every badEvery-th player breaks a CHECK constraint, none with 0
+        data = [(i, 1, 0 if badEvery and i % badEvery == 0 else 20, 180, "Left") for i in range(1, rows + 1)]
+        timings = []
+        for batched in (False, True):
+            dropTables()
+            createTables()
+            addTeam(1)
+            start = time.perf_counter()
+            if batched:
+                results = addPlayerBatch(PlayerBatch(data))
+            else:
+                results = addPlayers([Player(*row) for row in data])
+            timings.append(rows / (time.perf_counter() - start))
+            assert results.count(ReturnValue.BAD_PARAMS) == (rows // badEvery if badEvery else 0)
+        report(f"add {rows} players, " + (f"1 in {badEvery} bad" if badEvery else "none bad"), timings[0], timings[1],
+               "rows/s")
+    dropTables()
+
+
+# a simulated request handler, a couple of calls to the database. blocking=True calls Solution directly
+# from the coroutine, the way the service did before AsyncSolution
+async def matchDayRequest(i, players, blocking):
+    if blocking:
+        return playerIsWinner(getPlayerProfile(i % players + 1).getPlayerID(), i % 100 + 1)
+    profile = await AsyncSolution.getPlayerProfile(i % players + 1)
+    return await AsyncSolution.playerIsWinner(profile.getPlayerID(), i % 100 + 1)
+
+
+def benchAsync(requests=5000, players=1000, concurrencies=(1, 4, 16, 64)):
+    print("--------- ASYNCIO LOAD ---------")
+    dropTables()
+    createTables()
+    addTeams([1, 2])
+    addPlayers([Player(i, 1, 20, 180, "Left") for i in range(1, players + 1)])
+    addMatches([Match(i, "Domestic", 1, 2) for i in range(1, 101)])
+    playersScoredInMatches([(Match(i), Player(i * 7 % players + 1), 1) for i in range(1, 101)])
+
+    # returns requests per second and the longest the event loop was stuck (a 1 ms timer's worst delay)
+    async def run(concurrency, blocking):
+        pending = iter(range(requests))
+        lag = [0.0]
+        done = asyncio.Event()
+
+        async def client():
+            for i in pending:
+                await matchDayRequest(i, players, blocking)
+                if blocking:
+                    await asyncio.sleep(0)
+
+        async def heartbeat():
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(0.001)
+                lag[0] = max(lag[0], time.perf_counter() - start - 0.001)
+
+        beat = asyncio.create_task(heartbeat())
+        start = time.perf_counter()
+        await asyncio.gather(*[client() for j in range(concurrency)])
+        rate = requests / (time.perf_counter() - start)
+        done.set()
+        await beat
+        return rate, lag[0] * 1000
+
+    async def runAll():
+        results = [(await run(concurrency, True), await run(concurrency, False)) for concurrency in concurrencies]
+        await AsyncSolution.shutdown()
+        return results
+
+    for concurrency, (blocking, nonBlocking) in zip(concurrencies, asyncio.run(runAll())):
+        report(f"{concurrency} concurrent clients", blocking[0], nonBlocking[0], "req/s")
+        print(f"{'':<40} worst event loop stall: {blocking[1]:.1f} ms -> {nonBlocking[1]:.1f} ms")
+    dropTables()
+
+
+def benchThreads(players=2000, threads=32):
+    print("--------- THREADED WORKERS ---------")
+    rates = []
+    # a thread pool opening a connection per call, then runMany over the shared connection pool
+    for pooled in (False, True):
+        Connector.configurePool(enabled=pooled)
+        dropTables()
+        createTables()
+        addTeam(1)
+        start = time.perf_counter()
+        if pooled:
+            results = runMany(addPlayer, [(Player(i, 1, 20, 180, "Left"),) for i in range(1, players + 1)], threads)
+        else:
+            with ThreadPoolExecutor(threads) as executor:
+                results = list(executor.map(addPlayer, [Player(i, 1, 20, 180, "Left") for i in range(1, players + 1)]))
+        rates.append(players / (time.perf_counter() - start))
+        assert results == [ReturnValue.OK] * players
+    report(f"addPlayer from {threads} threads", rates[0], rates[1])
+    print(Connector.getPool().stats())
+    dropTables()
+
+
+def benchTransaction(matches=300, scorers=5):
+    print("--------- UNIT OF WORK ---------")
+    rates = []
+    for grouped in (False, True):
+        dropTables()
+        createTables()
+        addTeams([1, 2])
+        addStadium(Stadium(1, 100000, None))
+        addPlayers([Player(i, 1, 20, 180, "Left") for i in range(1, scorers + 1)])
+        start = time.perf_counter()
+        for m in range(1, matches + 1):
+            # one match day: the match, its attendance and the goals
+            if grouped:
+                with transaction():
+                    matchDay(m, scorers)
+            else:
+                matchDay(m, scorers)
+        rates.append(matches / (time.perf_counter() - start))
+    report(f"match days ({2 + scorers} calls each)", rates[0], rates[1], "days/s")
+    dropTables()
+
+
+def matchDay(m, scorers):
+    assert addMatch(Match(m, "Domestic", 1, 2)) == ReturnValue.OK
+    assert matchInStadium(Match(m), Stadium(1), 50000) == ReturnValue.OK
+    for p in range(1, scorers + 1):
+        assert playerScoredInMatch(Match(m), Player(p), 1) == ReturnValue.OK
+
+
+# createTables/dropTables the way they were: a round trip and a commit per statement
+def legacyCreateTables():
+    with Connector.DBConnector() as conn:
+        for statement in CREATE_TABLES:
+            conn.execute(statement)
+        conn.execute("CREATE TABLE IF NOT EXISTS SchemaVersion(version integer NOT NULL)")
+        conn.execute("LOCK TABLE SchemaVersion IN EXCLUSIVE MODE")
+        conn.execute("SELECT COALESCE(MAX(version), 0) FROM SchemaVersion")
+        for migration, statements in SCHEMA_MIGRATIONS:
+            for statement in statements:
+                conn.execute(statement)
+        conn.execute("DELETE FROM SchemaVersion")
+        conn.execute("INSERT INTO SchemaVersion(version) VALUES(" + str(SCHEMA_VERSION) + ")")
+        for statement in CREATE_STATS_AND_VIEWS:
+            conn.execute(statement)
+
+
+def legacyDropTables():
+    with Connector.DBConnector() as conn:
+        for statement in DROP_SCHEMA:
+            conn.execute(statement)
+
+
+def benchSchema():
+    print("--------- SCHEMA SETUP / TEARDOWN ---------")
+    dropTables()
+    rates = []
+    for create, drop in ((legacyCreateTables, legacyDropTables), (createTables, dropTables)):
+        # one createTables + dropTables, what every test's setUp/tearDown pays
+        rates.append(callsPerSecond(lambda i: (create(), drop()), seconds=5.0))
+    report("createTables + dropTables", rates[0], rates[1], "cycles/s")
+
+
+def benchFixture(runs=5):
+    print("--------- TEST FIXTURES ---------")
+    import unittest
+    import SimpleTest
+    rates = {}
+    for fixture in ("rebuild", "truncate", "rollback"):
+        os.environ["TEST_FIXTURE"] = fixture
+        start = time.perf_counter()
+        for i in range(runs):
+            # a suite drops its tests as it runs them
+            suite = unittest.defaultTestLoader.loadTestsFromTestCase(SimpleTest.Test)
+            with redirect_stdout(open(os.devnull, "w")):
+                result = unittest.TextTestRunner(stream=open(os.devnull, "w")).run(suite)
+            assert result.wasSuccessful(), fixture
+        rates[fixture] = runs / (time.perf_counter() - start)
+    del os.environ["TEST_FIXTURE"]
+    tests = suite.countTestCases()
+    report(f"SimpleTest.Test, {tests} tests, truncate", rates["rebuild"], rates["truncate"], "suites/s")
+    report(f"SimpleTest.Test, {tests} tests, rollback", rates["rebuild"], rates["rollback"], "suites/s")
+
+
+def benchQueryStats(players=1000):
+    print("--------- QUERY STATISTICS ---------")
+    dropTables()
+    createTables()
+    addTeam(1)
+    addPlayers([Player(i, 1, 20, 180, "Left") for i in range(1, players + 1)])
+    # off and on alternate and the best round of each counts, the difference is close to the noise
+    results = {False: (0, 0), True: (0, 0)}
+    for round in range(3):
+        for enabled in (False, True):
+            stats = Connector.enableQueryStats() if enabled else Connector.disableQueryStats()
+            lookup = callsPerSecond(lambda i: getPlayerProfile(i % players + 1), seconds=1.0)
+            insert = callsPerSecond(lambda i: addTeam(i + 2 + (round * 2 + int(enabled)) * 10 ** 7), seconds=1.0)
+            results[enabled] = (max(results[enabled][0], lookup), max(results[enabled][1], insert))
+    Connector.disableQueryStats()
+    report("getPlayerProfile", results[False][0], results[True][0])
+    report("addTeam", results[False][1], results[True][1])
+    stats = Connector.QueryStats()
+    literal = callsPerSecond(lambda i: stats.recordQuery("INSERT INTO Teams(id) VALUES(" + str(i) + ")", 0.0003, 1))
+    template = callsPerSecond(lambda i: stats.recordQuery("EXECUTE get_player(%s)", 0.0003, 0, 1))
+    print(f"{'recordQuery, literals in the text':<40} {1e6 / literal:.1f} us per statement")
+    print(f"{'recordQuery, a %s template':<40} {1e6 / template:.1f} us per statement")
+    dropTables()
+
+
+def benchTracing(players=1000):
+    print("--------- TRACING ---------")
+    import tempfile
+    from Utility import Tracing
+    dropTables()
+    createTables()
+    addTeam(1)
+    addPlayers([Player(i, 1, 20, 180, "Left") for i in range(1, players + 1)])
+    path = os.path.join(tempfile.mkdtemp(), "spans.jsonl")
+    # the wrapper around a function doing nothing, what tracing adds to every call
+    noop = Tracing.traced(lambda: ReturnValue.OK)
+    overhead = []
+    for mode in ("off", "buffer", "file"):
+        if mode != "off":
+            Tracing.enableTracing(exportPath=path if mode == "file" else None)
+        overhead.append(1e6 / callsPerSecond(lambda i: noop()))
+    Tracing.disableTracing()
+    base = 1e6 / callsPerSecond(lambda i: noop.__wrapped__())
+    print(f"{'wrapper per call':<40} none: {base:.2f} us   off: {overhead[0]:.2f} us   ring buffer: "
+          f"{overhead[1]:.2f} us   + file: {overhead[2]:.2f} us")
+    # where the time of a few calls goes
+    Tracing.enableTracing(bufferSize=10000)
+    for i in range(1000):
+        getPlayerProfile(i % players + 1)
+        addTeam(i % 10 + 1)
+        getClosePlayers(i % players + 1)
+    phases = {}
+    for span in Tracing.recentSpans():
+        totals = phases.setdefault(span.name, {"count": 0, "other": 0.0})
+        totals["count"] += 1
+        totals["other"] += span.other()
+        for phase, seconds in span.phases.items():
+            totals[phase] = totals.get(phase, 0.0) + seconds
+    Tracing.disableTracing()
+    for name, totals in phases.items():
+        print(f"{name:<40} " + "   ".join(f"{phase}: {totals.get(phase, 0.0) / totals['count'] * 1e6:.0f} us"
+                                         for phase in Tracing.PHASES + ("other",)))
+    dropTables()
+
+
+# addTeam as it was before OPERATIONS, its own exception ladder around its own statement
+def legacyAddTeam(teamID: int) -> ReturnValue:
+    r = ReturnValue.OK
+    conn = None
+    try:
+        conn = Connector.DBConnector()
+        query = sql.SQL("INSERT INTO Teams(id) VALUES({id})").format(id=sql.Literal(teamID))
+        rows_effected, _ = conn.execute(query)
+    except DatabaseException.ConnectionInvalid as e:
+        r = ReturnValue.ERROR
+    except DatabaseException.NOT_NULL_VIOLATION as e:
+        r = ReturnValue.BAD_PARAMS
+    except DatabaseException.CHECK_VIOLATION as e:
+        r = ReturnValue.BAD_PARAMS
+    except DatabaseException.UNIQUE_VIOLATION as e:
+        r = ReturnValue.ALREADY_EXISTS
+    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
+        r = ReturnValue.BAD_PARAMS
+    except Exception as e:
+        print(e)
+    finally:
+        if conn is not None:
+            conn.close()
+    return r
+
+
+def benchBreaker(port="1"):
+    print("--------- BREAKER ---------")
+    dropTables()
+    createTables()
+    # the table driven functions against the ladders they replaced, half of the calls hit UNIQUE_VIOLATION
+    before = callsPerSecond(lambda i: legacyAddTeam(i // 2 + 1))
+    clearTables()
+    after = callsPerSecond(lambda i: addTeam(i // 2 + 1))
+    report("addTeam, ladder -> OPERATIONS", before, after)
+    dropTables()
+    # nothing listens on port, every connect is refused
+    previous = os.environ.get("PGPORT")
+    os.environ["PGPORT"] = port
+    Connector.reloadConfig()
+    try:
+        Connector.configureBreaker(enabled=False)
+        before = callsPerSecond(lambda i: addTeam(i + 1), seconds=1.0)
+        Connector.configureBreaker()
+        after = callsPerSecond(lambda i: addTeam(i + 1), seconds=1.0)
+        report("addTeam, database unreachable", before, after)
+        print(f"{'ERROR latency':<40} before: {1e6 / before:>10.1f} us   after: {1e6 / after:>10.1f} us")
+    finally:
+        if previous is None:
+            del os.environ["PGPORT"]
+        else:
+            os.environ["PGPORT"] = previous
+        Connector.reloadConfig()
+
+
+BENCHMARKS = {
+    "pool": benchPool,
+    "prepared": benchPrepared,
+    "bulk": benchBulk,
+    "events": benchEvents,
+    "multiget": benchMultiGet,
+    "cache": benchCache,
+    "stadiums": benchStadiumStats,
+    "winners": benchWinners,
+    "close": benchClosePlayers,
+    "stream": benchStream,
+    "columnar": benchColumnar,
+    "rows": benchRows,
+    "entities": benchEntities,
+    "batch": benchBatch,
+    "async": benchAsync,
+    "threads": benchThreads,
+    "transaction": benchTransaction,
+    "schema": benchSchema,
+    "fixture": benchFixture,
+    "stats": benchQueryStats,
+    "tracing": benchTracing,
+    "breaker": benchBreaker,
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
@@ -0,0 +1,197 @@
+import operator
+from array import array
+from itertools import repeat
+from typing import Iterable, List
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, the checks fall back to map() over the arrays
+    numpy = None
+
+INT_MIN = -2 ** 31
+INT_MAX = 2 ** 31 - 1
+
+
+# many rows of one table kept column by column: integer columns in array('q') and text columns with a fixed
+# set of allowed values as array('b') codes into that set, plus a NULL flag per column.
+# subclasses say which columns there are and what the table's NOT NULL / CHECK constraints are
+class Batch:
+    TABLE = None
+    COLUMNS = ()  # database columns, in row order
+    DOMAINS = {}  # text column -> its allowed values, every other column is an integer
+    NULLABLE = ()
+    POSITIVE = ()  # integer columns with CHECK(column > 0)
+
+    def __init__(self, rows: Iterable[tuple] = ()):
+        self.__values = [array('b') if column in self.DOMAINS else array('q') for column in self.COLUMNS]
+        self.__nulls = [bytearray() for column in self.COLUMNS]
+        self.__size = 0
+        self.extend(rows)
+
+    def __len__(self):
+        return self.__size
+
+    # adds a row (values in COLUMNS order). integer columns only take int or None, anything else raises
+    # TypeError and leaves the batch as it was
+    def appendRow(self, row: tuple):
+        self.extend((row,))
+
+    # adds rows like appendRow, a column at a time. if any row is refused none of them are added
+    def extend(self, rows: Iterable[tuple]):
+        rows = list(rows)
+        for row in rows:
+            if len(row) != len(self.COLUMNS):
+                raise ValueError("Expected " + str(len(self.COLUMNS)) + " values, got " + str(len(row)))
+        if not rows:
+            return
+        coded = []
+        for name, values in zip(self.COLUMNS, zip(*rows)):
+            nulls = bytearray(map(operator.is_, values, repeat(None)))
+            if name in self.DOMAINS:
+                codes = {value: code for code, value in enumerate(self.DOMAINS[name])}
+                codes[None] = 0
+                values = array('b', [codes.get(value, -1) if type(value) is str or value is None else -1
+                                     for value in values])
+            else:
+                types = set(map(type, values))
+                types.discard(type(None))
+                if types - {int}:
+                    raise TypeError(name + " must be an int, got " + ", ".join(sorted([t.__name__ for t in types - {int}])))
+                try:
+                    values = array('q', [0 if value is None else value for value in values] if any(nulls) else values)
+                except OverflowError:
+                    raise OverflowError(name + " out of range") from None
+            coded.append((values, nulls))
+        for column, (values, nulls) in enumerate(coded):
+            self.__values[column].extend(values)
+            self.__nulls[column].extend(nulls)
+        self.__size += len(rows)
+
+    # row i as the database gets it
+    def row(self, i: int) -> tuple:
+        if not -self.__size <= i < self.__size:
+            raise IndexError('Invalid row ' + str(i))
+        return tuple([self.__value(column, i) for column in range(len(self.COLUMNS))])
+
+    # the given rows (all of them by default) as tuples, in the order asked for. built a column at a time
+    def rows(self, indexes: Iterable[int] = None) -> List[tuple]:
+        indexes = self.__checkIndexes(indexes)
+        columns = []
+        for name, values, nulls in zip(self.COLUMNS, self.__values, self.__nulls):
+            if indexes is not None:
+                values = [values[i] for i in indexes]
+                nulls = [nulls[i] for i in indexes]
+            if name in self.DOMAINS:
+                domain = self.DOMAINS[name]
+                values = [domain[value] if value >= 0 else None for value in values]
+            columns.append([None if null else value for value, null in zip(values, nulls)] if any(nulls) else list(values))
+        return list(zip(*columns))
+
+    # the given rows (all of them by default) in COPY FROM text format, without going through tuples: the
+    # integers need no escaping and the text columns only hold their domain's values
+    def copyLines(self, indexes: Iterable[int] = None) -> List[str]:
+        indexes = self.__checkIndexes(indexes)
+        columns = []
+        for name, values, nulls in zip(self.COLUMNS, self.__values, self.__nulls):
+            if indexes is not None:
+                values = [values[i] for i in indexes]
+                nulls = [nulls[i] for i in indexes]
+            if name in self.DOMAINS:
+                domain = self.DOMAINS[name]
+                values = [domain[value] if value >= 0 else "\\N" for value in values]
+            else:
+                values = list(map(str, values))
+            columns.append(["\\N" if null else value for value, null in zip(values, nulls)] if any(nulls) else values)
+        return list(map("\t".join, zip(*columns)))
+
+    # the stored codes of a column, an array('q') of values or an array('b') of indexes into its domain.
+    # NULL rows hold 0, see nulls()
+    def column(self, name: str) -> array:
+        return self.__values[self.COLUMNS.index(name)]
+
+    def nulls(self, name: str) -> bytearray:
+        return self.__nulls[self.COLUMNS.index(name)]
+
+    # True for every row the database would refuse with a NOT NULL or CHECK violation, computed one column
+    # at a time (min/max first, a mask is only built for a column that has a bad value). rows with an integer
+    # outside the database's integer range are never flagged: the database rejects those before looking at
+    # the constraints, and with another error
+    def invalid(self) -> list:
+        bad = [] + self._check()
+        outOfRange = []
+        for name, values, nulls in zip(self.COLUMNS, self.__values, self.__nulls):
+            if not values:
+                continue
+            hasNulls = any(nulls)
+            if hasNulls and name not in self.NULLABLE:
+                bad.append(self._mask(nulls, operator.ne, 0))
+            if name in self.DOMAINS:
+                if min(values) < 0:
+                    bad.append(self._mask(values, operator.lt, 0))
+                continue
+            if min(values) < INT_MIN:
+                outOfRange.append(self._mask(values, operator.lt, INT_MIN))
+            if max(values) > INT_MAX:
+                outOfRange.append(self._mask(values, operator.gt, INT_MAX))
+            if name in self.POSITIVE and min(values) <= 0:
+                positive = self._mask(values, operator.le, 0)
+                if name in self.NULLABLE and hasNulls:
+                    # a NULL is stored as 0 but passes the CHECK
+                    positive = self._and(positive, self._not(self._mask(nulls, operator.ne, 0)))
+                bad.append(positive)
+        result = self._mask(bytes(self.__size), operator.ne, 0)
+        for mask in bad:
+            result = self._or(result, mask)
+        for mask in outOfRange:
+            result = self._and(result, self._not(mask))
+        return result.tolist() if numpy is not None else result
+
+    # masks (like _mask() gives) of the rows breaking the subclass's constraints across columns
+    def _check(self) -> list:
+        return []
+
+    # compare(value, constant) for every value of an array
+    @staticmethod
+    def _mask(values, compare, constant):
+        if numpy is not None:
+            return compare(numpy.frombuffer(values, dtype=values.typecode if isinstance(values, array) else 'u1'),
+                           constant)
+        return list(map(compare, values, repeat(constant)))
+
+    # compare(a, b) row by row for two arrays of the same length
+    @staticmethod
+    def _pairs(first, second, compare):
+        if numpy is not None:
+            return compare(numpy.frombuffer(first, dtype=first.typecode), numpy.frombuffer(second, dtype=second.typecode))
+        return list(map(compare, first, second))
+
+    @staticmethod
+    def _or(first, second):
+        return first | second if numpy is not None else list(map(operator.or_, first, second))
+
+    @staticmethod
+    def _and(first, second):
+        return first & second if numpy is not None else list(map(operator.and_, first, second))
+
+    @staticmethod
+    def _not(mask):
+        return ~mask if numpy is not None else [not flag for flag in mask]
+
+    def __checkIndexes(self, indexes):
+        if indexes is None:
+            return None
+        indexes = list(indexes)
+        for i in indexes:
+            if not -self.__size <= i < self.__size:
+                raise IndexError('Invalid row ' + str(i))
+        return indexes
+
+    def __value(self, column: int, i: int):
+        if self.__nulls[column][i]:
+            return None
+        value = self.__values[column][i]
+        name = self.COLUMNS[column]
+        if name in self.DOMAINS:
+            # a code of -1 is a value outside the domain, those rows never get to the database
+            return self.DOMAINS[name][value] if value >= 0 else None
+        return value
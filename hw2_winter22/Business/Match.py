@@ -1,4 +1,6 @@
 class Match:
+    __slots__ = ("__matchID", "__competition", "__homeTeamID", "__awayTeamID")
+
     def __init__(self, matchID=None, competition=None, homeTeamID=None, awayTeamID=None):
         self.__matchID = matchID
         self.__competition = competition
@@ -33,6 +35,11 @@ class Match:
     def badMatch():
         return Match()
 
+    # from a (id, competition, home_id, away_id) row as the queries return it
+    @classmethod
+    def fromRow(cls, row):
+        return cls(*row)
+
     def __str__(self):
         print("MatchID=" + str(self.__matchID) + ", competition=" + str(self.__competition) + ", home team=" + str(
             self.__homeTeamID) + ", away team=" + str(self.__awayTeamID))
@@ -0,0 +1,24 @@
+import operator
+from Business.Batch import Batch
+from Business.Match import Match
+
+
+# matches for addMatchBatch, kept column by column instead of as Match objects
+class MatchBatch(Batch):
+    TABLE = "Matches"
+    COLUMNS = ("id", "competition", "home_id", "away_id")
+    DOMAINS = {"competition": ("International", "Domestic")}
+    POSITIVE = ("id", "home_id", "away_id")
+
+    def append(self, matchID=None, competition=None, homeTeamID=None, awayTeamID=None):
+        self.appendRow((matchID, competition, homeTeamID, awayTeamID))
+
+    def appendMatch(self, match: Match):
+        self.appendRow((match.getMatchID(), match.getCompetition(), match.getHomeTeamID(), match.getAwayTeamID()))
+
+    def getMatch(self, i: int) -> Match:
+        return Match.fromRow(self.row(i))
+
+    # CHECK(away_id != home_id)
+    def _check(self) -> list:
+        return [self._pairs(self.column("home_id"), self.column("away_id"), operator.eq)]
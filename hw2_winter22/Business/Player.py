@@ -1,4 +1,7 @@
 class Player:
+    # no per instance __dict__, batch jobs keep millions of these
+    __slots__ = ("__playerID", "__teamID", "__age", "__height", "__foot")
+
     def __init__(self, playerID=None, teamID=None, age=None, height=None, foot=None):
         self.__playerID = playerID
         self.__teamID = teamID
@@ -40,6 +43,11 @@ class Player:
     def badPlayer():
         return Player()
 
+    # from a (id, team_id, age, height, preferred_foot) row as the queries return it
+    @classmethod
+    def fromRow(cls, row):
+        return cls(*row)
+
     def __str__(self):
         print("PlayerID=" + str(self.__playerID) + ", TeamID=" + str(self.__teamID) + ", age=" + str(self.__age)
               + ", height=" + str(self.__height) + ", foot=" + str(self.__foot))
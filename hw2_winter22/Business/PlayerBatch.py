@@ -0,0 +1,19 @@
+from Business.Batch import Batch
+from Business.Player import Player
+
+
+# players for addPlayerBatch, kept column by column instead of as Player objects
+class PlayerBatch(Batch):
+    TABLE = "Players"
+    COLUMNS = ("id", "team_id", "age", "height", "preferred_foot")
+    DOMAINS = {"preferred_foot": ("Left", "Right")}
+    POSITIVE = ("id", "team_id", "age", "height")
+
+    def append(self, playerID=None, teamID=None, age=None, height=None, foot=None):
+        self.appendRow((playerID, teamID, age, height, foot))
+
+    def appendPlayer(self, player: Player):
+        self.appendRow((player.getPlayerID(), player.getTeamID(), player.getAge(), player.getHeight(), player.getFoot()))
+
+    def getPlayer(self, i: int) -> Player:
+        return Player.fromRow(self.row(i))
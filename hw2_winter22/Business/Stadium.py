@@ -1,4 +1,6 @@
 class Stadium:
+    __slots__ = ("__stadiumID", "__capacity", "__belongsTo")
+
     def __init__(self, stadiumID=None, capacity=None, belongsTo=None):
         self.__stadiumID = stadiumID
         self.__capacity = capacity
@@ -26,6 +28,11 @@ class Stadium:
     def badStadium():
         return Stadium()
 
+    # from a (id, capacity, belong_to) row as the queries return it
+    @classmethod
+    def fromRow(cls, row):
+        return cls(*row)
+
     def __str__(self):
         print("stadiumID=" + str(self.__stadiumID) + ", capacity=" + str(self.__capacity) + ", belongs to=" + str(
             self.__belongsTo))
@@ -0,0 +1,19 @@
+from Business.Batch import Batch
+from Business.Stadium import Stadium
+
+
+# stadiums for addStadiumBatch, kept column by column instead of as Stadium objects
+class StadiumBatch(Batch):
+    TABLE = "Stadiums"
+    COLUMNS = ("id", "capacity", "belong_to")
+    NULLABLE = ("belong_to",)
+    POSITIVE = ("id", "capacity")
+
+    def append(self, stadiumID=None, capacity=None, belongsTo=None):
+        self.appendRow((stadiumID, capacity, belongsTo))
+
+    def appendStadium(self, stadium: Stadium):
+        self.appendRow((stadium.getStadiumID(), stadium.getCapacity(), stadium.getBelongsTo()))
+
+    def getStadium(self, i: int) -> Stadium:
+        return Stadium.fromRow(self.row(i))
@@ -0,0 +1,72 @@
+import io
+import multiprocessing
+import os
+import sys
+import time
+import unittest
+import Utility.DBConnector as Connector
+from psycopg2 import sql
+
+'''
+    Runs the SimpleTest suite on several processes at once against the database in Utility/database.ini.
+    from this directory, with the repository root on the path (SimpleTest imports hw2_winter22.abstractTest):
+    "PYTHONPATH=.. python ParallelTest.py" (one worker per core) or "PYTHONPATH=.. python ParallelTest.py 4".
+    each worker works in its own schema (PGSCHEMA=test_worker_<n>, see Solution.createTables), so they never
+    see each other's tables. the schemas are dropped at the end
+'''
+
+SCHEMA_PREFIX = "test_worker_"
+
+
+# the test ids of a module, split round robin into shards. a shard keeps its tests in the module's order,
+# so tests of the same class stay together and the class is set up once per worker
+def shards(module: str, workers: int) -> list:
+    suite = unittest.defaultTestLoader.loadTestsFromName(module)
+    ids = [test.id() for test in _flatten(suite)]
+    return [ids[worker::workers] for worker in range(workers)]
+
+
+def _flatten(suite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from _flatten(test)
+        else:
+            yield test
+
+
+# runs in the worker process. returns (tests run, failures, errors, skipped, the runner's report)
+def runShard(worker: int, ids: list):
+    os.environ["PGSCHEMA"] = SCHEMA_PREFIX + str(worker)
+    Connector.reloadConfig()
+    stream = io.StringIO()
+    result = unittest.TextTestRunner(stream=stream, verbosity=2).run(
+        unittest.defaultTestLoader.loadTestsFromNames(ids))
+    return result.testsRun, len(result.failures), len(result.errors), len(result.skipped), stream.getvalue()
+
+
+def dropSchemas(workers: int):
+    with Connector.DBConnector() as conn:
+        conn.executeScript([sql.SQL("DROP SCHEMA IF EXISTS {schema} CASCADE").format(
+            schema=sql.SQL(SCHEMA_PREFIX + str(worker))) for worker in range(workers)])
+
+
+# returns True if every test passed
+def runParallel(module="SimpleTest", workers: int = None) -> bool:
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    # spawn: the workers must not share the parent's pooled connections
+    with multiprocessing.get_context("spawn").Pool(workers) as pool:
+        results = pool.starmap(runShard, enumerate(shards(module, workers)))
+    dropSchemas(workers)
+    totals = [sum(counts) for counts in zip(*[result[:4] for result in results])]
+    for worker, result in enumerate(results):
+        print("--------- worker " + str(worker) + " ---------")
+        print(result[4])
+    print("Ran " + str(totals[0]) + " tests on " + str(workers) + " workers in " +
+          "%.2fs" % (time.perf_counter() - start) + ": " + str(totals[1]) + " failures, " + str(totals[2]) +
+          " errors, " + str(totals[3]) + " skipped")
+    return totals[1] == 0 and totals[2] == 0
+
+
+if __name__ == '__main__':
+    sys.exit(0 if runParallel(workers=int(sys.argv[1]) if len(sys.argv) > 1 else None) else 1)
@@ -1,10 +1,27 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import asyncio
 import unittest
+from contextlib import redirect_stdout
+from psycopg2 import errors
 import Solution
+import AsyncSolution
+import Utility.DBConnector as Connector
 from Utility.ReturnValue import ReturnValue
+from Utility.Exceptions import DatabaseException
+from Utility import QueryStats, Tracing
+from Utility.EntityCache import EntityCache
 from hw2_winter22.abstractTest import AbstractTest
 from Business.Match import Match
 from Business.Stadium import Stadium
 from Business.Player import Player
+from Business.MatchBatch import MatchBatch
+from Business.PlayerBatch import PlayerBatch
+from Business.StadiumBatch import StadiumBatch
 
 '''
     Simple test, create one of your own
@@ -44,6 +61,589 @@ class Test(AbstractTest):
         self.assertEqual(ReturnValue.ALREADY_EXISTS, Solution.addStadium(Stadium(1, 5000, 1)), "ID 1 already exists")
         self.assertEqual(ReturnValue.BAD_PARAMS, Solution.addStadium(Stadium(2, 5000, 3)), "teamID 3 not exists")
 
+    def test_Config(self) -> None:
+        settings = Connector.getSettings()
+        self.assertIs(settings, Connector.getSettings(), "database.ini should only be read once")
+        os.environ["PGHOST"] = "db.example.com"
+        try:
+            self.assertEqual("db.example.com", Connector.reloadConfig().host, "PGHOST should override database.ini")
+        finally:
+            del os.environ["PGHOST"]
+            Connector.reloadConfig()
+        self.assertEqual(settings, Connector.getSettings(), "reload should read the same file again")
+        self.assertEqual(ReturnValue.OK, Solution.addTeam(1), "Should work after a reload")
+
+    def test_PreparedStatements(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.addTeam(1), "Should work")
+        self.assertEqual(ReturnValue.OK, Solution.addPlayer(Player(1, 1, 20, 185, "Left")), "Should work")
+        self.assertEqual(ReturnValue.ALREADY_EXISTS, Solution.addPlayer(Player(1, 1, 20, 185, "Left")), "ID 1 already exists")
+        self.assertEqual(ReturnValue.BAD_PARAMS, Solution.addPlayer(Player(2, 1, 20, 185, "Both")), "Bad foot")
+        for _ in range(2):
+            player = Solution.getPlayerProfile(1)
+            self.assertEqual([1, 1, 20, 185, "Left"], [player.getPlayerID(), player.getTeamID(), player.getAge(),
+                                                       player.getHeight(), player.getFoot()])
+        self.assertIsNone(Solution.getPlayerProfile(2).getPlayerID(), "Player 2 does not exist")
+        with Connector.DBConnector() as conn:
+            self.assertIn("get_player", conn.connection.prepared, "Statement should stay prepared on the connection")
+
+    def test_PreparedRecovery(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.addTeam(1))
+        self.assertEqual(ReturnValue.OK, Solution.addPlayer(Player(1, 1, 20, 185, "Left")))
+        self.assertEqual(1, Solution.getPlayerProfile(1).getPlayerID())
+        with Connector.DBConnector() as conn:
+            conn.execute("DEALLOCATE get_player")
+            self.assertRaises(errors.InvalidSqlStatementName, conn.executePrepared, "get_player", (1,))
+            self.assertNotIn("get_player", conn.connection.prepared, "Prepared again on the next call")
+            self.assertIn("add_player", conn.connection.prepared, "The others are still on the server")
+            # forgotten here but still on the server: PREPARE fails with duplicate_prepared_statement
+            conn.connection.prepared.clear()
+        self.assertEqual(ReturnValue.OK, Solution.addPlayer(Player(2, 1, 20, 185, "Left")))
+        self.assertEqual(1, Solution.getPlayerProfile(1).getPlayerID())
+        self.assertEqual(ReturnValue.OK, Solution.addTeam(2), "Inside a transaction it goes on too")
+
+    def test_BulkAdd(self) -> None:
+        self.assertEqual([ReturnValue.OK, ReturnValue.OK, ReturnValue.ALREADY_EXISTS, ReturnValue.BAD_PARAMS],
+                         Solution.addTeams([1, 2, 1, 0]))
+        self.assertEqual([ReturnValue.OK, ReturnValue.BAD_PARAMS, ReturnValue.BAD_PARAMS, ReturnValue.ALREADY_EXISTS],
+                         Solution.addMatches([Match(1, "Domestic", 1, 2), Match(2, "Domestic", 1, 1),
+                                              Match(3, "Domestic", 1, 3), Match(1, "International", 2, 1)]))
+        self.assertEqual([ReturnValue.OK, ReturnValue.BAD_PARAMS, ReturnValue.OK, ReturnValue.BAD_PARAMS],
+                         Solution.addPlayers([Player(1, 1, 20, 185, "Left"), Player(2, 1, 20, 185, "Both"),
+                                              Player(3, 2, 20, 185, "Right"), Player(None, 1, 20, 185, "Left")]))
+        self.assertEqual([ReturnValue.OK, ReturnValue.ALREADY_EXISTS, ReturnValue.OK],
+                         Solution.addStadiums([Stadium(1, 55000, 1), Stadium(2, 5000, 1), Stadium(3, 5000, None)]))
+        self.assertEqual([], Solution.addTeams([]))
+        with redirect_stdout(io.StringIO()):
+            # not an integrity error: the same ReturnValue from the bulk function as from the single row one
+            self.assertEqual([Solution.addTeam("x"), Solution.addPlayer(Player(4, 1, "x", 185, "Left"))],
+                             Solution.addTeams(["x"]) + Solution.addPlayers([Player(4, 1, "x", 185, "Left")]))
+        self.assertEqual(3, Solution.getPlayerProfile(3).getPlayerID(), "Rows after a rejected row are kept")
+
+    def test_BulkEvents(self) -> None:
+        Solution.addTeams([1, 2])
+        Solution.addMatches([Match(1, "Domestic", 1, 2), Match(2, "Domestic", 2, 1)])
+        Solution.addPlayers([Player(1, 1, 20, 185, "Left"), Player(2, 2, 20, 185, "Left")])
+        Solution.addStadiums([Stadium(1, 55000, 1)])
+        m1, m2, m3 = Match(1), Match(2), Match(3)
+        p1, p2, p3 = Player(1), Player(2), Player(3)
+        self.assertEqual([ReturnValue.OK, ReturnValue.OK, ReturnValue.ALREADY_EXISTS, ReturnValue.NOT_EXISTS,
+                          ReturnValue.NOT_EXISTS, ReturnValue.BAD_PARAMS],
+                         Solution.playersScoredInMatches([(m1, p1, 2), (m1, p2, 1), (m1, p1, 3), (m3, p1, 1),
+                                                          (m2, p3, 1), (m2, p2, -1)]))
+        self.assertEqual([ReturnValue.OK, ReturnValue.ALREADY_EXISTS, ReturnValue.NOT_EXISTS, ReturnValue.BAD_PARAMS],
+                         Solution.matchesInStadiums([(m1, Stadium(1), 40000), (m1, Stadium(1), 1000),
+                                                     (m2, Stadium(2), 1000), (m2, Stadium(1), -5)]))
+        self.assertEqual(2 + 1, Solution.stadiumTotalGoals(1), "Goals of match 1 count for stadium 1")
+
+    def test_MultiGet(self) -> None:
+        Solution.addTeams([1, 2])
+        Solution.addPlayers([Player(1, 1, 20, 185, "Left"), Player(2, 2, 25, 190, "Right")])
+        players = Solution.getPlayerProfiles([2, 1, 3, 2])
+        self.assertEqual({1, 2, 3}, set(players.keys()))
+        self.assertEqual((2, 2, 25, 190, "Right"), (players[2].getPlayerID(), players[2].getTeamID(),
+                                                    players[2].getAge(), players[2].getHeight(), players[2].getFoot()))
+        self.assertIsNone(players[3].getPlayerID(), "Missing IDs map to badPlayer()")
+        self.assertEqual({}, Solution.getMatchProfiles([]))
+        self.assertIsNone(Solution.getStadiumProfiles([1])[1].getStadiumID(), "Missing IDs map to badStadium()")
+
+    def test_StadiumStats(self) -> None:
+        Solution.addTeams([1, 2, 3])
+        Solution.addMatches([Match(1, "Domestic", 1, 2), Match(2, "Domestic", 2, 3), Match(3, "Domestic", 3, 1)])
+        Solution.addPlayers([Player(1, 1, 20, 185, "Left"), Player(2, 2, 20, 185, "Left")])
+        Solution.addStadiums([Stadium(1, 55000, 1), Stadium(2, 55000, 2), Stadium(3, 100, None)])
+        Solution.matchesInStadiums([(Match(1), Stadium(1), 1000), (Match(2), Stadium(1), 2000),
+                                    (Match(3), Stadium(2), 500)])
+        Solution.playersScoredInMatches([(Match(1), Player(1), 2), (Match(1), Player(2), 3), (Match(3), Player(2), 1)])
+        self.assertEqual(1500, Solution.averageAttendanceInStadium(1))
+        self.assertEqual(5, Solution.stadiumTotalGoals(1))
+        self.assertEqual([1, 2, 3], Solution.getMostAttractiveStadiums())
+        self.assertEqual([], Solution.checkStadiumStats())
+        self.assertEqual(ReturnValue.OK, Solution.deleteMatch(Match(1)), "Cascades into Scores and Attendance")
+        self.assertEqual(2000, Solution.averageAttendanceInStadium(1))
+        self.assertEqual(0, Solution.stadiumTotalGoals(1))
+        self.assertEqual(ReturnValue.OK, Solution.deletePlayer(Player(2)), "Cascades into Scores")
+        self.assertEqual(ReturnValue.OK, Solution.deleteStadium(Stadium(2)), "Cascades into Attendance")
+        self.assertEqual([1, 3], Solution.getMostAttractiveStadiums())
+        self.assertEqual([], Solution.checkStadiumStats())
+        self.assertEqual(0, Solution.averageAttendanceInStadium(3), "No attendance yet")
+        with Connector.DBConnector() as conn:
+            conn.executeScript(["UPDATE StadiumStats SET total_goals = 99 WHERE stadium_id = 1",
+                                "DELETE FROM StadiumStats WHERE stadium_id = 3"])
+        self.assertEqual([1, 3], Solution.checkStadiumStats())
+        self.assertEqual(ReturnValue.OK, Solution.rebuildStadiumStats())
+        self.assertEqual([], Solution.checkStadiumStats())
+
+    def test_Winner(self) -> None:
+        Solution.addTeams([1, 2])
+        Solution.addMatches([Match(1, "Domestic", 1, 2), Match(2, "Domestic", 2, 1)])
+        Solution.addPlayers([Player(1, 1, 20, 185, "Left"), Player(2, 2, 20, 185, "Left"), Player(3, 2, 20, 185, "Left")])
+        Solution.playersScoredInMatches([(Match(1), Player(1), 2), (Match(1), Player(2), 1), (Match(1), Player(3), 1),
+                                         (Match(2), Player(1), 1), (Match(2), Player(2), 3)])
+        self.assertTrue(Solution.playerIsWinner(1, 1), "2 of 4 goals is half")
+        self.assertFalse(Solution.playerIsWinner(2, 1))
+        self.assertFalse(Solution.playerIsWinner(1, 2), "Other matches' goals don't count")
+        self.assertTrue(Solution.playerIsWinner(2, 2))
+        self.assertFalse(Solution.playerIsWinner(3, 2), "Didn't score in match 2")
+
+    def test_Migrate(self) -> None:
+        conn = Connector.DBConnector()
+        try:
+            self.assertEqual(Solution.SCHEMA_VERSION, conn.execute("SELECT version FROM SchemaVersion")[1].rows[0][0])
+            # a database from before the version 2 indexes
+            conn.execute("DROP INDEX PlayersTeamIndex")
+            conn.execute("DROP INDEX MatchesAwayIndex")
+            conn.execute("UPDATE SchemaVersion SET version = 1")
+            self.assertEqual(ReturnValue.OK, Solution.migrate(), "Adds the missing indexes")
+            self.assertEqual(ReturnValue.OK, Solution.migrate(), "Nothing left to do")
+            indexes = conn.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND indexname LIKE '%index'")[1]
+            self.assertEqual(6, indexes.size())
+            self.assertEqual([(Solution.SCHEMA_VERSION,)], conn.execute("SELECT version FROM SchemaVersion")[1].rows)
+        finally:
+            conn.close()
+
+    def test_IndexPlans(self) -> None:
+        plans = {
+            "ScoresPlayerIndex": "SELECT * FROM Scores WHERE player_id = 1",
+            "PlayersTeamIndex": "SELECT * FROM Players WHERE team_id = 1",
+            "PlayersTallTeamIndex": "SELECT team_id FROM Players WHERE height > 190 AND team_id = 1",
+            "AttendanceStadiumIndex": "SELECT * FROM Attendance WHERE stadium_id = 1",
+            "MatchesHomeIndex": "SELECT * FROM Matches WHERE home_id = 1",
+            "MatchesAwayIndex": "SELECT * FROM Matches WHERE away_id = 1",
+        }
+        # the tables are empty, so without this the planner would scan them anyway. rolled back with the
+        # setting, inside the fixture's transaction as well as on its own
+        with Solution.transaction() as conn:
+            conn.execute("SET LOCAL enable_seqscan = off")
+            for index, query in plans.items():
+                plan = "\n".join([row[0] for row in conn.execute("EXPLAIN " + query)[1].rows])
+                self.assertIn(index.lower(), plan, query)
+            raise Connector.Rollback()
+
+    def test_Stream(self) -> None:
+        conn = Connector.DBConnector()
+        try:
+            query = "SELECT g AS id, g * 2 AS double FROM generate_series(1, 10) AS g"
+            expected = conn.execute(query)[1].rows
+            with conn.executeStream(query, itersize=3) as rows:
+                self.assertListEqual(["id", "double"], rows.cols_header)
+                self.assertListEqual(expected, list(rows))
+            rows = conn.executeStream(query, itersize=4)
+            self.assertEqual({"id": 1, "double": 2}, next(rows.dicts()))
+            rows.close()
+            self.assertEqual([(1,)], conn.execute("SELECT 1")[1].rows, "Connection usable after closing early")
+        finally:
+            conn.close()
+        Solution.addTeams([1, 2])
+        Solution.addMatches([Match(i, "Domestic", 1, 2) for i in range(1, 8)])
+        Solution.addPlayer(Player(1, 1, 20, 185, "Left"))
+        Solution.addStadium(Stadium(1, 100, None))
+        Solution.playersScoredInMatches([(Match(i), Player(1), i) for i in range(1, 8)])
+        Solution.matchesInStadiums([(Match(i), Stadium(1), 10 * i) for i in range(1, 8)])
+        self.assertListEqual([(i, 1, i) for i in range(1, 8)], list(Solution.iterScores(batchSize=2)))
+        self.assertListEqual([(i, 1, 10 * i) for i in range(1, 8)], list(Solution.iterAttendance(batchSize=7)))
+
+    def test_StreamsInTransaction(self) -> None:
+        Solution.addTeams([1, 2])
+        Solution.addMatches([Match(i, "Domestic", 1, 2) for i in range(1, 4)])
+        Solution.addPlayer(Player(1, 1, 20, 185, "Left"))
+        Solution.playersScoredInMatches([(Match(i), Player(1), i) for i in range(1, 4)])
+        with Solution.transaction():
+            # both open at once on the one connection
+            scores, again = Solution.iterScores(batchSize=1), Solution.iterScores(batchSize=1)
+            self.assertListEqual([(1, 1, 1), (1, 1, 1)], [next(scores), next(again)])
+            self.assertListEqual([(2, 1, 2), (3, 1, 3)], list(scores))
+            self.assertListEqual([(2, 1, 2), (3, 1, 3)], list(again))
+            conn = Connector.DBConnector()
+            try:
+                self.assertRaises(errors.DivisionByZero, conn.executeStream, "SELECT 1 / 0")
+                self.assertRaises(errors.UndefinedTable, conn.executeStream, "SELECT * FROM NoSuchTable")
+                self.assertEqual({"id": 1, "double": 2}, next(conn.executeStream("SELECT 1 AS id, 2 AS double").dicts()))
+            finally:
+                conn.close()
+            self.assertEqual(ReturnValue.OK, Solution.addTeam(3), "The failed streams did not abort the transaction")
+        self.assertEqual(ReturnValue.ALREADY_EXISTS, Solution.addTeam(3))
+
+    def test_Columnar(self) -> None:
+        conn = Connector.DBConnector()
+        try:
+            query = "SELECT g AS id, g / 2.0::float8 AS half, NULLIF(g % 3, 0) AS rest FROM generate_series(1, 10) AS g"
+            expected = conn.execute(query)[1]
+            columnar = conn.executeColumnar(query, itersize=3)
+            self.assertListEqual(expected.rows, columnar.rows)
+            self.assertEqual(expected.cols, columnar.cols)
+            self.assertEqual(expected[4], columnar[4])
+            self.assertEqual("array", type(columnar.column("id")).__name__)
+            self.assertEqual("array", type(columnar.column("half")).__name__)
+            self.assertListEqual([1, 2, None] * 3 + [1], columnar.column("rest"), "NULLs are kept in a list")
+            self.assertListEqual([2, 5, 8], list(columnar.where("rest", "=", 2).column("id")))
+            self.assertListEqual([9, 10], list(columnar.where("half", ">=", 4.5).column("id")))
+            self.assertTrue(conn.executeColumnar("SELECT 1 AS id WHERE false").isEmpty())
+            if Connector.numpy is not None:
+                self.assertEqual(55, columnar.to_numpy()["id"].sum())
+        finally:
+            conn.close()
+
+    def test_ResultSetRow(self) -> None:
+        conn = Connector.DBConnector()
+        try:
+            res = conn.execute("SELECT g AS id, g * 10 AS goals FROM generate_series(1, 3) AS g")[1]
+        finally:
+            conn.close()
+        row = res[1]
+        self.assertEqual(20, row["goals"])
+        self.assertEqual(20, row["GOALS"], "Case-insensitive like ResultSetDict")
+        self.assertIsNone(row[0], "Non-str keys give None like ResultSetDict")
+        self.assertEqual({"id": 2, "goals": 20}, row)
+        self.assertListEqual(["id", "goals"], list(row))
+        self.assertIn("Id", row)
+        self.assertEqual(3, res[-1]["id"])
+        self.assertRaises(KeyError, lambda: row["name"])
+        self.assertRaises(IndexError, lambda: res[3])
+        self.assertRaises(IndexError, lambda: Connector.ResultSet()[0])
+
+    def test_Batch(self) -> None:
+        Solution.addTeams([1, 2])
+        players = PlayerBatch([(1, 1, 20, 185, "Left"), (2, 1, 0, 185, "Left"), (3, 1, 20, 185, "Both"),
+                               (4, None, 20, 185, "Right"), (1, 2, 20, 185, "Right"), (5, 3, 20, 185, "Right")])
+        self.assertListEqual([False, True, True, True, False, False], players.invalid())
+        self.assertListEqual([ReturnValue.OK, ReturnValue.BAD_PARAMS, ReturnValue.BAD_PARAMS, ReturnValue.BAD_PARAMS,
+                              ReturnValue.ALREADY_EXISTS, ReturnValue.BAD_PARAMS], Solution.addPlayerBatch(players))
+        self.assertEqual(1, players.getPlayer(4).getPlayerID())
+        matches = MatchBatch()
+        matches.appendMatch(Match(1, "Domestic", 1, 2))
+        matches.append(2, "International", 1, 1)
+        matches.append(3, "Friendly", 1, 2)
+        self.assertListEqual([ReturnValue.OK, ReturnValue.BAD_PARAMS, ReturnValue.BAD_PARAMS], Solution.addMatchBatch(matches))
+        stadiums = StadiumBatch([(1, 100, None), (2, 0, None), (3, 100, 1), (4, 100, 1)])
+        self.assertListEqual([ReturnValue.OK, ReturnValue.BAD_PARAMS, ReturnValue.OK, ReturnValue.ALREADY_EXISTS],
+                             Solution.addStadiumBatch(stadiums))
+        self.assertRaises(TypeError, lambda: stadiums.append("5", 100, None))
+        self.assertEqual(4, len(stadiums), "A rejected append leaves the batch as it was")
+
+    def test_QueryStats(self) -> None:
+        self.assertEqual("SELECT * FROM Players WHERE id = ? AND preferred_foot IN (...)",
+                         QueryStats.fingerprint("SELECT  *\nFROM Players WHERE id = 12 AND preferred_foot IN ('Left', 'it''s')"))
+        stats = Connector.enableQueryStats()
+        try:
+            Solution.addTeam(1)
+            Solution.addTeam(2)
+            Solution.addTeam(1)
+            Solution.addPlayers([Player(1, 1, 20, 185, "Left"), Player(2, 1, 20, 185, "Left")])
+            Solution.getPlayerProfile(1)
+            Solution.getPlayerProfile(3)
+        finally:
+            Connector.disableQueryStats()
+        queries = stats.snapshot()["queries"]
+        insert = queries["INSERT INTO Teams(id) VALUES(...)"]
+        self.assertEqual((3, 1, 2), (insert["count"], insert["errors"], insert["rows_affected"]))
+        self.assertLessEqual(insert["min"], insert["p50"])
+        self.assertLessEqual(insert["p50"], insert["p99"])
+        self.assertLessEqual(insert["p99"], insert["max"])
+        self.assertEqual(2, queries["COPY Players(id, team_id, age, height, preferred_foot) FROM STDIN"]["rows_affected"])
+        self.assertEqual((2, 1), (queries["EXECUTE get_player(...)"]["count"], queries["EXECUTE get_player(...)"]["rows_returned"]))
+        self.assertEqual(queries, json.loads(stats.toJSON())["queries"])
+        self.assertIn('db_query_errors_total{query="INSERT INTO Teams(id) VALUES(...)"} 1', stats.toPrometheus())
+        self.assertIn('db_query_duration_seconds_count{query="EXECUTE get_player(...)"} 2', stats.toPrometheus())
+
+    def test_Tracing(self) -> None:
+        path = os.path.join(tempfile.mkdtemp(), "spans.jsonl")
+        Tracing.enableTracing(bufferSize=3, exportPath=path, batchSize=2)
+        try:
+            self.assertEqual(ReturnValue.OK, Solution.addTeam(1))
+            self.assertEqual(ReturnValue.ALREADY_EXISTS, Solution.addTeam(1))
+            Solution.addPlayers([Player(1, 1, 20, 185, "Left")])
+            self.assertEqual(1, Solution.getPlayerProfile(1).getPlayerID())
+            self.assertListEqual(["Solution.addTeam", "Solution.addPlayers", "Solution.getPlayerProfile"],
+                                 [span.name for span in Tracing.recentSpans()], "Only the last 3 are kept")
+            self.assertEqual([], list(Solution.iterScores()))
+            self.assertEqual([], list(Solution.iterAttendance()))
+            self.assertEqual("Solution.getPlayerProfile", Tracing.recentSpans()[-1].name, "Iterators are not traced")
+        finally:
+            Tracing.disableTracing()
+        Solution.addTeam(2)
+        self.assertEqual([], Tracing.recentSpans(), "Nothing kept once tracing is off")
+        requests = [json.loads(line) for line in open(path)]
+        spans = [span for request in requests for span in request["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+        self.assertEqual(2, len(requests), "Two batches of two")
+        self.assertListEqual(["Solution.addTeam", "Solution.addTeam", "Solution.addPlayers", "Solution.getPlayerProfile"],
+                             [span["name"] for span in spans])
+        attributes = [{attribute["key"]: list(attribute["value"].values())[0] for attribute in span["attributes"]}
+                      for span in spans]
+        self.assertEqual(("ALREADY_EXISTS", "DatabaseException.UNIQUE_VIOLATION"),
+                         (attributes[1]["solution.outcome"], attributes[1]["solution.exception"]))
+        self.assertEqual("Player", attributes[3]["solution.outcome"])
+        self.assertNotIn("solution.exception", attributes[0])
+        for key in ("execute", "fetch", "close", "other"):
+            self.assertGreaterEqual(attributes[3]["solution.phase." + key], 0)
+        self.assertLessEqual(int(spans[0]["startTimeUnixNano"]), int(spans[0]["endTimeUnixNano"]))
+
+    def test_ClosePlayers(self) -> None:
+        Solution.addTeams([1, 2])
+        Solution.addMatches([Match(1, "Domestic", 1, 2), Match(2, "Domestic", 2, 1), Match(3, "Domestic", 1, 2)])
+        Solution.addPlayers([Player(i, 1, 20, 185, "Left") for i in range(1, 6)])
+        Solution.playersScoredInMatches([(Match(1), Player(1), 1), (Match(2), Player(1), 1), (Match(3), Player(1), 1),
+                                         (Match(1), Player(2), 1), (Match(1), Player(3), 1), (Match(2), Player(3), 1)])
+        self.assertListEqual([2, 3], Solution.getClosePlayers(1), "Half of 3 matches rounds down to 1")
+        self.assertListEqual([1, 3], Solution.getClosePlayers(2))
+        self.assertListEqual([1, 2, 3, 5], Solution.getClosePlayers(4), "No matches, close to everyone")
+        self.assertListEqual([], Solution.getClosePlayers(6), "Doesn't exist")
+
+
+# tests whose work has to be really committed: other threads or connections look at it, or they test
+# committing, the cache or the pool themselves
+class CommitTest(AbstractTest):
+    FIXTURE = "truncate"
+
+    def test_Pool(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.addTeam(1), "Should work")
+        self.assertEqual(ReturnValue.ALREADY_EXISTS, Solution.addTeam(1), "ID 1 already exists")
+        self.assertEqual(ReturnValue.OK, Solution.addTeam(2), "Should work after a failed call")
+        stats = Connector.getPool().stats()
+        self.assertEqual(0, stats["in_use"], "Every connection should be given back")
+        self.assertGreaterEqual(stats["idle"], 1, "Connections should be kept open for reuse")
+
+    def test_Cache(self) -> None:
+        Solution.enableCache(maxSize=100, ttl=None)
+        try:
+            Solution.addTeams([1, 2])
+            Solution.addMatches([Match(1, "Domestic", 1, 2)])
+            Solution.addPlayers([Player(1, 1, 20, 185, "Left"), Player(2, 1, 20, 185, "Left")])
+            Solution.addStadiums([Stadium(1, 55000, 1)])
+            Solution.matchInStadium(Match(1), Stadium(1), 1000)
+            Solution.playerScoredInMatch(Match(1), Player(1), 3)
+            self.assertEqual(1, Solution.getPlayerProfile(1).getPlayerID())
+            self.assertEqual(1, Solution.getPlayerProfile(1).getPlayerID())
+            self.assertEqual(3, Solution.stadiumTotalGoals(1))
+            self.assertTrue(Solution.playerIsWinner(1, 1))
+            stats = Solution.cacheStats()
+            self.assertEqual(1, stats["hits"], "Second profile lookup should be a hit")
+            self.assertEqual(ReturnValue.OK, Solution.playerScoredInMatch(Match(1), Player(2), 4))
+            self.assertFalse(Solution.playerIsWinner(1, 1), "A new goal should evict the match's winners")
+            self.assertEqual(7, Solution.stadiumTotalGoals(1), "A new goal should evict the stadium totals")
+            self.assertEqual(ReturnValue.OK, Solution.deletePlayer(Player(2)))
+            self.assertIsNone(Solution.getPlayerProfile(2).getPlayerID(), "Deleted player should be evicted")
+            self.assertEqual(3, Solution.stadiumTotalGoals(1), "Cascaded Scores delete should evict the totals")
+            self.assertTrue(Solution.playerIsWinner(1, 1), "Cascaded Scores delete should evict the winners")
+            self.assertEqual(ReturnValue.OK, Solution.deleteMatch(Match(1)))
+            self.assertEqual(0, Solution.averageAttendanceInStadium(1), "Cascaded Attendance delete should evict")
+            # attendance rows but no known attendance: the average is None, which is cached like any value
+            Solution.addMatches([Match(2, "Domestic", 1, 2)])
+            self.assertEqual(ReturnValue.OK, Solution.matchInStadium(Match(2), Stadium(1), None))
+            hits = Solution.cacheStats()["hits"]
+            self.assertIsNone(Solution.averageAttendanceInStadium(1))
+            self.assertIsNone(Solution.averageAttendanceInStadium(1))
+            self.assertEqual(hits + 1, Solution.cacheStats()["hits"], "A cached None should be a hit")
+        finally:
+            Solution.disableCache()
+
+    def test_CacheInvalidatedWhileLoading(self) -> None:
+        # a reader queried the player, then a writer deletes it before the reader puts the row it got
+        class RacingCache(EntityCache):
+            def put(self, key, value, generation=None):
+                if key == ("player", 1):
+                    writer = threading.Thread(target=Solution.deletePlayer, args=(Player(1),))
+                    writer.start()
+                    writer.join()
+                super().put(key, value, generation)
+
+        Solution.addTeam(1)
+        Solution.addPlayer(Player(1, 1, 20, 185, "Left"))
+        Solution._cache = RacingCache(maxSize=100, ttl=None)
+        try:
+            self.assertEqual(1, Solution.getPlayerProfile(1).getPlayerID(), "The reader still gets what it read")
+            self.assertIsNone(Solution.getPlayerProfile(1).getPlayerID(), "The deleted row should not be cached")
+            self.assertEqual(0, Solution.cacheStats()["hits"])
+        finally:
+            Solution.disableCache()
+
+    def test_Async(self) -> None:
+        async def run():
+            self.assertListEqual([ReturnValue.OK, ReturnValue.OK, ReturnValue.BAD_PARAMS],
+                                 await asyncio.gather(*[AsyncSolution.addTeam(teamID) for teamID in (1, 2, -1)]))
+            self.assertEqual(ReturnValue.ALREADY_EXISTS, await AsyncSolution.addTeam(1))
+            await asyncio.gather(*[AsyncSolution.addPlayer(Player(i, 1, 20, 185, "Left")) for i in range(1, 21)])
+            profiles = await asyncio.gather(*[AsyncSolution.getPlayerProfile(i) for i in range(1, 22)])
+            self.assertListEqual(list(range(1, 21)) + [None], [player.getPlayerID() for player in profiles])
+            self.assertListEqual(list(range(2, 12)), await AsyncSolution.getClosePlayers(1))
+            await AsyncSolution.shutdown()
+
+        asyncio.run(run())
+
+    def test_ExecuteScript(self) -> None:
+        with Connector.DBConnector() as conn:
+            rows, res = conn.executeScript(["INSERT INTO Teams VALUES(1)", "INSERT INTO Teams VALUES(2)",
+                                            "SELECT COUNT(*) FROM Teams"])
+            self.assertEqual(1, rows)
+            self.assertEqual([(2,)], res.rows)
+            with self.assertRaises(DatabaseException.UNIQUE_VIOLATION):
+                conn.executeScript(["INSERT INTO Teams VALUES(3)", "INSERT INTO Teams VALUES(1)"])
+            conn.rollback()
+            self.assertEqual([(2,)], conn.execute("SELECT COUNT(*) FROM Teams")[1].rows, "Nothing of the script kept")
+            self.assertEqual((0, []), (conn.executeScript([])[0], conn.executeScript([])[1].rows))
+        # building the schema again fails as a whole and leaves the existing one alone
+        with redirect_stdout(io.StringIO()):
+            Solution.createTables()
+        self.assertEqual(ReturnValue.OK, Solution.addPlayer(Player(1, 1, 20, 185, "Left")))
+        Solution.dropTables()
+        Solution.dropTables()
+        Solution.createTables()
+        self.assertEqual(ReturnValue.OK, Solution.addTeam(1))
+
+    def test_Transaction(self) -> None:
+        Solution.addTeams([1, 2])
+        with Solution.transaction():
+            self.assertEqual(ReturnValue.OK, Solution.addMatch(Match(1, "Domestic", 1, 2)))
+            self.assertEqual(ReturnValue.ALREADY_EXISTS, Solution.addMatch(Match(1, "Domestic", 1, 2)))
+            self.assertEqual(ReturnValue.OK, Solution.addPlayer(Player(1, 1, 20, 185, "Left")))
+            self.assertEqual(ReturnValue.OK, Solution.playerScoredInMatch(Match(1), Player(1), 2))
+            self.assertEqual(ReturnValue.NOT_EXISTS, Solution.playerScoredInMatch(Match(2), Player(1), 2))
+            self.assertEqual(1, Solution.getPlayerProfile(1).getPlayerID(), "Sees its own writes")
+            # another connection doesn't see them before the commit
+            other = Connector.DBConnector.connect()
+            try:
+                cursor = other.cursor()
+                cursor.execute("SELECT COUNT(*) FROM Scores")
+                self.assertEqual((0,), cursor.fetchone())
+            finally:
+                other.close()
+        self.assertTrue(Solution.playerIsWinner(1, 1), "Committed once the block ended")
+        with self.assertRaises(ValueError):
+            with Solution.transaction():
+                Solution.addPlayer(Player(2, 1, 20, 185, "Left"))
+                raise ValueError()
+        self.assertIsNone(Solution.getPlayerProfile(2).getPlayerID(), "Rolled back")
+        with Solution.transaction():
+            self.assertEqual(ReturnValue.OK, Solution.addTeam(3))
+            with Connector.DBConnector() as conn:
+                self.assertRaises(DatabaseException.UNKNOWN_ERROR, conn.rollback)
+            self.assertEqual(ReturnValue.OK, Solution.addTeam(4), "The transaction goes on")
+        with Connector.DBConnector() as conn:
+            self.assertEqual([(3,), (4,)], conn.execute("SELECT id FROM Teams WHERE id > 2 ORDER BY id")[1].rows)
+        self.assertEqual(0, Connector.getPool().stats()["in_use"])
+
+    def test_Schema(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.addTeam(1))
+        previous = os.environ.get("PGSCHEMA")
+        schema = "test_schema_" + str(os.getpid())
+        os.environ["PGSCHEMA"] = schema.upper()
+        try:
+            self.assertEqual(schema, Connector.reloadConfig().schema, "Folded like an unquoted name")
+            Solution.createTables()
+            self.assertEqual(ReturnValue.OK, Solution.addTeam(2))
+            with Connector.DBConnector() as conn:
+                self.assertEqual([(schema, 1)], conn.execute("SELECT current_schema(), COUNT(*) FROM Teams")[1].rows)
+            Solution.dropTables()
+        finally:
+            if previous is None:
+                del os.environ["PGSCHEMA"]
+            else:
+                os.environ["PGSCHEMA"] = previous
+            Connector.reloadConfig()
+            with Connector.DBConnector() as conn:
+                conn.execute("DROP SCHEMA IF EXISTS " + schema + " CASCADE")
+        with Connector.DBConnector() as conn:
+            self.assertEqual([(1,)], conn.execute("SELECT id FROM Teams")[1].rows, "The other schema is untouched")
+        os.environ["PGSCHEMA"] = "bad name"
+        try:
+            self.assertRaises(DatabaseException.database_ini_ERROR, Connector.reloadConfig)
+        finally:
+            if previous is None:
+                del os.environ["PGSCHEMA"]
+            else:
+                os.environ["PGSCHEMA"] = previous
+
+    def test_Unreachable(self) -> None:
+        previous = os.environ.get("PGPORT")
+        os.environ["PGPORT"] = "1"  # nothing listens there
+        Connector.reloadConfig()
+        Connector.configureBreaker(failureThreshold=2, resetTimeout=60.0)
+        try:
+            with redirect_stdout(io.StringIO()):
+                self.assertEqual(ReturnValue.ERROR, Solution.addTeam(1))
+                self.assertEqual("closed", Connector.getBreaker().state())
+                self.assertEqual(ReturnValue.ERROR, Solution.deletePlayer(Player(1)))
+                self.assertEqual("open", Connector.getBreaker().state())
+                # failing fast now, with every function's own result for an error
+                self.assertIsNone(Solution.getPlayerProfile(1).getPlayerID())
+                self.assertEqual([], Solution.getClosePlayers(1))
+                self.assertEqual(-1, Solution.stadiumTotalGoals(1))
+                self.assertEqual(ReturnValue.ERROR, Solution.playerScoredInMatch(Match(1), Player(1), 1))
+                Solution.clearTables()
+        finally:
+            if previous is None:
+                del os.environ["PGPORT"]
+            else:
+                os.environ["PGPORT"] = previous
+            Connector.reloadConfig()
+        self.assertEqual("closed", Connector.getBreaker().state(), "New settings get a fresh chance")
+        self.assertEqual(ReturnValue.OK, Solution.addTeam(1))
+        Connector.configureBreaker()
+
+    def test_BreakerPoolTimeout(self) -> None:
+        Connector.configurePool(maxSize=1, checkoutTimeout=0.05)
+        Connector.configureBreaker(failureThreshold=1, resetTimeout=0.05)
+        held = Connector.DBConnector()
+        try:
+            Connector.getBreaker().failure()
+            self.assertEqual("open", Connector.getBreaker().state())
+            time.sleep(0.06)
+            self.assertEqual("half-open", Connector.getBreaker().state())
+            # the probe times out waiting for the held connection, it never reached the database
+            self.assertEqual(ReturnValue.ERROR, Solution.addTeam(1))
+            self.assertEqual("half-open", Connector.getBreaker().state(), "A pool timeout doesn't close the breaker")
+            held.close()
+            self.assertEqual(ReturnValue.OK, Solution.addTeam(1))
+            self.assertEqual("closed", Connector.getBreaker().state())
+        finally:
+            held.close()
+            Connector.configureBreaker()
+            Connector.configurePool()
+
+
+class ConcurrencyTest(AbstractTest):
+    FIXTURE = "truncate"
+    THREADS = 32
+
+    def test_StressAddAndScore(self) -> None:
+        players = 20 * self.THREADS
+        Solution.addTeams([1, 2])
+        Solution.addMatches([Match(i, "Domestic", 1, 2) for i in range(1, 11)])
+        # every player added twice, by different threads
+        results = Solution.runMany(Solution.addPlayer, [(Player(i % players + 1, 1, 20, 185, "Left"),)
+                                                        for i in range(2 * players)], maxWorkers=self.THREADS)
+        self.assertEqual(players, results.count(ReturnValue.OK))
+        self.assertEqual(players, results.count(ReturnValue.ALREADY_EXISTS))
+        results = Solution.runMany(Solution.playerScoredInMatch,
+                                   [(Match(i % 10 + 1), Player(i + 1), 1) for i in range(players)] +
+                                   [(Match(1), Player(players + 1), 1)], maxWorkers=self.THREADS)
+        self.assertListEqual([ReturnValue.OK] * players + [ReturnValue.NOT_EXISTS], results)
+        with Connector.DBConnector() as conn:
+            self.assertEqual([(players, players)], conn.execute("SELECT COUNT(*), SUM(goals) FROM Scores")[1].rows)
+        stats = Connector.getPool().stats()
+        self.assertEqual(0, stats["in_use"], "No connection left checked out")
+        self.assertLessEqual(stats["opened"], stats["max_size"])
+
+    def test_AttendanceAndGoalsAtOnce(self) -> None:
+        Solution.addTeams([1, 2])
+        Solution.addMatches([Match(1, "Domestic", 1, 2)])
+        Solution.addPlayers([Player(1, 1, 20, 185, "Left")])
+        Solution.addStadiums([Stadium(1, 55000, 1)])
+        first, second = Connector.DBConnector.connect(), Connector.DBConnector.connect()
+        try:
+            # neither sees the other's row before it commits, the second waits for the match's lock
+            first.cursor().execute("INSERT INTO Attendance(match_id, stadium_id, attendance) VALUES(1, 1, 1000)")
+            scorer = threading.Thread(target=lambda: (
+                second.cursor().execute("INSERT INTO Scores(match_id, player_id, goals) VALUES(1, 1, 3)"),
+                second.commit()))
+            scorer.start()
+            scorer.join(0.2)
+            first.commit()
+            scorer.join()
+        finally:
+            first.close()
+            second.close()
+        self.assertEqual([], Solution.checkStadiumStats())
+        self.assertEqual(3, Solution.stadiumTotalGoals(1))
 
 # *** DO NOT RUN EACH TEST MANUALLY ***
 if __name__ == '__main__':
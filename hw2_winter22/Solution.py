@@ -1,884 +1,976 @@
-from typing import List
+import collections.abc
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Iterable, Iterator, Tuple, Callable, NamedTuple
 import Utility.DBConnector as Connector
 from Utility.ReturnValue import ReturnValue
 from Utility.Exceptions import DatabaseException
+from Utility.EntityCache import EntityCache
+from Utility import Tracing
 from Business.Match import Match
 from Business.Player import Player
 from Business.Stadium import Stadium
+from Business.Batch import Batch
+from Business.MatchBatch import MatchBatch
+from Business.PlayerBatch import PlayerBatch
+from Business.StadiumBatch import StadiumBatch
 from psycopg2 import sql
 
+# optional read-through cache in front of the profile getters and the per stadium / per match aggregates.
+# keys are ("match", id), ("player", id), ("stadium", id), ("attendance", stadium id),
+# ("stadium_goals", stadium id) and ("winner", match id, player id). off until enableCache() is called
+_cache = None
 
-def createTables():
-    conn = None
 
-    try:
-        conn = Connector.DBConnector()
-        conn.execute("CREATE TABLE Teams(id integer PRIMARY KEY, CHECK(id>0))")
-        conn.execute(
-            "CREATE TABLE Matches(id integer PRIMARY KEY NOT NULL CHECK(id>0), competition TEXT NOT NULL CHECK(competition = 'International' OR competition = 'Domestic' ), home_id integer NOT NULL CHECK(home_id>0), away_id integer NOT NULL CHECK(away_id>0 AND away_id != home_id), FOREIGN KEY (home_id) REFERENCES Teams(id) ON DELETE CASCADE, FOREIGN KEY (away_id) REFERENCES Teams(id) ON DELETE CASCADE)")
-        conn.execute(
-            "CREATE TABLE Players(id integer PRIMARY KEY NOT NULL CHECK(id>0), team_id integer NOT NULL CHECK(team_id>0), age integer NOT NULL CHECK(age>0), height integer NOT NULL CHECK(height>0), preferred_foot TEXT NOT NULL CHECK(preferred_foot = 'Left' OR preferred_foot = 'Right'),FOREIGN KEY (team_id) REFERENCES Teams(id) ON DELETE CASCADE)")
-        conn.execute(
-            "CREATE TABLE Stadiums(id integer PRIMARY KEY NOT NULL CHECK(id>0), capacity integer NOT NULL CHECK(capacity>0), belong_to integer UNIQUE, FOREIGN KEY (belong_to) REFERENCES Teams(id) ON DELETE CASCADE)")
-        conn.execute(
-            "CREATE TABLE Scores(match_id integer, player_id integer, goals integer CHECK(goals>=0),PRIMARY KEY(match_id, player_id), FOREIGN KEY (match_id) REFERENCES Matches(id) ON DELETE CASCADE, FOREIGN KEY (player_id) REFERENCES Players(id) ON DELETE CASCADE)")
-        conn.execute(
-            "CREATE TABLE Attendance(match_id integer UNIQUE, stadium_id integer, attendance integer CHECK(attendance>=0),PRIMARY KEY(match_id),  FOREIGN KEY (match_id) REFERENCES Matches(id) ON DELETE CASCADE, FOREIGN KEY (stadium_id) REFERENCES Stadiums(id) ON DELETE CASCADE)")
-        conn.execute("CREATE VIEW AverageAttendance AS SELECT stadium_id, AVG(attendance) FROM Attendance GROUP BY stadium_id")
-        # Scores JOIN Matches by match_id JOIN stadiums by belong_to
-        conn.execute("CREATE VIEW TotalStadiumGoals AS  SELECT Attendance.stadium_id as s_id ,COALESCE(sum(Scores.goals), 0) as total_goals FROM Attendance LEFT JOIN Scores ON Attendance.match_id=Scores.match_id GROUP BY Attendance.stadium_id")
-        conn.execute("CREATE VIEW TotalStadiumGoalsIncludingZeros AS SELECT stadiums.id as stad_id,COALESCE(total_goals, 0) as total_goals FROM stadiums LEFT JOIN TotalStadiumGoals ON stadiums.id=TotalStadiumGoals.s_id")
-        conn.execute("CREATE VIEW TotalMatchGoals AS SELECT match_id as m_id, SUM(goals) as sum_goals FROM Scores GROUP BY match_id")
-        conn.execute("CREATE VIEW Winners AS SELECT Scores.match_id, Scores.player_id FROM Scores WHERE Scores.goals >= 0.5 *(SELECT sum(sum_goals) FROM TotalMatchGoals WHERE TotalMatchGoals.m_id = Scores.match_id)")
-        conn.execute(
-            "CREATE VIEW ActiveTeams AS SELECT Matches.home_id as id FROM Matches UNION SELECT Matches.away_id as id FROM Matches")
-        conn.execute(
-            "CREATE VIEW ActiveTallTeams AS SELECT team_id, count(team_id) as total FROM players JOIN activeteams ON players.team_id = activeteams.id WHERE players.height>190 GROUP BY team_id")
-        conn.execute(
-            "CREATE VIEW RichTeams AS SELECT belong_to FROM Stadiums WHERE capacity > 55000")
-        conn.execute(
-            "CREATE VIEW ActiveTallRichTeams AS SELECT team_id, total FROM ActiveTallTeams JOIN RichTeams ON ActiveTallTeams.team_id = RichTeams.belong_to ")
-        conn.execute("CREATE VIEW AttendanceTeams AS SELECT home_id, attendance FROM Attendance JOIN Matches ON Attendance.match_id = Matches.id")
-        conn.execute("CREATE VIEW BadTeams AS Select Matches.home_id as team_id FROM Matches LEFT OUTER JOIN Attendance ON Matches.id = Attendance.match_id WHERE Attendance.Attendance is NULL OR Attendance.Attendance <= 40000")
-        conn.execute("CREATE VIEW PopularTeams AS SELECT teams.id as team_id FROM Teams EXCEPT SELECT team_id FROM BadTeams")
-        conn.execute("CREATE VIEW PlayerGoals AS SELECT players.id as player_id, players.team_id, COALESCE(sum(scores.goals),0) as goals FROM players LEFT JOIN scores ON scores.player_id=players.id GROUP BY players.id, players.team_id")
-        conn.execute("CREATE VIEW PlayersMatches AS select players.id as player_id, COALESCE(scores.match_id, 0) as match_id, COALESCE(scores.goals,0) as goals from players left join scores on scores.player_id=players.id")
-        conn.execute("CREATE VIEW SameMatchesByPlayer AS select A.player_id, count(A.player_id), B.player_id as b_player_id from PlayersMatches A, PlayersMatches B where A.match_id=B.match_id group by A.player_id, B.player_id")
-        conn.execute("CREATE VIEW NoMatchesPlayers AS select A.player_id, count(A.player_id), B.player_id as b_player_id from PlayersMatches A, PlayersMatches B where B.match_id=0 group by A.player_id, B.player_id")
-        conn.execute("CREATE VIEW AllMatchesPlayers AS select * from NoMatchesPlayers union select * from SameMatchesByPlayer")
+def enableCache(maxSize=10000, ttl=60.0):
+    global _cache
+    _cache = EntityCache(maxSize, ttl)
 
 
-    except DatabaseException.ConnectionInvalid as e:
-        print(e)
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        print(e)
-    except DatabaseException.CHECK_VIOLATION as e:
-        print(e)
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        print(e)
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        print(e)
-    except Exception as e:
-        print(e)
-    finally:
-        # will happen any way after try termination or exception handling
-        conn.close()
+def disableCache():
+    global _cache
+    _cache = None
 
-def clearTables():
+
+# hit/miss/eviction counters of the cache, empty while it is disabled
+def cacheStats() -> dict:
+    cache = _cache
+    return cache.stats() if cache is not None else {}
+
+
+# inside transaction() the cache is skipped: it holds committed data only, and the transaction must see its
+# own writes. the invalidations are done right away and again once it ends, in case another thread
+# cached the old value meanwhile
+_transactionState = threading.local()
+
+
+def _inTransaction() -> bool:
+    return getattr(_transactionState, "invalidations", None) is not None
+
+
+# what _cacheGet returns on a miss, None is a value the aggregates cache (no attendance at all)
+_MISS = object()
+
+
+# key -> the cache's generation when _cacheGet missed it, per thread. _cachePut drops the value it loaded if a
+# write invalidated anything meanwhile, the value may be from before it. a failed load leaves its key here,
+# so the map is dropped once it is this big (a forgotten key only means the next put is skipped)
+_loading = threading.local()
+_MAX_LOADING = 1000
+
+
+def _cacheGet(key: tuple):
+    cache = _cache
+    if cache is None or _inTransaction():
+        return _MISS
+    generation = cache.generation
+    value = cache.get(key, _MISS)
+    if value is _MISS:
+        loading = getattr(_loading, "generations", None)
+        if loading is None or len(loading) >= _MAX_LOADING:
+            loading = _loading.generations = {}
+        loading[key] = generation
+    return value
+
+
+# only values read through after a _cacheGet miss are put
+def _cachePut(key: tuple, value):
+    cache = _cache
+    if cache is not None and not _inTransaction():
+        generation = getattr(_loading, "generations", {}).pop(key, None)
+        if generation is not None:
+            cache.put(key, value, generation)
+
+
+def _cacheInvalidate(*keys: tuple):
+    cache = _cache
+    if cache is not None:
+        cache.invalidate(*keys)
+        if _inTransaction():
+            _transactionState.invalidations.append(lambda: cache.invalidate(*keys))
+
+
+def _cacheInvalidateKind(kind: str, predicate=None):
+    cache = _cache
+    if cache is not None:
+        cache.invalidateKind(kind, predicate)
+        if _inTransaction():
+            _transactionState.invalidations.append(lambda: cache.invalidateKind(kind, predicate))
+
+
+def _cacheClear():
+    cache = _cache
+    if cache is not None:
+        cache.clear()
+        if _inTransaction():
+            _transactionState.invalidations.append(cache.clear)
+
+
+# several Solution calls as one unit of work, committed once:
+#     with Solution.transaction():
+#         addMatch(...)
+#         playerScoredInMatch(...)
+# every call still returns its own ReturnValue, a failed one (e.g. ALREADY_EXISTS) is undone alone and
+# the others are kept. an exception out of the block rolls everything back. see Connector.transaction
+@contextmanager
+def transaction():
+    outer = not _inTransaction()
+    if outer:
+        _transactionState.invalidations = []
+    try:
+        with Connector.transaction() as conn:
+            yield conn
+    finally:
+        if outer:
+            invalidations = _transactionState.invalidations
+            _transactionState.invalidations = None
+            for invalidate in invalidations:
+                invalidate()
+
+
+# goals changed in these matches: every stadium total may have moved and so may the winners of the matches
+def _goalsChanged(matchIDs):
+    matchIDs = set(matchIDs)
+    _cacheInvalidateKind("stadium_goals")
+    _cacheInvalidateKind("winner", lambda key: key[1] in matchIDs)
+
+
+# attendance changed in these stadiums: their averages and goal totals
+def _attendanceChanged(stadiumIDs):
+    for stadiumID in set(stadiumIDs):
+        _cacheInvalidate(("attendance", stadiumID), ("stadium_goals", stadiumID))
+
+
+# the StadiumStats triggers on Attendance and Scores, each reads the other table inside the match's row lock
+STADIUM_STATS_ON_ATTENDANCE = """
+        CREATE OR REPLACE FUNCTION StadiumStatsOnAttendance() RETURNS trigger AS $$
+        BEGIN
+            -- writers of the same match take turns: without it an Attendance row and a Scores row of one match
+            -- inserted at the same time each miss the other (neither is committed) and the goals are never counted
+            PERFORM 1 FROM Matches WHERE id = COALESCE(NEW.match_id, OLD.match_id) FOR NO KEY UPDATE;
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                UPDATE StadiumStats SET attendance_sum = attendance_sum - COALESCE(OLD.attendance, 0),
+                    attendance_count = attendance_count - (OLD.attendance IS NOT NULL)::integer,
+                    attendance_rows = attendance_rows - 1,
+                    total_goals = total_goals - (SELECT COALESCE(SUM(goals), 0) FROM Scores WHERE match_id = OLD.match_id)
+                WHERE stadium_id = OLD.stadium_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                UPDATE StadiumStats SET attendance_sum = attendance_sum + COALESCE(NEW.attendance, 0),
+                    attendance_count = attendance_count + (NEW.attendance IS NOT NULL)::integer,
+                    attendance_rows = attendance_rows + 1,
+                    total_goals = total_goals + (SELECT COALESCE(SUM(goals), 0) FROM Scores WHERE match_id = NEW.match_id)
+                WHERE stadium_id = NEW.stadium_id;
+            END IF;
+            IF TG_OP = 'DELETE' THEN
+                RETURN OLD;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql"""
+STADIUM_STATS_ON_SCORES = """
+        CREATE OR REPLACE FUNCTION StadiumStatsOnScores() RETURNS trigger AS $$
+        BEGIN
+            -- writers of the same match take turns: without it an Attendance row and a Scores row of one match
+            -- inserted at the same time each miss the other (neither is committed) and the goals are never counted
+            PERFORM 1 FROM Matches WHERE id = COALESCE(NEW.match_id, OLD.match_id) FOR NO KEY UPDATE;
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                UPDATE StadiumStats SET total_goals = total_goals - COALESCE(OLD.goals, 0)
+                WHERE stadium_id = (SELECT stadium_id FROM Attendance WHERE match_id = OLD.match_id);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                UPDATE StadiumStats SET total_goals = total_goals + COALESCE(NEW.goals, 0)
+                WHERE stadium_id = (SELECT stadium_id FROM Attendance WHERE match_id = NEW.match_id);
+            END IF;
+            IF TG_OP = 'DELETE' THEN
+                RETURN OLD;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql"""
+
+# secondary indexes and trigger fixes, by schema version. createTables builds the latest version, migrate()
+# brings an existing database up to it. every statement must be safe to run twice
+SCHEMA_MIGRATIONS = [
+    (1, [
+        # a player's matches, for getClosePlayers (a match's players come from the primary key)
+        "CREATE INDEX IF NOT EXISTS ScoresPlayerIndex ON Scores(player_id)",
+    ]),
+    (2, [
+        # mostGoalsForTeam and the PlayerGoals view
+        "CREATE INDEX IF NOT EXISTS PlayersTeamIndex ON Players(team_id)",
+        # ActiveTallTeams only looks at players taller than 190
+        "CREATE INDEX IF NOT EXISTS PlayersTallTeamIndex ON Players(team_id) WHERE height > 190",
+        # a stadium's matches, for the attendance and goal views
+        "CREATE INDEX IF NOT EXISTS AttendanceStadiumIndex ON Attendance(stadium_id)",
+        # ActiveTeams and the team side of the Matches foreign keys
+        "CREATE INDEX IF NOT EXISTS MatchesHomeIndex ON Matches(home_id)",
+        "CREATE INDEX IF NOT EXISTS MatchesAwayIndex ON Matches(away_id)",
+    ]),
+    # the StadiumStats triggers lock the match before reading the other table
+    (3, [STADIUM_STATS_ON_ATTENDANCE, STADIUM_STATS_ON_SCORES]),
+]
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+
+# runs the migrations newer than the version recorded in SchemaVersion, in one transaction (call it inside a
+# savepoint, so the lock is held until the end). returns the version the database is at
+def _migrate(conn) -> int:
+    rows, res = conn.executeScript([
+        "CREATE TABLE IF NOT EXISTS SchemaVersion(version integer NOT NULL)",
+        # one migration at a time: a concurrent migrate() waits here and then sees the new version
+        "LOCK TABLE SchemaVersion IN EXCLUSIVE MODE",
+        "SELECT COALESCE(MAX(version), 0) FROM SchemaVersion"])
+    version = res.rows[0][0]
+    statements = []
+    for migration, migrationStatements in SCHEMA_MIGRATIONS:
+        if migration > version:
+            statements += migrationStatements
+            version = migration
+    statements.append("DELETE FROM SchemaVersion")
+    statements.append(sql.SQL("INSERT INTO SchemaVersion(version) VALUES({version})").format(version=sql.Literal(version)))
+    conn.executeScript(statements)
+    return version
+
+
+# adds the indexes of newer schema versions to a database created by an older createTables. running it again
+# (or on a database createTables just built) does nothing
+def migrate() -> ReturnValue:
     conn = None
     try:
         conn = Connector.DBConnector()
-        conn.execute("DELETE FROM Teams CASCADE")
-        conn.execute("DELETE FROM Matches CASCADE")
-        conn.execute("DELETE FROM Players CASCADE")
-        conn.execute("DELETE FROM Stadiums CASCADE")
-        conn.execute("DELETE FROM Scores CASCADE")
-        conn.execute("DELETE FROM Attendance CASCADE")
-
+        with conn.savepoint():
+            _migrate(conn)
+        conn.commit()
     except DatabaseException.ConnectionInvalid as e:
-        # do stuff
-        print(e)
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        # do stuff
-        print(e)
-    except DatabaseException.CHECK_VIOLATION as e:
-        # do stuff
-        print(e)
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        # do stuff
-        print(e)
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        # do stuff
-        print(e)
+        return ReturnValue.ERROR
     except Exception as e:
         print(e)
+        return ReturnValue.ERROR
     finally:
-        # will happen any way after code try termination or exception handling
-        conn.close()
+        if conn is not None:
+            conn.close()
+    return ReturnValue.OK
+
+
+# the schema createTables builds and dropTables removes. each list is sent to the server as one script
+# (see DBConnector.executeScript) instead of a round trip and a commit per statement
+CREATE_TABLES = [
+    "CREATE TABLE Teams(id integer PRIMARY KEY, CHECK(id>0))",
+    "CREATE TABLE Matches(id integer PRIMARY KEY NOT NULL CHECK(id>0), competition TEXT NOT NULL CHECK(competition = 'International' OR competition = 'Domestic' ), home_id integer NOT NULL CHECK(home_id>0), away_id integer NOT NULL CHECK(away_id>0 AND away_id != home_id), FOREIGN KEY (home_id) REFERENCES Teams(id) ON DELETE CASCADE, FOREIGN KEY (away_id) REFERENCES Teams(id) ON DELETE CASCADE)",
+    "CREATE TABLE Players(id integer PRIMARY KEY NOT NULL CHECK(id>0), team_id integer NOT NULL CHECK(team_id>0), age integer NOT NULL CHECK(age>0), height integer NOT NULL CHECK(height>0), preferred_foot TEXT NOT NULL CHECK(preferred_foot = 'Left' OR preferred_foot = 'Right'),FOREIGN KEY (team_id) REFERENCES Teams(id) ON DELETE CASCADE)",
+    "CREATE TABLE Stadiums(id integer PRIMARY KEY NOT NULL CHECK(id>0), capacity integer NOT NULL CHECK(capacity>0), belong_to integer UNIQUE, FOREIGN KEY (belong_to) REFERENCES Teams(id) ON DELETE CASCADE)",
+    "CREATE TABLE Scores(match_id integer, player_id integer, goals integer CHECK(goals>=0),PRIMARY KEY(match_id, player_id), FOREIGN KEY (match_id) REFERENCES Matches(id) ON DELETE CASCADE, FOREIGN KEY (player_id) REFERENCES Players(id) ON DELETE CASCADE)",
+    "CREATE TABLE Attendance(match_id integer UNIQUE, stadium_id integer, attendance integer CHECK(attendance>=0),PRIMARY KEY(match_id),  FOREIGN KEY (match_id) REFERENCES Matches(id) ON DELETE CASCADE, FOREIGN KEY (stadium_id) REFERENCES Stadiums(id) ON DELETE CASCADE)",
+]
+
+CREATE_STATS_AND_VIEWS = [
+    # per stadium attendance sum/count and total goals, kept up to date by the triggers below so the
+    # stadium statistics don't have to re-aggregate Attendance and Scores (see checkStadiumStats)
+    "CREATE TABLE StadiumStats(stadium_id integer PRIMARY KEY, attendance_sum bigint NOT NULL DEFAULT 0, attendance_count integer NOT NULL DEFAULT 0, attendance_rows integer NOT NULL DEFAULT 0, total_goals bigint NOT NULL DEFAULT 0)",
+    """
+        CREATE OR REPLACE FUNCTION StadiumStatsOnStadium() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO StadiumStats(stadium_id) VALUES (NEW.id);
+            ELSE
+                DELETE FROM StadiumStats WHERE stadium_id = OLD.id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql""",
+    STADIUM_STATS_ON_ATTENDANCE,
+    STADIUM_STATS_ON_SCORES,
+    # no foreign key to Stadiums: a cascaded delete would remove the row while the Attendance delete trigger updates it
+    "CREATE TRIGGER StadiumStatsOnStadium AFTER INSERT OR DELETE ON Stadiums FOR EACH ROW EXECUTE FUNCTION StadiumStatsOnStadium()",
+    # deletes are counted BEFORE the row goes: when deleting a match cascades into both Scores and Attendance,
+    # AFTER triggers would only run once both are gone and could no longer find each other's rows
+    "CREATE TRIGGER StadiumStatsOnAttendance AFTER INSERT OR UPDATE ON Attendance FOR EACH ROW EXECUTE FUNCTION StadiumStatsOnAttendance()",
+    "CREATE TRIGGER StadiumStatsOnAttendanceDelete BEFORE DELETE ON Attendance FOR EACH ROW EXECUTE FUNCTION StadiumStatsOnAttendance()",
+    "CREATE TRIGGER StadiumStatsOnScores AFTER INSERT OR UPDATE ON Scores FOR EACH ROW EXECUTE FUNCTION StadiumStatsOnScores()",
+    "CREATE TRIGGER StadiumStatsOnScoresDelete BEFORE DELETE ON Scores FOR EACH ROW EXECUTE FUNCTION StadiumStatsOnScores()",
+    "CREATE VIEW AverageAttendance AS SELECT stadium_id, AVG(attendance) FROM Attendance GROUP BY stadium_id",
+    # Scores JOIN Matches by match_id JOIN stadiums by belong_to
+    "CREATE VIEW TotalStadiumGoals AS  SELECT Attendance.stadium_id as s_id ,COALESCE(sum(Scores.goals), 0) as total_goals FROM Attendance LEFT JOIN Scores ON Attendance.match_id=Scores.match_id GROUP BY Attendance.stadium_id",
+    "CREATE VIEW TotalStadiumGoalsIncludingZeros AS SELECT stadiums.id as stad_id,COALESCE(total_goals, 0) as total_goals FROM stadiums LEFT JOIN TotalStadiumGoals ON stadiums.id=TotalStadiumGoals.s_id",
+    "CREATE VIEW TotalMatchGoals AS SELECT match_id as m_id, SUM(goals) as sum_goals FROM Scores GROUP BY match_id",
+    # the match total is a window over the match's own Scores rows, so a filter on match_id is pushed
+    # below the window and only that match's rows (found through the primary key) are aggregated
+    "CREATE VIEW Winners AS SELECT match_id, player_id FROM (SELECT match_id, player_id, goals, SUM(goals) OVER (PARTITION BY match_id) AS match_goals FROM Scores) AS MatchScores WHERE goals >= 0.5 * match_goals",
+    "CREATE VIEW ActiveTeams AS SELECT Matches.home_id as id FROM Matches UNION SELECT Matches.away_id as id FROM Matches",
+    "CREATE VIEW ActiveTallTeams AS SELECT team_id, count(team_id) as total FROM players JOIN activeteams ON players.team_id = activeteams.id WHERE players.height>190 GROUP BY team_id",
+    "CREATE VIEW RichTeams AS SELECT belong_to FROM Stadiums WHERE capacity > 55000",
+    "CREATE VIEW ActiveTallRichTeams AS SELECT team_id, total FROM ActiveTallTeams JOIN RichTeams ON ActiveTallTeams.team_id = RichTeams.belong_to ",
+    "CREATE VIEW AttendanceTeams AS SELECT home_id, attendance FROM Attendance JOIN Matches ON Attendance.match_id = Matches.id",
+    "CREATE VIEW BadTeams AS Select Matches.home_id as team_id FROM Matches LEFT OUTER JOIN Attendance ON Matches.id = Attendance.match_id WHERE Attendance.Attendance is NULL OR Attendance.Attendance <= 40000",
+    "CREATE VIEW PopularTeams AS SELECT teams.id as team_id FROM Teams EXCEPT SELECT team_id FROM BadTeams",
+    "CREATE VIEW PlayerGoals AS SELECT players.id as player_id, players.team_id, COALESCE(sum(scores.goals),0) as goals FROM players LEFT JOIN scores ON scores.player_id=players.id GROUP BY players.id, players.team_id",
+    "CREATE VIEW PlayersMatches AS select players.id as player_id, COALESCE(scores.match_id, 0) as match_id, COALESCE(scores.goals,0) as goals from players left join scores on scores.player_id=players.id",
+    "CREATE VIEW SameMatchesByPlayer AS select A.player_id, count(A.player_id), B.player_id as b_player_id from PlayersMatches A, PlayersMatches B where A.match_id=B.match_id group by A.player_id, B.player_id",
+    "CREATE VIEW NoMatchesPlayers AS select A.player_id, count(A.player_id), B.player_id as b_player_id from PlayersMatches A, PlayersMatches B where B.match_id=0 group by A.player_id, B.player_id",
+    "CREATE VIEW AllMatchesPlayers AS select * from NoMatchesPlayers union select * from SameMatchesByPlayer",
+]
+
+# the views go with the tables (CASCADE), so every DROP must be allowed to find nothing: one failing
+# statement would undo the whole script
+DROP_SCHEMA = [
+    "DROP TABLE IF EXISTS Teams CASCADE",
+    "DROP TABLE IF EXISTS Matches CASCADE",
+    "DROP TABLE IF EXISTS Players CASCADE",
+    "DROP TABLE IF EXISTS Stadiums CASCADE",
+    "DROP TABLE IF EXISTS Scores CASCADE",
+    "DROP TABLE IF EXISTS Attendance CASCADE",
+    "DROP TABLE IF EXISTS StadiumStats CASCADE",
+    "DROP TABLE IF EXISTS SchemaVersion CASCADE",
+    "DROP FUNCTION IF EXISTS StadiumStatsOnStadium() CASCADE",
+    "DROP FUNCTION IF EXISTS StadiumStatsOnAttendance() CASCADE",
+    "DROP FUNCTION IF EXISTS StadiumStatsOnScores() CASCADE",
+    "DROP VIEW IF EXISTS AverageAttendance",
+    "DROP VIEW IF EXISTS TotalStadiumGoals",
+    "DROP VIEW IF EXISTS TotalStadiumGoalsIncludingZeros",
+    "DROP VIEW IF EXISTS TotalMatchGoals",
+    "DROP VIEW IF EXISTS Winners",
+    "DROP VIEW IF EXISTS ActiveTeams",
+    "DROP VIEW IF EXISTS ActiveTallTeams",
+    "DROP VIEW IF EXISTS RichTeams",
+    "DROP VIEW IF EXISTS ActiveTallRichTeams",
+    "DROP VIEW IF EXISTS AttendanceTeams",
+    "DROP VIEW IF EXISTS BadTeams",
+    "DROP VIEW IF EXISTS PopularTeams",
+    "DROP VIEW IF EXISTS PlayerGoals",
+    "DROP VIEW IF EXISTS PlayersMatches",
+    "DROP VIEW IF EXISTS SameMatchesByPlayer",
+    "DROP VIEW IF EXISTS NoMatchesPlayers",
+    "DROP VIEW IF EXISTS AllMatchesPlayers",
+]
+
+
+# with a schema in the settings (PGSCHEMA, or schema= in database.ini) every connection works in it through
+# its search_path, so tables, views and functions are made and dropped there with no other change.
+# createTables only has to make the schema first, dropTables leaves it (empty) behind
+def _schemaStatements() -> list:
+    schema = Connector.getSettings().schema
+    if schema is None:
+        return []
+    return [sql.SQL("CREATE SCHEMA IF NOT EXISTS {schema}").format(schema=sql.SQL(schema))]
 
 
-def dropTables():
+def createTables():
     conn = None
+    _cacheClear()
+
     try:
         conn = Connector.DBConnector()
-        conn.execute("DROP TABLE IF EXISTS Teams CASCADE")
-        conn.execute("DROP TABLE IF EXISTS Matches CASCADE")
-        conn.execute("DROP TABLE IF EXISTS Players CASCADE")
-        conn.execute("DROP TABLE IF EXISTS Stadiums CASCADE")
-        conn.execute("DROP TABLE IF EXISTS Scores CASCADE")
-        conn.execute("DROP TABLE IF EXISTS Attendance CASCADE")
-        conn.execute("DROP TABLE IF EXISTS Attendance CASCADE")
-        conn.execute(
-            "DROP VIEW AverageAttendance")
-        conn.execute(
-            "DROP VIEW TotalStadiumGoals")
-        conn.execute(
-            "DROP VIEW TotalStadiumGoalsIncludingZeros")
-        conn.execute(
-            "DROP VIEW TotalMatchGoals")
-        conn.execute(
-            "DROP VIEW Winners")
-        conn.execute(
-            "DROP VIEW ActiveTeams")
-        conn.execute(
-            "DROP VIEW ActiveTallTeams")
-        conn.execute(
-            "DROP VIEW RichTeams")
-        conn.execute(
-            "DROP VIEW ActiveTallRichTeams")
-        conn.execute(
-            "DROP VIEW AttendanceTeams")
-        conn.execute(
-            "DROP VIEW BadTeams")
-        conn.execute(
-            "DROP VIEW PopularTeams")
-        conn.execute(
-            "DROP VIEW PlayerGoals")
-        conn.execute(
-            "DROP VIEW PlayersMatches")
-        conn.execute(
-            "DROP VIEW SameMatchesByPlayer")
-        conn.execute(
-            "DROP VIEW NoMatchesPlayers")
-        conn.execute(
-            "DROP VIEW AllMatchesPlayers")
+        # everything in one transaction and a handful of round trips
+        with conn.savepoint():
+            conn.executeScript(_schemaStatements() + CREATE_TABLES)
+            _migrate(conn)
+            conn.executeScript(CREATE_STATS_AND_VIEWS)
+        conn.commit()
 
-    except DatabaseException.ConnectionInvalid as e:
-        # do stuff
-        pass
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        # do stuff
-        pass
-    except DatabaseException.CHECK_VIOLATION as e:
-        # do stuff
-        pass
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        # do stuff
-        pass
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        # do stuff
-        pass
     except Exception as e:
-        pass
+        print(e)
     finally:
-        # will happen any way after code try termination or exception handling
-        conn.close()
-
-
-def addTeam(teamID: int) -> ReturnValue:
-    r = ReturnValue.OK
+        if conn is not None:
+            conn.close()
 
+def clearTables():
     conn = None
+    _cacheClear()
     try:
         conn = Connector.DBConnector()
-        query = sql.SQL("INSERT INTO Teams(id) VALUES({id})").format(id=sql.Literal(teamID))
-        rows_effected, _ = conn.execute(query)
-    except DatabaseException.ConnectionInvalid as e:
-        r = ReturnValue.ERROR
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        r = ReturnValue.BAD_PARAMS
-    except DatabaseException.CHECK_VIOLATION as e:
-        r = ReturnValue.BAD_PARAMS
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        r = ReturnValue.ALREADY_EXISTS
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        r = ReturnValue.BAD_PARAMS
+        # one statement for all of them, StadiumStats included: TRUNCATE doesn't run the row triggers
+        conn.execute("TRUNCATE Teams, Matches, Players, Stadiums, Scores, Attendance, StadiumStats")
+
     except Exception as e:
         print(e)
     finally:
-        conn.close()
-        return r
+        if conn is not None:
+            conn.close()
 
 
-def addMatch(match: Match) -> ReturnValue:
-    m_id, competition, home_id, away_id = match.getMatchID(), match.getCompetition(), match.getHomeTeamID(), match.getAwayTeamID()
-    r = ReturnValue.OK
-
+def dropTables():
     conn = None
+    _cacheClear()
     try:
         conn = Connector.DBConnector()
-        query = sql.SQL(
-            "INSERT INTO Matches(id, competition, home_id, away_id) VALUES({m_id}, {competition}, {home_id}, {away_id})").format(
-            m_id=sql.Literal(m_id), competition=sql.Literal(competition), home_id=sql.Literal(home_id),
-            away_id=sql.Literal(away_id))
-        rows_effected, _ = conn.execute(query)
+        conn.executeScript(DROP_SCHEMA)
 
-    except DatabaseException.ConnectionInvalid as e:
-        r = ReturnValue.ERROR
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        r = ReturnValue.BAD_PARAMS
-    except DatabaseException.CHECK_VIOLATION as e:
-        r = ReturnValue.BAD_PARAMS
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        r = ReturnValue.ALREADY_EXISTS
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        r = ReturnValue.BAD_PARAMS
     except Exception as e:
-        print(e)
+        pass
     finally:
-        conn.close()
-        return r
+        if conn is not None:
+            conn.close()
 
 
-def getMatchProfile(matchID: int) -> Match:
-    conn = None
-    m = Match.badMatch()
+# every API function below is one entry of OPERATIONS, run by _run on a pooled connection:
+#   statements - {0}, {1}... are the call's parameters as literals. more than one are sent as one script, so
+#                they are committed (or fail) together. with prepared the one statement is PREPAREd under that
+#                name instead ($1, $2... placeholders, see registerStatement)
+#   errors     - the result for a DatabaseException a statement raised (or ConnectionInvalid if the database
+#                can't be reached). any other exception gives failed, or failed() if it is callable (a fresh []
+#                or bad entity every time), and is print()ed if printFailed
+#   result     - (rows_effected, ResultSet of the last statement, parameters) -> the result of a call that worked
+#   changed    - (parameters) -> drops the cache entries the statements made stale, called before result
+class Operation(NamedTuple):
+    statements: Tuple[str, ...]
+    errors: dict
+    failed: object
+    printFailed: bool
+    result: Callable
+    changed: Callable = None
+    prepared: str = None
+
+
+# the mappings the functions share. the add functions keep their OK for an unexpected error
+ADD_ERRORS = {DatabaseException.ConnectionInvalid: ReturnValue.ERROR,
+              DatabaseException.NOT_NULL_VIOLATION: ReturnValue.BAD_PARAMS,
+              DatabaseException.CHECK_VIOLATION: ReturnValue.BAD_PARAMS,
+              DatabaseException.UNIQUE_VIOLATION: ReturnValue.ALREADY_EXISTS,
+              DatabaseException.FOREIGN_KEY_VIOLATION: ReturnValue.BAD_PARAMS}
+# playerScoredInMatch and matchInStadium: a missing match, player or stadium is NOT_EXISTS
+EVENT_ERRORS = dict(ADD_ERRORS)
+EVENT_ERRORS[DatabaseException.FOREIGN_KEY_VIOLATION] = ReturnValue.NOT_EXISTS
+# everything is failed
+NO_ERRORS = {}
+
+
+def _ok(rows_effected, res, params) -> ReturnValue:
+    return ReturnValue.OK
+
+
+def _notExistsIfNone(rows_effected, res, params) -> ReturnValue:
+    return ReturnValue.NOT_EXISTS if rows_effected == 0 else ReturnValue.OK
+
+
+def _alreadyExistsIfNone(rows_effected, res, params) -> ReturnValue:
+    return ReturnValue.ALREADY_EXISTS if rows_effected == 0 else ReturnValue.OK
+
+
+def _firstColumn(rows_effected, res, params) -> list:
+    return [row[0] for row in res.rows]
+
+
+# the entity in the only row, its row is cached under (kind, id). no row raises IndexError, so failed
+def _profile(kind: str, build: Callable) -> Callable:
+    def result(rows_effected, res, params):
+        entity = build(res.rows[0])
+        _cachePut((kind, params[0]), res.rows[0])
+        return entity
+    return result
+
+
+# the first value of the only row (0 if there is none), cached under key(params)
+def _cachedValue(key: Callable) -> Callable:
+    def result(rows_effected, res, params):
+        value = 0 if rows_effected == 0 else res.rows[0][0]
+        _cachePut(key(params), value)
+        return value
+    return result
+
+
+def _isWinner(rows_effected, res, params) -> bool:
+    _cachePut(("winner", params[1], params[0]), rows_effected > 0)
+    return rows_effected > 0
+
+
+def _matchDeleted(params):
+    # ON DELETE CASCADE removed the match's Scores and Attendance rows too
+    _cacheInvalidate(("match", params[0]))
+    _goalsChanged([params[0]])
+    _cacheInvalidateKind("attendance")
+
+
+def _playerDeleted(params):
+    # ON DELETE CASCADE removed the player's Scores rows, in matches we don't know here
+    _cacheInvalidate(("player", params[0]))
+    _cacheInvalidateKind("stadium_goals")
+    _cacheInvalidateKind("winner")
+
+
+def _stadiumDeleted(params):
+    # ON DELETE CASCADE removed the stadium's Attendance rows
+    _cacheInvalidate(("stadium", params[0]))
+    _attendanceChanged([params[0]])
+
+
+OPERATIONS = {
+    "addTeam": Operation(
+        ("INSERT INTO Teams(id) VALUES({0})",), ADD_ERRORS, ReturnValue.OK, True, _ok),
+    "addMatch": Operation(
+        ("INSERT INTO Matches(id, competition, home_id, away_id) VALUES({0}, {1}, {2}, {3})",),
+        ADD_ERRORS, ReturnValue.OK, True, _ok, lambda params: _cacheInvalidate(("match", params[0]))),
+    "getMatchProfile": Operation(
+        ("SELECT id, competition, home_id, away_id FROM Matches WHERE id = $1",),
+        NO_ERRORS, Match.badMatch, False, _profile("match", Match.fromRow), prepared="get_match"),
+    "deleteMatch": Operation(
+        ("DELETE FROM Matches WHERE id = {0}",), ADD_ERRORS, ReturnValue.OK, True, _notExistsIfNone, _matchDeleted),
+    "addPlayer": Operation(
+        ("INSERT INTO Players(id, team_id, age, height, preferred_foot) VALUES($1, $2, $3, $4, $5)",),
+        ADD_ERRORS, ReturnValue.OK, True, _ok, lambda params: _cacheInvalidate(("player", params[0])),
+        prepared="add_player"),
+    "getPlayerProfile": Operation(
+        ("SELECT id, team_id, age, height, preferred_foot FROM Players WHERE id = $1",),
+        NO_ERRORS, Player.badPlayer, False, _profile("player", Player.fromRow), prepared="get_player"),
+    "deletePlayer": Operation(
+        ("DELETE FROM Players WHERE id = {0}",), NO_ERRORS, ReturnValue.ERROR, True, _notExistsIfNone,
+        _playerDeleted),
+    "addStadium": Operation(
+        ("INSERT INTO Stadiums(id, capacity, belong_to) VALUES({0}, {1}, {2})",),
+        ADD_ERRORS, ReturnValue.OK, True, _alreadyExistsIfNone,
+        lambda params: _cacheInvalidate(("stadium", params[0]))),
+    "getStadiumProfile": Operation(
+        ("SELECT id, capacity, belong_to FROM Stadiums WHERE id = $1",),
+        NO_ERRORS, Stadium.badStadium, False, _profile("stadium", Stadium.fromRow), prepared="get_stadium"),
+    "deleteStadium": Operation(
+        ("DELETE FROM Stadiums WHERE id = {0}",), NO_ERRORS, ReturnValue.ERROR, True, _notExistsIfNone,
+        _stadiumDeleted),
+    "playerScoredInMatch": Operation(
+        ("INSERT INTO Scores(match_id, player_id, goals) VALUES($1, $2, $3)",),
+        EVENT_ERRORS, ReturnValue.OK, True, _ok, lambda params: _goalsChanged([params[0]]), prepared="add_score"),
+    "playerDidntScoreInMatch": Operation(
+        ("DELETE FROM Scores WHERE match_id = {0} AND player_id = {1}",),
+        NO_ERRORS, ReturnValue.ERROR, True, _notExistsIfNone, lambda params: _goalsChanged([params[0]])),
+    "matchInStadium": Operation(
+        ("INSERT INTO Attendance(match_id, stadium_id, attendance) VALUES({0}, {1}, {2})",),
+        EVENT_ERRORS, ReturnValue.OK, True, _ok, lambda params: _attendanceChanged([params[1]])),
+    "matchNotInStadium": Operation(
+        ("DELETE FROM Attendance WHERE match_id = {0} AND stadium_id = {1}",),
+        NO_ERRORS, ReturnValue.ERROR, True, _notExistsIfNone, lambda params: _attendanceChanged([params[1]])),
+    "averageAttendanceInStadium": Operation(
+        ("SELECT CASE WHEN attendance_count > 0 THEN attendance_sum::numeric / attendance_count END AS avg "
+         "FROM StadiumStats WHERE stadium_id = {0} AND attendance_rows > 0",),
+        NO_ERRORS, -1, False, _cachedValue(lambda params: ("attendance", params[0]))),
+    "stadiumTotalGoals": Operation(
+        ("SELECT total_goals FROM StadiumStats WHERE stadium_id = {0}",),
+        NO_ERRORS, -1, False, _cachedValue(lambda params: ("stadium_goals", params[0]))),
+    # parameters (player, match)
+    "playerIsWinner": Operation(
+        ("SELECT player_id FROM Winners WHERE match_id = {1} AND player_id = {0}",),
+        NO_ERRORS, False, False, _isWinner),
+    "getActiveTallTeams": Operation(
+        ("SELECT team_id FROM ActiveTallTeams WHERE total>=2 ORDER BY team_id DESC LIMIT 5",),
+        NO_ERRORS, list, False, _firstColumn),
+    "getActiveTallRichTeams": Operation(
+        ("SELECT team_id FROM ActiveTallRichTeams WHERE total>=2 ORDER BY team_id LIMIT 5",),
+        NO_ERRORS, list, False, _firstColumn),
+    "popularTeams": Operation(
+        ("SELECT team_id FROM PopularTeams ORDER BY team_id DESC LIMIT 10",), NO_ERRORS, list, False, _firstColumn),
+    "getMostAttractiveStadiums": Operation(
+        ("SELECT stadium_id FROM StadiumStats ORDER BY total_goals DESC, stadium_id ASC",),
+        NO_ERRORS, list, False, _firstColumn),
+    "checkStadiumStats": Operation(
+        ("SELECT Stadiums.id FROM Stadiums LEFT JOIN StadiumStats ON StadiumStats.stadium_id = Stadiums.id "
+         "LEFT JOIN AverageAttendance ON AverageAttendance.stadium_id = Stadiums.id "
+         "LEFT JOIN TotalStadiumGoalsIncludingZeros ON TotalStadiumGoalsIncludingZeros.stad_id = Stadiums.id "
+         "WHERE StadiumStats.stadium_id IS NULL "
+         "OR StadiumStats.total_goals <> COALESCE(TotalStadiumGoalsIncludingZeros.total_goals, 0) "
+         "OR (AverageAttendance.stadium_id IS NULL) <> (StadiumStats.attendance_rows = 0) "
+         "OR (CASE WHEN attendance_count > 0 THEN attendance_sum::numeric / attendance_count END) IS DISTINCT FROM AverageAttendance.avg "
+         "ORDER BY Stadiums.id",),
+        NO_ERRORS, None, True, _firstColumn),
+    # one transaction, and the triggers wait for it: their updates must not land between the statements
+    "rebuildStadiumStats": Operation(
+        ("LOCK TABLE StadiumStats IN EXCLUSIVE MODE",
+         "DELETE FROM StadiumStats WHERE stadium_id NOT IN (SELECT id FROM Stadiums)",
+         "INSERT INTO StadiumStats(stadium_id) SELECT id FROM Stadiums ON CONFLICT DO NOTHING",
+         "UPDATE StadiumStats SET attendance_sum = COALESCE(a.attendance_sum, 0), attendance_count = COALESCE(a.attendance_count, 0), "
+         "attendance_rows = COALESCE(a.attendance_rows, 0), total_goals = COALESCE(a.total_goals, 0) "
+         "FROM Stadiums LEFT JOIN (SELECT Attendance.stadium_id, SUM(Attendance.attendance) AS attendance_sum, "
+         "COUNT(Attendance.attendance) AS attendance_count, COUNT(*) AS attendance_rows, "
+         "SUM((SELECT SUM(goals) FROM Scores WHERE Scores.match_id = Attendance.match_id)) AS total_goals "
+         "FROM Attendance GROUP BY Attendance.stadium_id) a ON a.stadium_id = Stadiums.id "
+         "WHERE StadiumStats.stadium_id = Stadiums.id"),
+        NO_ERRORS, ReturnValue.ERROR, True, _ok),
+    "mostGoalsForTeam": Operation(
+        ("SELECT player_id from PlayerGoals WHERE team_id={0} ORDER BY goals DESC, player_id DESC LIMIT 5",),
+        NO_ERRORS, list, False, _firstColumn),
+    # same result as the AllMatchesPlayers view, but only counts the requested player's co-appearances:
+    # a player without matches is close to every other player, otherwise the players who share
+    # at least half (rounded down) of their matches
+    "getClosePlayers": Operation(
+        ("SELECT id AS player_id FROM Players WHERE id <> {0} "
+         "AND EXISTS (SELECT 1 FROM Players WHERE id = {0}) AND NOT EXISTS (SELECT 1 FROM Scores WHERE player_id = {0}) "
+         "UNION ALL "
+         "SELECT Others.player_id FROM Scores Mine JOIN Scores Others ON Others.match_id = Mine.match_id "
+         "WHERE Mine.player_id = {0} AND Others.player_id <> {0} GROUP BY Others.player_id "
+         "HAVING COUNT(*) >= (SELECT COUNT(*) FROM Scores WHERE player_id = {0}) / 2 "
+         "ORDER BY player_id ASC LIMIT 10",),
+        NO_ERRORS, list, False, _firstColumn),
+}
+
+# the hot point lookups and inserts are PREPAREd once per pooled connection and then run with bound parameters
+for _operation in OPERATIONS.values():
+    if _operation.prepared is not None:
+        Connector.registerStatement(_operation.prepared, _operation.statements[0])
+
+
+_FAILED = object()
+
+
+# runs OPERATIONS[name] with these parameters and returns its result. never raises: an unreachable database
+# is ConnectionInvalid like any other error (and while Connector's circuit breaker is open, that is immediate)
+def _run(name: str, *params):
+    operation = OPERATIONS[name]
     try:
-        conn = Connector.DBConnector()
-        query = sql.SQL(
-            "SELECT * FROM Matches WHERE id = {id}").format(
-            id=sql.Literal(matchID))
-        rows_effected, res = conn.execute(query)
-        m = Match(res.rows[0][0], res.rows[0][1], res.rows[0][2], res.rows[0][3])
-    except DatabaseException.ConnectionInvalid as e:
-        return m
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        return m
-    except DatabaseException.CHECK_VIOLATION as e:
-        return m
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        return m
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        return m
+        with Connector.DBConnector() as conn:
+            if operation.prepared is not None:
+                rows_effected, res = conn.executePrepared(operation.prepared, params)
+            else:
+                literals = [sql.Literal(param) for param in params]
+                statements = [sql.SQL(statement).format(*literals) for statement in operation.statements]
+                if len(statements) == 1:
+                    rows_effected, res = conn.execute(statements[0])
+                else:
+                    rows_effected, res = conn.executeScript(statements)
+            if operation.changed is not None:
+                operation.changed(params)
+            return operation.result(rows_effected, res, params)
     except Exception as e:
-        return m
-    finally:
-        conn.close()
-        return m
+        result = operation.errors.get(type(e), _FAILED)
+        if result is not _FAILED:
+            return result
+        if operation.printFailed:
+            print(e)
+        return operation.failed() if callable(operation.failed) else operation.failed
+
+
+def addTeam(teamID: int) -> ReturnValue:
+    return _run("addTeam", teamID)
 
-    pass
+
+def addMatch(match: Match) -> ReturnValue:
+    return _run("addMatch", match.getMatchID(), match.getCompetition(), match.getHomeTeamID(), match.getAwayTeamID())
+
+
+def getMatchProfile(matchID: int) -> Match:
+    cached = _cacheGet(("match", matchID))
+    if cached is not _MISS:
+        return Match.fromRow(cached)
+    return _run("getMatchProfile", matchID)
 
 
 def deleteMatch(match: Match) -> ReturnValue:
-    conn = None
-    r = ReturnValue.OK
-    try:
-        conn = Connector.DBConnector()
-        query = sql.SQL(
-            "DELETE FROM Matches WHERE id = {id}").format(
-            id=sql.Literal(match.getMatchID()))
-        rows_effected, res = conn.execute(query)
-        if rows_effected == 0:
-            r = ReturnValue.NOT_EXISTS
+    return _run("deleteMatch", match.getMatchID())
 
 
-    except DatabaseException.ConnectionInvalid as e:
-        r = ReturnValue.ERROR
+def addPlayer(player: Player) -> ReturnValue:
+    return _run("addPlayer", player.getPlayerID(), player.getTeamID(), player.getAge(), player.getHeight(),
+                player.getFoot())
 
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        r = ReturnValue.BAD_PARAMS
 
-    except DatabaseException.CHECK_VIOLATION as e:
-        r = ReturnValue.BAD_PARAMS
+def getPlayerProfile(playerID: int) -> Player:
+    cached = _cacheGet(("player", playerID))
+    if cached is not _MISS:
+        return Player.fromRow(cached)
+    return _run("getPlayerProfile", playerID)
 
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        r = ReturnValue.ALREADY_EXISTS
 
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        r = ReturnValue.BAD_PARAMS
+def deletePlayer(player: Player) -> ReturnValue:
+    return _run("deletePlayer", player.getPlayerID())
 
-    except Exception as e:
 
-        print(e)
-    finally:
-        conn.close()
-        return r
-    pass
+def addStadium(stadium: Stadium) -> ReturnValue:
+    return _run("addStadium", stadium.getStadiumID(), stadium.getCapacity(), stadium.getBelongsTo())
 
 
-def addPlayer(player: Player) -> ReturnValue:
-    id, team_id, age, height, foot = player.getPlayerID(), player.getTeamID(), player.getAge(), player.getHeight(), player.getFoot()
-    r = ReturnValue.OK
-    conn = None
-    try:
-        conn = Connector.DBConnector()
-        query = sql.SQL(
-            "INSERT INTO Players(id, team_id, age, height, preferred_foot) VALUES({id}, {team_id}, {age}, {height}, {preferred_foot})").format(
-            id=sql.Literal(id), team_id=sql.Literal(team_id), age=sql.Literal(age), height=sql.Literal(height),
-            preferred_foot=sql.Literal(foot))
-        rows_effected, _ = conn.execute(query)
-    except DatabaseException.ConnectionInvalid as e:
-        r = ReturnValue.ERROR
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        r = ReturnValue.BAD_PARAMS
-    except DatabaseException.CHECK_VIOLATION as e:
-        r = ReturnValue.BAD_PARAMS
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        r = ReturnValue.ALREADY_EXISTS
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        r = ReturnValue.BAD_PARAMS
-    except Exception as e:
-        print(e)
-    finally:
-        conn.close()
-        return r
-    return r
+def getStadiumProfile(stadiumID: int) -> Stadium:
+    cached = _cacheGet(("stadium", stadiumID))
+    if cached is not _MISS:
+        return Stadium.fromRow(cached)
+    return _run("getStadiumProfile", stadiumID)
 
 
-def getPlayerProfile(playerID: int) -> Player:
-    conn = None
-    m = Player.badPlayer()
-    try:
-        conn = Connector.DBConnector()
-        query = sql.SQL(
-            "SELECT * FROM Players WHERE id = {id}").format(
-            id=sql.Literal(playerID))
-        rows_effected, res = conn.execute(query)
-        m = Player(res.rows[0][0], res.rows[0][1], res.rows[0][2], res.rows[0][3], res.rows[0][4])
-    except DatabaseException.ConnectionInvalid as e:
-        return m
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        return m
-    except DatabaseException.CHECK_VIOLATION as e:
-        return m
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        return m
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        return m
-    except Exception as e:
-        return m
-    finally:
-        conn.close()
-        return m
-    return m
-    pass
+def deleteStadium(stadium: Stadium) -> ReturnValue:
+    return _run("deleteStadium", stadium.getStadiumID())
 
 
+# rows per COPY in the bulk add functions, a rejected row only makes its own chunk fall back to smaller COPYs
+BULK_CHUNK_SIZE = 5000
 
-def deletePlayer(player: Player) -> ReturnValue:
-    conn = None
-    r = ReturnValue.OK
-    try:
-        conn = Connector.DBConnector()
-        query = sql.SQL(
-            "DELETE FROM Players WHERE id = {id}").format(
-            id=sql.Literal(player.getPlayerID()))
-        rows_effected, res = conn.execute(query)
-        if rows_effected == 0:
-            r = ReturnValue.NOT_EXISTS
 
-    except DatabaseException.ConnectionInvalid as e:
-        print(e)
-        r = ReturnValue.ERROR
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        print(e)
-        r = ReturnValue.ERROR
-    except DatabaseException.CHECK_VIOLATION as e:
+# the ReturnValue the single row function gives for a row the database rejected, from the same errors table
+# (ADD_ERRORS or EVENT_ERRORS): anything not in it is printed and OK, like addTeam does
+def _rejectedRow(e: Exception, errors: dict) -> ReturnValue:
+    result = errors.get(type(e), _FAILED)
+    if result is _FAILED:
         print(e)
-        r = ReturnValue.ERROR
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        print(e)
-        r = ReturnValue.ERROR
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        print(e)
-        r = ReturnValue.ERROR
-    except Exception as e:
-        print(e)
-        r = ReturnValue.ERROR
-    finally:
-        conn.close()
-        return r
-    pass
+        return ReturnValue.OK
+    return result
 
 
-def addStadium(stadium: Stadium) -> ReturnValue:
-    id, capacity, belong_to = stadium.getStadiumID(), stadium.getCapacity(), stadium.getBelongsTo()
-    conn = None
-    r = ReturnValue.OK
+# COPYs rows[start:end] under a savepoint. if the database rejects the chunk it is split in half and
+# retried, so in the end every bad row fails on its own and the good ones are kept, in input order.
+# with lines=True the rows are COPY text lines already
+def _copyChunk(conn, table: str, columns: List[str], rows: list, start: int, end: int, results: list,
+               errors: dict, lines=False):
     try:
-        conn = Connector.DBConnector()
-        query = sql.SQL(
-            "INSERT INTO Stadiums(id, capacity, belong_to) VALUES({id}, {capacity}, {belong_to})").format(
-            id=sql.Literal(id), capacity=sql.Literal(capacity), belong_to=sql.Literal(belong_to))
-        rows_effected, _ = conn.execute(query)
-        if rows_effected == 0:
-            r = ReturnValue.ALREADY_EXISTS
-    except DatabaseException.ConnectionInvalid as e:
-        r = ReturnValue.ERROR
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        r = ReturnValue.BAD_PARAMS
-    except DatabaseException.CHECK_VIOLATION as e:
-        r = ReturnValue.BAD_PARAMS
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        r = ReturnValue.ALREADY_EXISTS
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        r = ReturnValue.BAD_PARAMS
+        with conn.savepoint():
+            if lines:
+                conn.copyLines(table, columns, rows[start:end])
+            else:
+                conn.copyRows(table, columns, rows[start:end])
+    except DatabaseException.ConnectionInvalid:
+        raise
     except Exception as e:
-        print(e)
-    finally:
-        conn.close()
-        return r
-
+        if end - start == 1:
+            results[start] = _rejectedRow(e, errors)
+        else:
+            middle = (start + end) // 2
+            _copyChunk(conn, table, columns, rows, start, middle, results, errors, lines)
+            _copyChunk(conn, table, columns, rows, middle, end, results, errors, lines)
 
 
-def getStadiumProfile(stadiumID: int) -> Stadium:
+# inserts all rows in one transaction and returns a ReturnValue per row, like calling the add function per row
+def _bulkInsert(table: str, columns: List[str], rows: list, errors: dict = ADD_ERRORS, lines=False) -> List[ReturnValue]:
+    results = [ReturnValue.OK] * len(rows)
+    if not rows:
+        return results
     conn = None
-    m = Stadium.badStadium()
     try:
         conn = Connector.DBConnector()
-        query = sql.SQL(
-            "SELECT * FROM Stadiums WHERE id = {id}").format(
-            id=sql.Literal(stadiumID))
-        rows_effected, res = conn.execute(query)
-        m = Stadium(res.rows[0][0], res.rows[0][1], res.rows[0][2])
-    except DatabaseException.ConnectionInvalid as e:
-        pass
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        pass
-    except DatabaseException.CHECK_VIOLATION as e:
-        pass
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        pass
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        pass
+        for start in range(0, len(rows), BULK_CHUNK_SIZE):
+            end = min(start + BULK_CHUNK_SIZE, len(rows))
+            _copyChunk(conn, table, columns, rows, start, end, results, errors, lines)
+        conn.commit()
     except Exception as e:
-        pass
+        results = [ReturnValue.ERROR] * len(rows)
     finally:
-        conn.close()
-        return m
-    return m
-    pass
+        if conn is not None:
+            conn.close()
+    return results
 
 
-def deleteStadium(stadium: Stadium) -> ReturnValue:
-    conn = None
-    r = ReturnValue.OK
-    try:
-        conn = Connector.DBConnector()
-        query = sql.SQL(
-            "DELETE FROM Stadiums WHERE id = {id}").format(
-            id=sql.Literal(stadium.getStadiumID()))
-        rows_effected, res = conn.execute(query)
-        if rows_effected == 0:
-            r = ReturnValue.NOT_EXISTS
+def addTeams(teamIDs: Iterable[int]) -> List[ReturnValue]:
+    return _bulkInsert("Teams", ["id"], [(teamID,) for teamID in teamIDs])
 
-    except DatabaseException.ConnectionInvalid as e:
-        print(e)
-        r = ReturnValue.ERROR
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        print(e)
-        r = ReturnValue.ERROR
-    except DatabaseException.CHECK_VIOLATION as e:
-        print(e)
-        r = ReturnValue.ERROR
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        print(e)
-        r = ReturnValue.ERROR
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        print(e)
-        r = ReturnValue.ERROR
-    except Exception as e:
-        print(e)
-        r = ReturnValue.ERROR
-    finally:
-        conn.close()
-        return r
-    pass
 
+def addMatches(matches: Iterable[Match]) -> List[ReturnValue]:
+    rows = [(m.getMatchID(), m.getCompetition(), m.getHomeTeamID(), m.getAwayTeamID()) for m in matches]
+    _cacheInvalidate(*[("match", row[0]) for row in rows])
+    return _bulkInsert("Matches", ["id", "competition", "home_id", "away_id"], rows)
 
 
-def playerScoredInMatch(match: Match, player: Player, amount: int) -> ReturnValue:
+def addPlayers(players: Iterable[Player]) -> List[ReturnValue]:
+    rows = [(p.getPlayerID(), p.getTeamID(), p.getAge(), p.getHeight(), p.getFoot()) for p in players]
+    _cacheInvalidate(*[("player", row[0]) for row in rows])
+    return _bulkInsert("Players", ["id", "team_id", "age", "height", "preferred_foot"], rows)
 
-    r = ReturnValue.OK
-    conn = None
-    try:
-        conn = Connector.DBConnector()
-        query = sql.SQL(
-            "INSERT INTO Scores(match_id, player_id, goals) VALUES({match_id}, {player_id}, {goals})").format(
-            match_id=sql.Literal(match.getMatchID()), player_id=sql.Literal(player.getPlayerID()), goals=sql.Literal(amount))
-        rows_effected, _ = conn.execute(query)
-    except DatabaseException.ConnectionInvalid as e:
-        r = ReturnValue.ERROR
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        r = ReturnValue.BAD_PARAMS
-    except DatabaseException.CHECK_VIOLATION as e:
-        r = ReturnValue.BAD_PARAMS
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        r = ReturnValue.ALREADY_EXISTS
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        r = ReturnValue.NOT_EXISTS
-    except Exception as e:
-        print(e)
-    finally:
-        conn.close()
-        return r
-    return r
 
-    pass
+def addStadiums(stadiums: Iterable[Stadium]) -> List[ReturnValue]:
+    rows = [(s.getStadiumID(), s.getCapacity(), s.getBelongsTo()) for s in stadiums]
+    _cacheInvalidate(*[("stadium", row[0]) for row in rows])
+    return _bulkInsert("Stadiums", ["id", "capacity", "belong_to"], rows)
 
 
-def playerDidntScoreInMatch(match: Match, player: Player) -> ReturnValue:
-    conn = None
-    r = ReturnValue.OK
-    try:
-        conn = Connector.DBConnector()
-        query = sql.SQL(
-            "DELETE FROM Scores WHERE match_id = {match_id} AND player_id = {player_id}").format(
-            match_id=sql.Literal(match.getMatchID()), player_id=sql.Literal(player.getPlayerID()))
-        rows_effected, res = conn.execute(query)
-        if rows_effected == 0:
-            r = ReturnValue.NOT_EXISTS
+# rows the batch already knows break a NOT NULL or CHECK constraint get BAD_PARAMS without going to the
+# database, the others are COPYed straight from the batch's columns like in _bulkInsert. one ReturnValue per row
+def _addBatch(batch: Batch, kind: str) -> List[ReturnValue]:
+    invalid = batch.invalid()
+    results = [ReturnValue.BAD_PARAMS] * len(batch)
+    valid = [i for i, bad in enumerate(invalid) if not bad]
+    ids = batch.column("id")
+    _cacheInvalidate(*[(kind, ids[i]) for i in valid])
+    lines = batch.copyLines(valid if len(valid) < len(batch) else None)
+    for i, result in zip(valid, _bulkInsert(batch.TABLE, list(batch.COLUMNS), lines, lines=True)):
+        results[i] = result
+    return results
 
-    except DatabaseException.ConnectionInvalid as e:
-        print(e)
-        r = ReturnValue.ERROR
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        print(e)
-        r = ReturnValue.ERROR
-    except DatabaseException.CHECK_VIOLATION as e:
-        print(e)
-        r = ReturnValue.ERROR
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        print(e)
-        r = ReturnValue.ERROR
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        print(e)
-        r = ReturnValue.ERROR
-    except Exception as e:
-        print(e)
-        r = ReturnValue.ERROR
-    finally:
-        conn.close()
-        return r
-    pass
 
+def addMatchBatch(batch: MatchBatch) -> List[ReturnValue]:
+    return _addBatch(batch, "match")
 
-def matchInStadium(match: Match, stadium: Stadium, attendance: int) -> ReturnValue:
 
-    r = ReturnValue.OK
+def addPlayerBatch(batch: PlayerBatch) -> List[ReturnValue]:
+    return _addBatch(batch, "player")
+
+
+def addStadiumBatch(batch: StadiumBatch) -> List[ReturnValue]:
+    return _addBatch(batch, "stadium")
+
+
+# runs one "WHERE id = ANY(...)" query and maps every requested ID to its entity, or to bad() if it is missing.
+# IDs found in the cache (kind) are not queried
+def _getProfiles(kind: str, columns: str, table: str, ids: Iterable[int], build, bad) -> dict:
+    ids = list(ids)
+    profiles = {}
+    missing = []
+    for id in ids:
+        cached = _cacheGet((kind, id))
+        if cached is not _MISS:
+            profiles[id] = build(cached)
+        else:
+            missing.append(id)
     conn = None
     try:
-        conn = Connector.DBConnector()
-        query = sql.SQL(
-            "INSERT INTO Attendance(match_id, stadium_id, attendance) VALUES({match_id}, {stadium_id}, {am})").format(
-            match_id=sql.Literal(match.getMatchID()), stadium_id=sql.Literal(stadium.getStadiumID()), am=sql.Literal(attendance))
-        rows_effected, _ = conn.execute(query)
-    except DatabaseException.ConnectionInvalid as e:
-        r = ReturnValue.ERROR
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        r = ReturnValue.BAD_PARAMS
-    except DatabaseException.CHECK_VIOLATION as e:
-        r = ReturnValue.BAD_PARAMS
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        r = ReturnValue.ALREADY_EXISTS
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        r = ReturnValue.NOT_EXISTS
+        if missing:
+            conn = Connector.DBConnector()
+            query = sql.SQL("SELECT " + columns + " FROM " + table + " WHERE id = ANY({ids})").format(
+                ids=sql.Literal(missing))
+            rows_effected, res = conn.execute(query)
+            for row in res.rows:
+                profiles[row[0]] = build(row)
+                _cachePut((kind, row[0]), row)
     except Exception as e:
-        print(e)
+        pass
     finally:
-        conn.close()
-        return r
-    return r
+        if conn is not None:
+            conn.close()
+    for id in ids:
+        if id not in profiles:
+            profiles[id] = bad()
+    return profiles
 
-    pass
-    pass
 
+def getMatchProfiles(matchIDs: Iterable[int]) -> dict:
+    return _getProfiles("match", "id, competition, home_id, away_id", "Matches", matchIDs, Match.fromRow, Match.badMatch)
 
-def matchNotInStadium(match: Match, stadium: Stadium) -> ReturnValue:
-    conn = None
-    r = ReturnValue.OK
-    try:
-        conn = Connector.DBConnector()
-        query = sql.SQL(
-            "DELETE FROM Attendance WHERE match_id = {match_id} AND stadium_id = {stadium_id}").format(
-            match_id=sql.Literal(match.getMatchID()), stadium_id=sql.Literal(stadium.getStadiumID()))
-        rows_effected, res = conn.execute(query)
-        if rows_effected == 0:
-            r = ReturnValue.NOT_EXISTS
 
-    except DatabaseException.ConnectionInvalid as e:
-        print(e)
-        r = ReturnValue.ERROR
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        print(e)
-        r = ReturnValue.ERROR
-    except DatabaseException.CHECK_VIOLATION as e:
-        print(e)
-        r = ReturnValue.ERROR
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        print(e)
-        r = ReturnValue.ERROR
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        print(e)
-        r = ReturnValue.ERROR
-    except Exception as e:
-        print(e)
-        r = ReturnValue.ERROR
-    finally:
-        conn.close()
-        return r
-    pass
+def getPlayerProfiles(playerIDs: Iterable[int]) -> dict:
+    return _getProfiles("player", "id, team_id, age, height, preferred_foot", "Players", playerIDs, Player.fromRow, Player.badPlayer)
 
 
-def averageAttendanceInStadium(stadiumID: int) -> float:
-    conn = None
-    m = 0
-    try:
-        conn = Connector.DBConnector()
-        query = sql.SQL(
-            "SELECT avg FROM AverageAttendance WHERE stadium_id = {stadiumID}").format(
-            stadiumID=sql.Literal(stadiumID))
-        rows_effected, res = conn.execute(query)
-        if rows_effected == 0:
-            m = 0
-        else:
-            m = res.rows[0][0]
-    except DatabaseException.ConnectionInvalid as e:
-        m=-1
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        m=-1
-    except DatabaseException.CHECK_VIOLATION as e:
-        m=-1
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        m=-1
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        m=-1
-    except Exception as e:
-        m=-1
-    finally:
-        conn.close()
-        return m
-    return m
-    pass
+def getStadiumProfiles(stadiumIDs: Iterable[int]) -> dict:
+    return _getProfiles("stadium", "id, capacity, belong_to", "Stadiums", stadiumIDs, Stadium.fromRow, Stadium.badStadium)
 
 
-def stadiumTotalGoals(stadiumID: int) -> int:
-    conn = None
-    m = 0
-    try:
-        conn = Connector.DBConnector()
-        query = sql.SQL(
-            "SELECT total_goals FROM TotalStadiumGoalsIncludingZeros WHERE stad_id = {stadiumID}").format(
-            stadiumID=sql.Literal(stadiumID))
-        rows_effected, res = conn.execute(query)
-        if rows_effected == 0:
-            m = 0
-        else:
-            m = res.rows[0][0]
-    except DatabaseException.ConnectionInvalid as e:
-        m=-1
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        m=-1
-    except DatabaseException.CHECK_VIOLATION as e:
-        m=-1
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        m=-1
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        m=-1
-    except Exception as e:
-        m=-1
-    finally:
-        conn.close()
-        return m
-    return m
-    pass
+def playerScoredInMatch(match: Match, player: Player, amount: int) -> ReturnValue:
+    return _run("playerScoredInMatch", match.getMatchID(), player.getPlayerID(), amount)
 
 
+def playerDidntScoreInMatch(match: Match, player: Player) -> ReturnValue:
+    return _run("playerDidntScoreInMatch", match.getMatchID(), player.getPlayerID())
 
-def playerIsWinner(playerID: int, matchID: int) -> bool:
-    conn = None
-    m = False
-    try:
-        conn = Connector.DBConnector()
-        query = sql.SQL(
-            "SELECT * FROM Winners WHERE player_id={pID} AND match_id = {mID}").format(pID=sql.Literal(playerID), mID=sql.Literal(matchID))
-        rows_effected, res = conn.execute(query)
-        if(rows_effected>0):
-            m = True
 
-    except DatabaseException.ConnectionInvalid as e:
-        m = False
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        m = False
-    except DatabaseException.CHECK_VIOLATION as e:
-        m = False
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        m = False
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        m = False
-    except Exception as e:
-        m = False
-    finally:
-        conn.close()
-        return m
+def matchInStadium(match: Match, stadium: Stadium, attendance: int) -> ReturnValue:
+    return _run("matchInStadium", match.getMatchID(), stadium.getStadiumID(), attendance)
 
 
-def getActiveTallTeams() -> List[int]:
-    conn = None
-    m = []
-    try:
-        conn = Connector.DBConnector()
-        query = sql.SQL(
-            "SELECT team_id FROM ActiveTallTeams WHERE total>=2 ORDER BY team_id DESC LIMIT 5")
-        rows_effected, res = conn.execute(query)
-        for i in range(len(res.rows)):
-            m.append(res.rows[i][0])
+def matchNotInStadium(match: Match, stadium: Stadium) -> ReturnValue:
+    return _run("matchNotInStadium", match.getMatchID(), stadium.getStadiumID())
 
-    except DatabaseException.ConnectionInvalid as e:
-        m = []
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        m = []
-    except DatabaseException.CHECK_VIOLATION as e:
-        m = []
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        m = []
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        m = []
-    except Exception as e:
-        m = []
-    finally:
-        conn.close()
-        return m
 
+# bulk playerScoredInMatch, events are (match, player, amount) tuples. one ReturnValue per event
+def playersScoredInMatches(events: Iterable[Tuple[Match, Player, int]]) -> List[ReturnValue]:
+    rows = [(match.getMatchID(), player.getPlayerID(), amount) for match, player, amount in events]
+    results = _bulkInsert("Scores", ["match_id", "player_id", "goals"], rows, EVENT_ERRORS)
+    _goalsChanged([row[0] for row in rows])
+    return results
 
-def getActiveTallRichTeams() -> List[int]:
-    conn = None
-    m = []
-    try:
-        conn = Connector.DBConnector()
-        query = sql.SQL(
-            "SELECT team_id FROM ActiveTallRichTeams WHERE total>=2 ORDER BY team_id LIMIT 5")
-        rows_effected, res = conn.execute(query)
-        for i in range(len(res.rows)):
-            m.append(res.rows[i][0])
 
-    except DatabaseException.ConnectionInvalid as e:
-        m = []
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        m = []
-    except DatabaseException.CHECK_VIOLATION as e:
-        m = []
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        m = []
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        m = []
-    except Exception as e:
-        m = []
+# bulk matchInStadium, events are (match, stadium, attendance) tuples. one ReturnValue per event
+def matchesInStadiums(events: Iterable[Tuple[Match, Stadium, int]]) -> List[ReturnValue]:
+    rows = [(match.getMatchID(), stadium.getStadiumID(), attendance) for match, stadium, attendance in events]
+    results = _bulkInsert("Attendance", ["match_id", "stadium_id", "attendance"], rows, EVENT_ERRORS)
+    _attendanceChanged([row[1] for row in rows])
+    return results
+
+
+# yields the rows of query read batchSize at a time through a server side cursor, the connection is given
+# back once they are exhausted or the generator is closed
+def _iterRows(query: str, batchSize: int) -> Iterator[tuple]:
+    conn = Connector.DBConnector()
+    try:
+        with conn.executeStream(query, batchSize) as rows:
+            for row in rows:
+                yield row
     finally:
         conn.close()
-        return m
 
 
+# every goal event as (match_id, player_id, goals), in constant memory however big Scores gets
+def iterScores(batchSize=5000) -> Iterator[Tuple[int, int, int]]:
+    return _iterRows("SELECT match_id, player_id, goals FROM Scores ORDER BY match_id, player_id", batchSize)
 
 
-def popularTeams() -> List[int]:
-    conn = None
-    m = []
-    try:
-        conn = Connector.DBConnector()
-        query = sql.SQL(
-            "SELECT team_id FROM PopularTeams ORDER BY team_id DESC LIMIT 10")
-        rows_effected, res = conn.execute(query)
-        for i in range(len(res.rows)):
-            m.append(res.rows[i][0])
+# every attendance event as (match_id, stadium_id, attendance), in constant memory
+def iterAttendance(batchSize=5000) -> Iterator[Tuple[int, int, int]]:
+    return _iterRows("SELECT match_id, stadium_id, attendance FROM Attendance ORDER BY match_id", batchSize)
 
-    except DatabaseException.ConnectionInvalid as e:
-        m = []
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        m = []
-    except DatabaseException.CHECK_VIOLATION as e:
-        m = []
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        m = []
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        m = []
-    except Exception as e:
-        m = []
-    finally:
-        conn.close()
-        return m
 
+def averageAttendanceInStadium(stadiumID: int) -> float:
+    cached = _cacheGet(("attendance", stadiumID))
+    if cached is not _MISS:
+        return cached
+    return _run("averageAttendanceInStadium", stadiumID)
 
 
-# select s_id from totalstadiumgoals order by total_goals desc limit 5
+def stadiumTotalGoals(stadiumID: int) -> int:
+    cached = _cacheGet(("stadium_goals", stadiumID))
+    if cached is not _MISS:
+        return cached
+    return _run("stadiumTotalGoals", stadiumID)
 
-def getMostAttractiveStadiums() -> List[int]:
-    conn = None
-    m = []
-    try:
-        conn = Connector.DBConnector()
-        query = sql.SQL(
-            "SELECT stad_id from TotalStadiumGoalsIncludingZeros ORDER BY total_goals DESC, stad_id ASC")
-        rows_effected, res = conn.execute(query)
-        for i in range(len(res.rows)):
-            m.append(res.rows[i][0])
 
-    except DatabaseException.ConnectionInvalid as e:
-        m = []
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        m = []
-    except DatabaseException.CHECK_VIOLATION as e:
-        m = []
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        m = []
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        m = []
-    except Exception as e:
-        m = []
-    finally:
-        conn.close()
-        return m
+def playerIsWinner(playerID: int, matchID: int) -> bool:
+    cached = _cacheGet(("winner", matchID, playerID))
+    if cached is not _MISS:
+        return cached
+    return _run("playerIsWinner", playerID, matchID)
 
 
+def getActiveTallTeams() -> List[int]:
+    return _run("getActiveTallTeams")
 
 
-def mostGoalsForTeam(teamID: int) -> List[int]:
-    conn = None
-    m = []
-    try:
-        conn = Connector.DBConnector()
-        query = sql.SQL(
-            "SELECT player_id from PlayerGoals WHERE team_id={tID} ORDER BY goals DESC, player_id DESC LIMIT 5").format(tID=sql.Literal(teamID))
-        rows_effected, res = conn.execute(query)
-        for i in range(len(res.rows)):
-            m.append(res.rows[i][0])
+def getActiveTallRichTeams() -> List[int]:
+    return _run("getActiveTallRichTeams")
 
-    except DatabaseException.ConnectionInvalid as e:
-        m = []
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        m = []
-    except DatabaseException.CHECK_VIOLATION as e:
-        m = []
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        m = []
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        m = []
-    except Exception as e:
-        m = []
-    finally:
-        conn.close()
-        return m
 
+def popularTeams() -> List[int]:
+    return _run("popularTeams")
 
-def getClosePlayers(playerID: int) -> List[int]:
-    conn = None
-    m = []
-    try:
-        conn = Connector.DBConnector()
-        query = sql.SQL(
-            "select player_id from AllMatchesPlayers where b_player_id={pID} and player_id <> {pID} and count >= (select count from SameMatchesByPlayer where player_id={pID} and b_player_id={pID})/2 ORDER BY player_id ASC LIMIT 10").format(
-            pID=sql.Literal(playerID))
-        rows_effected, res = conn.execute(query)
-        for i in range(len(res.rows)):
-            m.append(res.rows[i][0])
 
-    except DatabaseException.ConnectionInvalid as e:
-        m = []
-    except DatabaseException.NOT_NULL_VIOLATION as e:
-        m = []
-    except DatabaseException.CHECK_VIOLATION as e:
-        m = []
-    except DatabaseException.UNIQUE_VIOLATION as e:
-        m = []
-    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
-        m = []
-    except Exception as e:
-        m = []
-    finally:
-        conn.close()
-        return m
+def getMostAttractiveStadiums() -> List[int]:
+    return _run("getMostAttractiveStadiums")
+
 
+# compares StadiumStats against the AverageAttendance / TotalStadiumGoalsIncludingZeros view definitions.
+# returns the IDs of the stadiums whose stored statistics disagree (empty when consistent), None on error
+def checkStadiumStats() -> List[int]:
+    return _run("checkStadiumStats")
 
 
+# recomputes StadiumStats from Attendance and Scores, e.g. after checkStadiumStats found a difference
+def rebuildStadiumStats() -> ReturnValue:
+    return _run("rebuildStadiumStats")
 
 
+def mostGoalsForTeam(teamID: int) -> List[int]:
+    return _run("mostGoalsForTeam", teamID)
+
+
+def getClosePlayers(playerID: int) -> List[int]:
+    return _run("getClosePlayers", playerID)
+
+
+# calls function(*args) for every tuple in argsList from a pool of threads, returns the results in order.
+# every Solution function borrows its own pooled connection, so they can run side by side (see DBConnector).
+# maxWorkers defaults to the connection pool's size, more threads would only wait for a connection
+def runMany(function: Callable, argsList: Iterable[tuple], maxWorkers: int = None) -> list:
+    argsList = list(argsList)
+    if not argsList:
+        return []
+    if maxWorkers is None:
+        pool = Connector.getPool()
+        maxWorkers = pool.stats()["max_size"] if pool is not None else 10
+    with ThreadPoolExecutor(min(maxWorkers, len(argsList))) as executor:
+        return list(executor.map(lambda args: function(*args), argsList))
+
+
+# every API function, addTeam to getClosePlayers, is a span while Tracing.enableTracing() is on: its time split
+# into connect/execute/fetch/close (recorded by DBConnector), the ReturnValue and the DatabaseException it
+# mapped. the functions returning an Iterator (iterScores, iterAttendance) are left alone, their work happens
+# after they return
+def _traceAPI():
+    names = [name for name, value in globals().items()
+             if inspect.isfunction(value) and value.__module__ == __name__ and not name.startswith("_")]
+    for name in names[names.index("addTeam"):names.index("getClosePlayers") + 1]:
+        returns = inspect.signature(globals()[name]).return_annotation
+        if getattr(returns, "__origin__", returns) is not collections.abc.Iterator:
+            globals()[name] = Tracing.traced(globals()[name])
+
+
+_traceAPI()
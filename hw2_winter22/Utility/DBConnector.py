@@ -0,0 +1,1145 @@
+import psycopg2
+from psycopg2 import errors, sql
+from configparser import ConfigParser
+from Utility.Exceptions import DatabaseException
+from Utility.QueryStats import QueryStats
+from Utility import Tracing
+import io
+import operator
+import os
+import re
+import threading
+import time
+from array import array
+from itertools import compress, repeat
+from collections.abc import Mapping
+from contextlib import contextmanager, nullcontext
+from typing import Union, Callable, Optional, NamedTuple, Tuple, Iterable
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, only ColumnarResultSet.to_numpy() needs it
+    numpy = None
+
+
+class ResultSetDict(dict):
+    def __getitem__(self, item):
+        if type(item) is not str:
+            return None
+        return super().__getitem__(item.lower())
+
+
+# one row of a ResultSet, read through the column map (ResultSet.cols) all its rows share instead of a
+# dict built per access. column names are case-insensitive and a non-str key gives None, like ResultSetDict
+class ResultSetRow(Mapping):
+    __slots__ = ("__values", "__cols")
+
+    def __init__(self, values: tuple, cols: ResultSetDict):
+        self.__values = values
+        self.__cols = cols
+
+    def __getitem__(self, item):
+        if type(item) is not str:
+            return None
+        index = self.__cols.get(item)
+        if index is None:
+            index = self.__cols[item]  # not the exact name, ResultSetDict lowercases it or raises KeyError
+        return self.__values[index]
+
+    def __contains__(self, item):
+        return type(item) is str and item.lower() in self.__cols
+
+    def __iter__(self):
+        return iter(self.__cols)
+
+    def __len__(self):
+        return len(self.__cols)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class ResultSet:
+    # constructor
+    def __init__(self, description=None, results=None):
+        self.rows = []
+        self.cols_header = []
+        self.cols = ResultSetDict()
+        self.__fromQuery(description, results)
+
+    def __getitem__(self, row):
+        return self.__getRow(row)
+
+    # so you can use print(ResultSet)
+    def __str__(self):
+        string = ""
+        for col in self.cols_header:
+            string += str(col) + "   "
+        string += '\n'
+        for row in self.rows:
+            for val in row:
+                string += str(val) + "   "
+            string += '\n'
+        return string
+
+    # what is the size of the ResultSet?
+    def size(self):
+        return len(self.rows)
+
+    # is the ResultSet empty?
+    def isEmpty(self):
+        return self.size() == 0
+
+    # raises IndexError for a row that isn't there, negative rows count from the end like in a list
+    def __getRow(self, row: int):
+        try:
+            return ResultSetRow(self.rows[row], self.cols)
+        except IndexError:
+            raise IndexError('Invalid row ' + str(row)) from None
+
+    def __fromQuery(self, description, results: list):
+        if results is None or len(results) == 0:  # no results
+            self.cols = ResultSetDict()
+        else:
+            # fetchall() already gives us a list of our own, no need to copy it
+            self.rows = results
+            self.cols_header = [d.name for d in description]
+            self.cols = ResultSetDict()
+            for col, index in zip(self.cols_header, range(len(results[0]))):
+                self.cols[col] = index
+
+
+# turns the integrity errors raised inside the with block into the matching DatabaseException
+@contextmanager
+def _translateErrors():
+    try:
+        yield
+    except errors.lookup("23502"):
+        raise DatabaseException.NOT_NULL_VIOLATION("NOT_NULL_VIOLATION")
+    except errors.lookup("23503"):
+        raise DatabaseException.FOREIGN_KEY_VIOLATION("FOREIGN_KEY_VIOLATION")
+    except errors.lookup("23505"):
+        raise DatabaseException.UNIQUE_VIOLATION("UNIQUE_VIOLATION")
+    except errors.lookup("23514"):
+        raise DatabaseException.CHECK_VIOLATION("CHECK_VIOLATION")
+
+
+# one value in COPY's text format
+def _copyValue(value) -> str:
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+# immutable connection settings, read from database.ini once per process
+class DBSettings(NamedTuple):
+    host: Optional[str] = None
+    port: Optional[str] = None
+    database: Optional[str] = None
+    user: Optional[str] = None
+    password: Optional[str] = None
+    # the schema to work in (the connections' search_path), None for the database's default (public)
+    schema: Optional[str] = None
+    # any other key from the [postgresql] section, as (key, value) pairs
+    extra: Tuple[Tuple[str, str], ...] = ()
+    # the database.ini this was read from, None if only the environment was used
+    source: Optional[str] = None
+
+    # keyword arguments for psycopg2.connect
+    def connectParams(self) -> dict:
+        params = dict(self.extra)
+        for key in ("host", "port", "database", "user", "password"):
+            if getattr(self, key) is not None:
+                params[key] = getattr(self, key)
+        if self.schema is not None:
+            params["options"] = (params.get("options", "") + " -c search_path=" + self.schema).strip()
+        return params
+
+
+# environment variables that override database.ini, the same ones psql and libpq read
+# (PGSCHEMA is ours, libpq doesn't know it)
+ENV_OVERRIDES = {"PGHOST": "host", "PGPORT": "port", "PGDATABASE": "database", "PGUSER": "user",
+                 "PGPASSWORD": "password", "PGSCHEMA": "schema"}
+
+_settings = None
+_settingsLock = threading.Lock()
+
+
+# database.ini locations, in order: $DATABASE_INI, next to this file, then <cwd>/Utility and <cwd>/../Utility
+def _configCandidates() -> list:
+    candidates = []
+    if os.environ.get("DATABASE_INI"):
+        candidates.append(os.environ["DATABASE_INI"])
+    candidates.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "database.ini"))
+    candidates.append(os.path.join(os.getcwd(), "Utility", "database.ini"))
+    candidates.append(os.path.join(os.path.dirname(os.getcwd()), "Utility", "database.ini"))
+    return candidates
+
+
+def _loadSettings(section="postgresql") -> DBSettings:
+    values, source = {}, None
+    for filename in _configCandidates():
+        parser = ConfigParser()
+        parser.read(filename)
+        if parser.has_section(section):
+            values, source = dict(parser.items(section)), filename
+            break
+    for env, key in ENV_OVERRIDES.items():
+        if os.environ.get(env):
+            values[key] = os.environ[env]
+    if source is None and "database" not in values:
+        raise DatabaseException.database_ini_ERROR("Please modify database.ini file under Utility")
+    known = {key: values.pop(key, None) for key in ("host", "port", "database", "user", "password", "schema")}
+    if known["schema"] is not None:
+        # used unquoted in search_path and CREATE SCHEMA, so both fold it to lower case the same way
+        if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", known["schema"]):
+            raise DatabaseException.database_ini_ERROR("Invalid schema name: " + known["schema"])
+        known["schema"] = known["schema"].lower()
+    return DBSettings(extra=tuple(sorted(values.items())), source=source, **known)
+
+
+# the cached settings, database.ini is only read on the first call (or after reloadConfig)
+def getSettings() -> DBSettings:
+    global _settings
+    settings = _settings
+    if settings is None:
+        with _settingsLock:
+            if _settings is None:
+                _settings = _loadSettings()
+            settings = _settings
+    return settings
+
+
+# re-read database.ini and the environment, pooled connections made with the old settings are closed
+def reloadConfig() -> DBSettings:
+    global _settings
+    with _settingsLock:
+        _settings = _loadSettings()
+        settings = _settings
+    closePool()
+    breaker = _breaker
+    if breaker is not None:
+        # the new settings get a fresh chance to connect
+        breaker.success()
+    return settings
+
+
+class ConnectionPool:
+    # a thread-safe pool of open connections.
+    # minSize - connections opened on first use and never reaped by the idle timeout
+    # maxSize - upper bound on open connections, getConnection blocks (up to checkoutTimeout) when reached
+    # idleTimeout - seconds an idle connection may sit in the pool before it is closed
+    # healthCheckAfter - connections idle longer than this are probed with SELECT 1 on checkout
+    def __init__(self, connect: Callable, minSize=1, maxSize=10, idleTimeout=300.0, healthCheckAfter=5.0,
+                 checkoutTimeout=30.0):
+        if minSize < 0 or maxSize < 1 or minSize > maxSize:
+            raise ValueError("Invalid pool size: min=" + str(minSize) + ", max=" + str(maxSize))
+        self.minSize = minSize
+        self.maxSize = maxSize
+        self.idleTimeout = idleTimeout
+        self.healthCheckAfter = healthCheckAfter
+        self.checkoutTimeout = checkoutTimeout
+        self.__connect = connect
+        self.__idle = []  # (connection, last time it was returned), most recently used last
+        self.__opened = 0
+        self.__filled = False
+        self.__closed = False
+        self.__pid = os.getpid()
+        self.__cond = threading.Condition()
+
+    # borrow a connection, it must be given back with putConnection
+    def getConnection(self):
+        deadline = time.monotonic() + self.checkoutTimeout
+        with self.__cond:
+            self.__checkFork()
+            if self.__closed:
+                raise DatabaseException.ConnectionInvalid("Connection pool is closed")
+            self.__reap()
+            while True:
+                if self.__idle:
+                    conn, lastUsed = self.__idle.pop()
+                    break
+                if self.__opened < self.maxSize:
+                    self.__opened += 1
+                    conn, lastUsed = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.__cond.wait(remaining):
+                    raise DatabaseException.ConnectionInvalid("Timed out waiting for a pooled connection")
+
+        # connecting and probing happen outside the lock so other threads are not held up
+        if conn is not None and not self.__isHealthy(conn, lastUsed):
+            # a broken connection's slot is reused for a fresh one
+            self.__close(conn)
+            conn = None
+        if conn is None:
+            try:
+                conn = self.__connect()
+            except Exception:
+                with self.__cond:
+                    self.__opened -= 1
+                    self.__cond.notify()
+                raise
+            self.__fill()
+        return conn
+
+    # give back a borrowed connection, broken connections (or discard=True) are closed instead
+    def putConnection(self, conn, discard=False):
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        with self.__cond:
+            if self.__pid != os.getpid():
+                # connection belongs to the parent process, leave it alone
+                return
+            if discard or conn.closed or self.__closed:
+                self.__opened -= 1
+                discard = True
+            else:
+                self.__idle.append((conn, time.monotonic()))
+            self.__cond.notify()
+        if discard:
+            self.__close(conn)
+
+    # borrow a connection for the duration of a with block
+    @contextmanager
+    def connection(self):
+        conn = self.getConnection()
+        try:
+            yield conn
+        except Exception:
+            self.putConnection(conn, discard=bool(conn.closed))
+            raise
+        else:
+            self.putConnection(conn)
+
+    # close every idle connection, borrowed connections are closed when they are given back
+    def close(self):
+        with self.__cond:
+            self.__closed = True
+            idle, self.__idle = self.__idle, []
+            self.__opened -= len(idle)
+            self.__cond.notify_all()
+        for conn, _ in idle:
+            self.__close(conn)
+
+    # snapshot of the pool's state
+    def stats(self) -> dict:
+        with self.__cond:
+            return {"opened": self.__opened, "idle": len(self.__idle), "in_use": self.__opened - len(self.__idle),
+                    "min_size": self.minSize, "max_size": self.maxSize}
+
+    def __isHealthy(self, conn, lastUsed) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - lastUsed < self.healthCheckAfter:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    # open connections up to minSize the first time the pool is used
+    def __fill(self):
+        with self.__cond:
+            if self.__filled:
+                return
+            self.__filled = True
+            missing = max(self.minSize - self.__opened, 0)
+            self.__opened += missing
+        for _ in range(missing):
+            try:
+                conn = self.__connect()
+            except Exception:
+                with self.__cond:
+                    self.__opened -= 1
+                continue
+            self.putConnection(conn)
+
+    # called with the lock held, closes connections that were idle for too long
+    def __reap(self):
+        now = time.monotonic()
+        keep = []
+        # the oldest connections are at the front of the list
+        for conn, lastUsed in self.__idle:
+            if now - lastUsed > self.idleTimeout and self.__opened > self.minSize:
+                self.__opened -= 1
+                self.__close(conn)
+            else:
+                keep.append((conn, lastUsed))
+        self.__idle = keep
+
+    # called with the lock held, a forked child must not reuse the parent's sockets
+    def __checkFork(self):
+        if self.__pid != os.getpid():
+            self.__pid = os.getpid()
+            self.__idle = []
+            self.__opened = 0
+            self.__filled = False
+
+    @staticmethod
+    def __close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+# psycopg2 connection that remembers which named statements were PREPAREd on it
+class PreparingConnection(psycopg2.extensions.connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # statement name -> the text it was prepared with
+        self.prepared = {}
+        # server side cursors declared so far, for their names: DBConnectors in one transaction() share the
+        # connection, and two open cursors can't have the same name
+        self.streams = 0
+
+
+# named statements shared by all connections: name -> statement text with $1, $2, ... placeholders
+_statements = {}
+
+
+# register a statement for DBConnector.executePrepared, it is PREPAREd lazily once per connection
+def registerStatement(name: str, statement: str):
+    _statements[name.lower()] = statement
+
+
+# the process-wide pool used by DBConnector, None while pooling is disabled
+_pool = None
+_poolEnabled = True
+_poolOptions = {}
+_poolLock = threading.Lock()
+
+
+# (re)configure the process-wide pool, takes the ConnectionPool keyword arguments.
+# configurePool(enabled=False) makes every DBConnector open its own connection again.
+def configurePool(enabled=True, **options):
+    global _pool, _poolEnabled, _poolOptions
+    with _poolLock:
+        old, _pool = _pool, None
+        _poolEnabled = enabled
+        _poolOptions = options
+    if old is not None:
+        old.close()
+
+
+def getPool() -> Optional[ConnectionPool]:
+    global _pool
+    if not _poolEnabled:
+        return None
+    with _poolLock:
+        if _pool is None:
+            _pool = ConnectionPool(DBConnector.connect, **_poolOptions)
+        return _pool
+
+
+# close the process-wide pool's idle connections, a new pool is created on next use
+def closePool():
+    configurePool(_poolEnabled, **_poolOptions)
+
+
+class CircuitBreaker:
+    # stops DBConnector from trying a database it can't reach.
+    # failureThreshold - consecutive failed connects that open the breaker
+    # resetTimeout - seconds it stays open, every DBConnector made meanwhile raises ConnectionInvalid at once.
+    #                after that one caller gets to try again (half open): success closes the breaker,
+    #                failure opens it for another resetTimeout
+    def __init__(self, failureThreshold=3, resetTimeout=5.0):
+        if failureThreshold < 1 or resetTimeout < 0:
+            raise ValueError("Invalid breaker: threshold=" + str(failureThreshold) + ", timeout=" + str(resetTimeout))
+        self.failureThreshold = failureThreshold
+        self.resetTimeout = resetTimeout
+        self.__failures = 0
+        self.__openUntil = None  # monotonic time the breaker opens until, None while closed
+        self.__probing = False
+        self.__lock = threading.Lock()
+
+    # may a connect be tried now
+    def allow(self) -> bool:
+        openUntil = self.__openUntil
+        if openUntil is None:
+            return True
+        with self.__lock:
+            if self.__openUntil is None:
+                return True
+            if self.__probing or time.monotonic() < self.__openUntil:
+                return False
+            self.__probing = True
+            return True
+
+    def success(self):
+        if self.__failures or self.__openUntil is not None:
+            with self.__lock:
+                self.__failures = 0
+                self.__openUntil = None
+                self.__probing = False
+
+    # a connect that says nothing about the database (the pool was closed or had no connection to spare):
+    # the state stays as it was, a half open probe just lets the next caller try
+    def release(self):
+        if self.__probing:
+            with self.__lock:
+                self.__probing = False
+
+    def failure(self):
+        with self.__lock:
+            self.__failures += 1
+            if self.__probing or self.__failures >= self.failureThreshold:
+                self.__openUntil = time.monotonic() + self.resetTimeout
+            self.__probing = False
+
+    def state(self) -> str:
+        if self.__openUntil is None:
+            return "closed"
+        return "half-open" if self.__probing or time.monotonic() >= self.__openUntil else "open"
+
+
+# the process-wide breaker used by DBConnector, None while disabled
+_breaker = CircuitBreaker()
+
+
+# configureBreaker(enabled=False) makes every DBConnector try to connect however often it failed before.
+# takes the CircuitBreaker keyword arguments
+def configureBreaker(enabled=True, **options):
+    global _breaker
+    _breaker = CircuitBreaker(**options) if enabled else None
+
+
+def getBreaker() -> Optional[CircuitBreaker]:
+    return _breaker
+
+
+# per query fingerprint latencies and row counts of everything DBConnector runs, and connection setup times.
+# off until enableQueryStats() is called, recording costs a few microseconds per statement
+_queryStats = None
+
+
+# starts recording (from scratch) and returns the QueryStats, read it with snapshot(), toJSON() or toPrometheus()
+def enableQueryStats() -> QueryStats:
+    global _queryStats
+    _queryStats = QueryStats()
+    return _queryStats
+
+
+def disableQueryStats():
+    global _queryStats
+    _queryStats = None
+
+
+# the QueryStats being recorded, None while disabled
+def getQueryStats() -> Optional[QueryStats]:
+    return _queryStats
+
+
+# the rows of a SELECT read through a server side cursor, itersize rows at a time, so a big result is never
+# held in memory at once. iterate it (once) for tuples, or dicts() for ResultSetDict rows.
+# the connection can't run anything else until the rows are exhausted or close() is called
+class StreamingResultSet:
+    def __init__(self, cursor, itersize: int, done: Callable[[], None]):
+        self.cols_header = []
+        self.cols = ResultSetDict()
+        self.__cursor = cursor
+        self.__itersize = itersize
+        self.__done = done
+        # the first batch runs the query, and only then the columns are known
+        self.__batch = self.__fetch()
+        if cursor.description is not None:
+            self.cols_header = [d.name for d in cursor.description]
+            for index, col in enumerate(self.cols_header):
+                self.cols[col] = index
+
+    # so you can use "with conn.executeStream(query) as rows:"
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __iter__(self):
+        try:
+            while self.__batch:
+                batch = self.__batch
+                self.__batch = None
+                for row in batch:
+                    yield row
+                self.__batch = self.__fetch() if len(batch) == self.__itersize else []
+        finally:
+            self.close()
+
+    # the rows as ResultSetRow views on the tuples, like ResultSet[i]
+    def dicts(self):
+        cols = self.cols
+        for row in self:
+            yield ResultSetRow(row, cols)
+
+    # stops reading, the rest of the rows are dropped on the server
+    def close(self):
+        if self.__cursor is not None:
+            cursor = self.__cursor
+            self.__cursor = None
+            self.__batch = []
+            try:
+                cursor.close()
+            except Exception:
+                # already gone with its transaction
+                pass
+            self.__done()
+
+    def __fetch(self) -> list:
+        if self.__cursor is None:
+            return []
+        with _translateErrors():
+            return self.__cursor.fetchmany(self.__itersize)
+
+
+# typed array for a column whose values are all int or all float (and never NULL), otherwise a list
+def _newColumn(values: list):
+    if values and all([type(value) is int for value in values]):
+        try:
+            return array('q', values)
+        except OverflowError:  # numeric values beyond 64 bits
+            pass
+    elif values and all([type(value) is float for value in values]):
+        return array('d', values)
+    return list(values)
+
+
+def _extendColumn(column, values: list):
+    if isinstance(column, array):
+        try:
+            # built apart first, a failed array.extend would leave half the values appended
+            column.extend(array(column.typecode, values))
+            return column
+        except (TypeError, OverflowError):  # a NULL or a value of another type, fall back to a list
+            column = column.tolist()
+    column.extend(values)
+    return column
+
+
+_FILTERS = {"=": operator.eq, "<>": operator.ne, "!=": operator.ne, "<": operator.lt, "<=": operator.le,
+            ">": operator.gt, ">=": operator.ge}
+
+
+# a SELECT result stored column by column, each int/float column in a typed array (8 bytes a value instead
+# of a Python object in a tuple). rows, cols and [i] work like in ResultSet, but rows is rebuilt on every
+# access, so analytics should go through column(), where() and to_numpy()
+class ColumnarResultSet:
+    def __init__(self, cols_header: list = None, columns: list = None):
+        self.cols_header = list(cols_header or [])
+        self.cols = ResultSetDict()
+        for index, col in enumerate(self.cols_header):
+            self.cols[col] = index
+        self.__columns = columns if columns is not None else [[] for col in self.cols_header]
+
+    # reads a StreamingResultSet batch by batch, so the tuples never exist all at once
+    @staticmethod
+    def fromStream(rows: "StreamingResultSet", batchSize: int) -> "ColumnarResultSet":
+        columns = None
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batchSize:
+                columns = ColumnarResultSet.__extend(columns, batch)
+                batch = []
+        columns = ColumnarResultSet.__extend(columns, batch)
+        if not columns or not len(columns[0]):
+            return ColumnarResultSet(rows.cols_header)
+        return ColumnarResultSet(rows.cols_header, columns)
+
+    @staticmethod
+    def __extend(columns, batch: list):
+        if not batch:
+            return columns
+        values = list(zip(*batch))
+        if columns is None:
+            return [_newColumn(list(column)) for column in values]
+        return [_extendColumn(column, list(new)) for column, new in zip(columns, values)]
+
+    def __getitem__(self, row):
+        if not -self.size() <= row < self.size():
+            raise IndexError('Invalid row ' + str(row))
+        return ResultSetRow(tuple([column[row] for column in self.__columns]), self.cols)
+
+    # the rows as tuples, like ResultSet.rows
+    @property
+    def rows(self) -> list:
+        return list(zip(*self.__columns))
+
+    # so you can use print(ColumnarResultSet), same format as ResultSet
+    def __str__(self):
+        string = ""
+        for col in self.cols_header:
+            string += str(col) + "   "
+        string += '\n'
+        for row in self.rows:
+            for val in row:
+                string += str(val) + "   "
+            string += '\n'
+        return string
+
+    def size(self):
+        return len(self.__columns[0]) if self.__columns else 0
+
+    def isEmpty(self):
+        return self.size() == 0
+
+    # the stored column itself (an array or a list), not a copy
+    def column(self, name: str):
+        return self.__columns[self.cols[name]]
+
+    # a new ColumnarResultSet with the rows where "name op value" holds, op is one of = <> != < <= > >=.
+    # NULLs never match, like in SQL
+    def where(self, name: str, op: str, value) -> "ColumnarResultSet":
+        compare = _FILTERS[op]
+        column = self.column(name)
+        if numpy is not None and isinstance(column, array):
+            mask = compare(numpy.frombuffer(column, dtype=column.typecode), value)
+            columns = []
+            for other in self.__columns:
+                if isinstance(other, array):
+                    selected = array(other.typecode)
+                    selected.frombytes(numpy.frombuffer(other, dtype=other.typecode)[mask].tobytes())
+                    columns.append(selected)
+                else:
+                    columns.append(list(compress(other, mask.tolist())))
+            return ColumnarResultSet(self.cols_header, columns)
+        if isinstance(column, array):
+            mask = list(map(compare, column, repeat(value)))
+        else:
+            mask = [val is not None and compare(val, value) for val in column]
+        return ColumnarResultSet(self.cols_header, [
+            array(other.typecode, compress(other, mask)) if isinstance(other, array) else list(compress(other, mask))
+            for other in self.__columns])
+
+    # a new ColumnarResultSet with the given rows, in the given order
+    def take(self, indexes: list) -> "ColumnarResultSet":
+        columns = []
+        for column in self.__columns:
+            values = [column[index] for index in indexes]
+            columns.append(array(column.typecode, values) if isinstance(column, array) else values)
+        return ColumnarResultSet(self.cols_header, columns)
+
+    # the columns as NumPy arrays by name. typed columns share their memory with this result set,
+    # other columns become object arrays
+    def to_numpy(self) -> dict:
+        if numpy is None:
+            raise ImportError("to_numpy() needs numpy installed")
+        result = {}
+        for col, column in zip(self.cols_header, self.__columns):
+            if isinstance(column, array):
+                result[col] = numpy.frombuffer(column, dtype=column.typecode)
+            else:
+                result[col] = numpy.array(column, dtype=object)
+        return result
+
+
+# the unit of work transaction() opened in this thread
+_local = threading.local()
+
+
+class Rollback(Exception):
+    pass
+
+
+class _Transaction:
+    def __init__(self, owner: "DBConnector"):
+        self.owner = owner  # the DBConnector that borrowed the connection, it commits and gives it back
+        self.connection = owner.connection
+        self.open = False  # whether the per statement savepoint exists
+
+    # runs one statement under its own savepoint, so a failed statement is undone alone and the transaction
+    # can go on. the savepoint is released by the next statement, in the same round trip
+    def execute(self, cursor, query, params):
+        prefix = "RELEASE SAVEPOINT statement; SAVEPOINT statement; " if self.open else "SAVEPOINT statement; "
+        self.open = True
+        try:
+            cursor.execute(sql.SQL(prefix) + query if isinstance(query, sql.Composable) else prefix + query, params)
+        except Exception:
+            self.__rollback(cursor)
+            raise
+
+    # the same for work that can't take the prefix, like a server side cursor's DECLARE: the savepoint is set
+    # with cursor before the with block, one round trip more
+    @contextmanager
+    def statement(self, cursor):
+        cursor.execute("RELEASE SAVEPOINT statement; SAVEPOINT statement" if self.open else "SAVEPOINT statement")
+        self.open = True
+        try:
+            yield
+        except Exception:
+            self.__rollback(cursor)
+            raise
+
+    @staticmethod
+    def __rollback(cursor):
+        try:
+            cursor.execute("ROLLBACK TO SAVEPOINT statement")
+        except Exception:
+            raise DatabaseException.ConnectionInvalid("Could not rollback to savepoint")
+
+
+# runs the with block as one transaction: every DBConnector made in it, in this thread, shares one connection,
+# their commit() does nothing and the work is committed once at the end (rolled back if the block raises).
+# each statement gets a savepoint, so a failed one (e.g. a UNIQUE violation) is undone alone and raises as
+# usual while the rest is kept. nested transaction() blocks are savepoints in the outer one.
+# raise Rollback in the block to undo it without an error
+@contextmanager
+def transaction():
+    current = getattr(_local, "transaction", None)
+    if current is not None:
+        # statements in the savepoint get their own statement savepoints, not the outer one's
+        wasOpen, current.open = current.open, False
+        try:
+            with current.owner.savepoint(), DBConnector() as conn:
+                yield conn
+        except Rollback:
+            pass
+        finally:
+            current.open = wasOpen
+        return
+    owner = DBConnector()
+    _local.transaction = _Transaction(owner)
+    try:
+        with DBConnector() as conn:
+            yield conn
+        owner.commit()
+    except Rollback:
+        owner.rollback()
+    except BaseException:
+        owner.rollback()
+        raise
+    finally:
+        _local.transaction = None
+        owner.close()
+
+
+def inTransaction() -> bool:
+    return getattr(_local, "transaction", None) is not None
+
+
+# thread safety: a DBConnector is one borrowed connection with one cursor and must stay in the thread that
+# made it. threads share the pool, not DBConnectors - each thread (or each call, like the Solution
+# functions) makes its own and closes it. the pool is thread-safe and keeps the connections open, so this
+# costs no connect. Solution.runMany runs Solution functions from a thread pool this way
+class DBConnector:
+    # constructor, borrows a connection from the process-wide pool
+    def __init__(self):
+        self.__pool = None
+        self.__savepoints = 0
+        self.connection = None
+        self.__transaction = getattr(_local, "transaction", None)
+        if self.__transaction is not None:
+            # inside transaction(), see there
+            self.connection = self.__transaction.connection
+            self.cursor = self.connection.cursor()
+            return
+        breaker = _breaker
+        if breaker is not None and not breaker.allow():
+            self.cursor = None
+            error = DatabaseException.ConnectionInvalid("Could not connect to database (circuit breaker open)")
+            Tracing.recordException(error)
+            raise error
+        try:
+            start = time.perf_counter()
+            self.__pool = getPool()
+            if self.__pool is not None:
+                self.connection = self.__pool.getConnection()
+            else:
+                self.connection = DBConnector.connect()
+            self.connection.autocommit = False
+            self.cursor = self.connection.cursor()
+            stats = _queryStats
+            if stats is not None:
+                stats.recordConnection("checkout", time.perf_counter() - start)
+            Tracing.addPhase("connect", time.perf_counter() - start)
+            if breaker is not None:
+                breaker.success()
+        except Exception as e:
+            if self.__pool is not None and self.connection is not None:
+                self.__pool.putConnection(self.connection, discard=True)
+            self.connection = None
+            self.cursor = None
+            Tracing.addPhase("connect", time.perf_counter() - start)
+            if breaker is not None:
+                # a closed pool or a checkout timeout says nothing about the database being reachable
+                if isinstance(e, DatabaseException.ConnectionInvalid):
+                    breaker.release()
+                else:
+                    breaker.failure()
+            error = DatabaseException.ConnectionInvalid("Could not connect to database")
+            Tracing.recordException(error)
+            raise error
+
+    # so you can use "with DBConnector() as conn:"
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # opens a new (not pooled) connection
+    @staticmethod
+    def connect():
+        # Obtain the configuration parameters
+        params = getSettings().connectParams()
+        start = time.perf_counter()
+        connection = psycopg2.connect(connection_factory=PreparingConnection, **params)
+        stats = _queryStats
+        if stats is not None:
+            stats.recordConnection("connect", time.perf_counter() - start)
+        return connection
+
+    # close connection, a pooled connection is given back to the pool
+    def close(self):
+        start = time.perf_counter()
+        if self.cursor is not None:
+            try:
+                self.cursor.close()
+            except Exception:
+                pass
+            self.cursor = None
+        if self.connection is not None:
+            if self.__transaction is not None:
+                pass  # the transaction gives it back when it ends
+            elif self.__pool is not None:
+                self.__pool.putConnection(self.connection)
+            else:
+                self.connection.close()
+            self.connection = None
+        Tracing.addPhase("close", time.perf_counter() - start)
+
+    # commit connection's changes, inside transaction() they are committed when it ends
+    def commit(self):
+        if self.connection is not None and self.__transaction is None:
+            try:
+                self.connection.commit()
+            except Exception:
+                raise DatabaseException.ConnectionInvalid("Could not commit changes")
+
+    # rollback connection's changes. inside transaction() that would undo the whole transaction, other
+    # DBConnectors' work too, so it raises instead: raise Rollback out of the (nested) transaction() block
+    def rollback(self):
+        if self.__transaction is not None:
+            raise DatabaseException.UNKNOWN_ERROR("rollback() inside transaction(), raise Rollback in the block instead")
+        if self.connection is not None:
+            try:
+                self.connection.rollback()
+            except Exception:
+                raise DatabaseException.ConnectionInvalid("Could not rollback changes")
+
+    # runs the with block inside a SAVEPOINT, statements in it are not committed one by one.
+    # an exception rolls back to the savepoint only (and is re-raised), work done before it is kept.
+    # call commit() once the outermost savepoint is done
+    @contextmanager
+    def savepoint(self):
+        if self.connection is None:
+            raise DatabaseException.ConnectionInvalid("Connection Invalid")
+        name = "sp_" + str(self.__savepoints)
+        self.cursor.execute("SAVEPOINT " + name)
+        self.__savepoints += 1
+        try:
+            yield
+        except BaseException:
+            self.__savepoints -= 1
+            try:
+                self.cursor.execute("ROLLBACK TO SAVEPOINT " + name)
+            except Exception:
+                raise DatabaseException.ConnectionInvalid("Could not rollback to savepoint")
+            raise
+        self.__savepoints -= 1
+        self.cursor.execute("RELEASE SAVEPOINT " + name)
+
+    # streams rows (tuples in the order of columns) into table with COPY FROM STDIN,
+    # does not commit. raises the same exceptions as execute if any row is rejected
+    def copyRows(self, table: str, columns: Iterable[str], rows: Iterable[tuple]) -> int:
+        return self.copyLines(table, columns, ["\t".join([_copyValue(value) for value in row]) for row in rows])
+
+    # like copyRows, for rows already in COPY text format (tab separated, escaped, \N for NULL)
+    def copyLines(self, table: str, columns: Iterable[str], lines: Iterable[str]) -> int:
+        if self.connection is None:
+            raise DatabaseException.ConnectionInvalid("Connection Invalid")
+        data = io.StringIO()
+        for line in lines:
+            data.write(line)
+            data.write("\n")
+        data.seek(0)
+        query = "COPY " + table + "(" + ", ".join(columns) + ") FROM STDIN"
+        stats = _queryStats
+        start = time.perf_counter()
+        try:
+            with _translateErrors():
+                self.cursor.copy_expert(query, data)
+        except Exception as e:
+            if stats is not None:
+                stats.recordQuery(query, time.perf_counter() - start, failed=True)
+            Tracing.addPhase("execute", time.perf_counter() - start)
+            Tracing.recordException(e)
+            raise
+        if stats is not None:
+            stats.recordQuery(query, time.perf_counter() - start, max(self.cursor.rowcount, 0))
+        Tracing.addPhase("execute", time.perf_counter() - start)
+        return max(self.cursor.rowcount, 0)
+
+    # executes the query, if it is SELECT you may ask to print the results with printSchema
+    # returns the number of rows effected and a ResultSet (for SELECT)
+    def execute(self, query: Union[str, sql.Composed], printSchema=False) -> (int, ResultSet):
+        return self.__execute(query, None, printSchema)
+
+    # executes several statements in one round trip, as a single script. the server stops at the first one that
+    # fails and nothing of the script is kept (the exception is the same execute would raise).
+    # returns what execute returns for the last statement
+    def executeScript(self, statements: Iterable[Union[str, sql.Composed]], printSchema=False) -> (int, ResultSet):
+        statements = [statement if isinstance(statement, sql.Composable) else sql.SQL(statement)
+                      for statement in statements]
+        if not statements:
+            return 0, ResultSet()
+        return self.__execute(sql.SQL(";\n").join(statements), None, printSchema)
+
+    # executes a SELECT through a server side cursor and returns its rows as a StreamingResultSet,
+    # fetched itersize at a time. the transaction stays open until the stream is exhausted or closed
+    def executeStream(self, query: Union[str, sql.Composed], itersize=2000) -> StreamingResultSet:
+        if self.connection is None:
+            raise DatabaseException.ConnectionInvalid("Connection Invalid")
+        if itersize < 1:
+            raise ValueError("Invalid itersize: " + str(itersize))
+        self.connection.streams += 1
+        cursor = self.connection.cursor(name="stream_" + str(self.connection.streams))
+        # the query runs at the DECLARE and the first FETCH, inside transaction() the savepoint covers both
+        guarded = self.__transaction is not None and self.__savepoints == 0
+        with _translateErrors(), self.__transaction.statement(self.cursor) if guarded else nullcontext():
+            try:
+                cursor.execute(query)
+                return StreamingResultSet(cursor, itersize, self.__streamDone)
+            except BaseException:
+                # before the rollback to the savepoint, while the cursor still exists on the server
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+                raise
+
+    # executes a SELECT and returns its result as a ColumnarResultSet, read through a server side cursor
+    # itersize rows at a time so only one batch of tuples is in memory besides the columns
+    def executeColumnar(self, query: Union[str, sql.Composed], itersize=10000) -> ColumnarResultSet:
+        with self.executeStream(query, itersize) as rows:
+            return ColumnarResultSet.fromStream(rows, itersize)
+
+    def __streamDone(self):
+        if self.__savepoints == 0 and self.connection is not None:
+            self.commit()
+
+    # executes a statement added with registerStatement, binding params to its $1, $2, ... placeholders.
+    # the statement is PREPAREd the first time it runs on each connection.
+    # returns the same as execute
+    def executePrepared(self, name: str, params: tuple = (), printSchema=False) -> (int, ResultSet):
+        if self.connection is None:
+            raise DatabaseException.ConnectionInvalid("Connection Invalid")
+        name = name.lower()
+        statement = _statements[name]
+        prepared = self.connection.prepared
+        if prepared.get(name) != statement:
+            # PREPARE and DEALLOCATE are not undone by a rollback, so they get their own round trip
+            # and we only remember statements the server really has
+            if name in prepared:
+                del prepared[name]
+                self.__prepareStatement("DEALLOCATE " + name)
+            try:
+                self.__prepareStatement("PREPARE " + name + " AS " + statement)
+            except errors.lookup("42P05"):
+                # the server has it but we forgot it (see below), with whatever text it had then
+                self.__prepareStatement("DEALLOCATE " + name)
+                self.__prepareStatement("PREPARE " + name + " AS " + statement)
+            prepared[name] = statement
+        query = "EXECUTE " + name
+        if params:
+            query += "(" + ", ".join(["%s"] * len(params)) + ")"
+        try:
+            return self.__execute(query, tuple(params), printSchema)
+        except errors.lookup("26000"):
+            # someone deallocated it behind our back, prepare again on the next call
+            prepared.pop(name, None)
+            raise
+
+    # sends a PREPARE or DEALLOCATE under a savepoint, so if it fails only it is undone: inside transaction()
+    # the per statement one like __execute, otherwise one of its own in the same round trip
+    def __prepareStatement(self, query: str):
+        with _translateErrors():
+            if self.__transaction is not None and self.__savepoints == 0:
+                self.__transaction.execute(self.cursor, query, None)
+                return
+            try:
+                self.cursor.execute("SAVEPOINT prepare; " + query + "; RELEASE SAVEPOINT prepare")
+            except Exception:
+                try:
+                    self.cursor.execute("ROLLBACK TO SAVEPOINT prepare; RELEASE SAVEPOINT prepare")
+                except Exception:
+                    raise DatabaseException.ConnectionInvalid("Could not rollback to savepoint")
+                raise
+
+    def __execute(self, query, params, printSchema) -> (int, ResultSet):
+        if self.connection is None:
+            raise DatabaseException.ConnectionInvalid("Connection Invalid")
+
+        stats = _queryStats
+        span = Tracing.currentSpan()
+        start = time.perf_counter()
+
+        # try execute the query
+        try:
+            with _translateErrors():
+                if self.__transaction is not None and self.__savepoints == 0:
+                    self.__transaction.execute(self.cursor, query, params)
+                else:
+                    self.cursor.execute(query, params)
+                row_effected = max(self.cursor.rowcount, 0)
+                if self.__savepoints == 0:
+                    self.commit()
+        except Exception as e:
+            if stats is not None:
+                stats.recordQuery(self.__sentQuery(query, params, True), time.perf_counter() - start, failed=True)
+            if span is not None:
+                span.phases["execute"] = span.phases.get("execute", 0.0) + time.perf_counter() - start
+                Tracing.recordException(e)
+            raise
+        if span is not None:
+            executed = time.perf_counter()
+            span.phases["execute"] = span.phases.get("execute", 0.0) + executed - start
+
+        # get entries in case of SELECT
+        if self.cursor.description is not None:
+            entries = ResultSet(self.cursor.description, self.cursor.fetchall())
+        else:
+            entries = ResultSet()
+
+        if span is not None:
+            span.phases["fetch"] = span.phases.get("fetch", 0.0) + time.perf_counter() - executed
+        if stats is not None:
+            stats.recordQuery(self.__sentQuery(query, params), time.perf_counter() - start,
+                              row_effected if self.cursor.description is None else 0, entries.size())
+
+        # print SELECT entries
+        if printSchema:
+            print(entries)
+
+        return row_effected, entries
+
+    # the statement's text for the statistics: a template with %s placeholders as is, anything else as the
+    # server got it. after a failure the cursor's last query may be the rollback to the statement savepoint,
+    # so the text is built again
+    def __sentQuery(self, query, params=None, failed=False) -> str:
+        if params is not None and isinstance(query, str):
+            return query
+        try:
+            sent = self.cursor.mogrify(query, params) if failed else self.cursor.query
+        except Exception:
+            sent = None
+        if sent is None:
+            return query if isinstance(query, str) else repr(query)
+        return sent.decode("utf-8", "replace")
\ No newline at end of file
@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+
+# thread-safe LRU cache with a time to live, for query results keyed by tuples whose first item is a kind,
+# e.g. ("player", 7). entries can be dropped one by one or per kind.
+class EntityCache:
+    # maxSize - entries kept before the least recently used one is evicted
+    # ttl - seconds an entry stays valid, None to keep entries until they are evicted or invalidated
+    def __init__(self, maxSize=10000, ttl: Optional[float] = 60.0):
+        if maxSize < 1:
+            raise ValueError("Invalid cache size: " + str(maxSize))
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.__entries = OrderedDict()  # key -> (value, expiry time), least recently used first
+        self.__byKind = {}  # kind -> set of keys, so a kind can be invalidated without a full scan
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # bumped by every invalidation, even of a key that is not cached (yet), see put
+        self.generation = 0
+
+    # the cached value, or default on a miss (pass a sentinel to tell a miss from a cached None)
+    def get(self, key: tuple, default=None):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] < time.monotonic():
+                self.__remove(key)
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    # generation - self.generation read before the value was loaded. if anything was invalidated since, the
+    # value may predate that write, and it is not put
+    def put(self, key: tuple, value, generation: Optional[int] = None):
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self.__lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self.__entries:
+                self.__entries.move_to_end(key)
+            else:
+                self.__byKind.setdefault(key[0], set()).add(key)
+            self.__entries[key] = (value, expires)
+            while len(self.__entries) > self.maxSize:
+                oldest = next(iter(self.__entries))
+                self.__remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, *keys: tuple):
+        with self.__lock:
+            self.generation += 1
+            for key in keys:
+                if key in self.__entries:
+                    self.__remove(key)
+                    self.invalidations += 1
+
+    # drops every entry of the given kind, or only the ones whose key matches the predicate
+    def invalidateKind(self, kind: str, predicate: Callable[[tuple], bool] = None):
+        with self.__lock:
+            self.generation += 1
+            for key in list(self.__byKind.get(kind, ())):
+                if predicate is None or predicate(key):
+                    self.__remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self.__lock:
+            self.generation += 1
+            self.invalidations += len(self.__entries)
+            self.__entries.clear()
+            self.__byKind.clear()
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {"size": len(self.__entries), "max_size": self.maxSize, "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "invalidations": self.invalidations}
+
+    def __len__(self):
+        return len(self.__entries)
+
+    # called with the lock held
+    def __remove(self, key: tuple):
+        del self.__entries[key]
+        keys = self.__byKind.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.__byKind[key[0]]
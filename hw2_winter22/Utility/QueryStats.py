@@ -0,0 +1,176 @@
+import json
+import re
+import threading
+from bisect import bisect_left
+from typing import Optional
+
+# bucket upper bounds in seconds: 10us to about 170s, 2^(1/4) apart, so a quantile read from them is at most
+# ~19% off. the Prometheus output only has every 4th (powers of two) to keep it short
+BUCKETS = tuple([1e-5 * 2 ** (i / 4) for i in range(97)])
+EXPORTED_BUCKETS = BUCKETS[::4]
+# texts whose fingerprint is remembered, so a statement sent with the same text again (a template with %s
+# placeholders, or a query without literals) isn't parsed again
+FINGERPRINT_CACHE = 1000
+
+_STATEMENT_SAVEPOINT = re.compile(r"^(RELEASE SAVEPOINT statement; )?SAVEPOINT statement; ")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*")
+
+
+# the query with its literals (and %s placeholders) replaced by ?, lists of them by (...) and whitespace collapsed, so the same
+# statement with other values has the same fingerprint:
+# "SELECT * FROM Players WHERE id = 7" -> "SELECT * FROM Players WHERE id = ?"
+def fingerprint(query: str) -> str:
+    query = _STATEMENT_SAVEPOINT.sub("", query)
+    query = _NUMBER.sub("?", _STRING.sub("?", query)).replace("%s", "?")
+    return " ".join(_LIST.sub("(...)", query).split())
+
+
+# counts of values (latencies in seconds) per bucket, the quantiles are interpolated inside a bucket
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # the last one is everything above BUCKETS[-1]
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    # the value q (0 to 1) of the recorded values are below, None if nothing was recorded
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        target = q * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            if count and seen + count >= target:
+                lower = BUCKETS[bucket - 1] if bucket > 0 else 0.0
+                upper = BUCKETS[bucket] if bucket < len(BUCKETS) else self.max
+                value = lower + (upper - lower) * (target - seen) / count
+                return min(max(value, self.min), self.max)
+            seen += count
+        return self.max
+
+    # (upper bound, values up to it) for the exported buckets, cumulative like Prometheus wants them
+    def cumulative(self) -> list:
+        result = []
+        seen = 0
+        exported = iter(EXPORTED_BUCKETS)
+        bound = next(exported)
+        for upper, count in zip(BUCKETS, self.counts):
+            seen += count
+            if upper == bound:
+                result.append((bound, seen))
+                bound = next(exported, None)
+        return result
+
+    def summary(self) -> dict:
+        return {"count": self.count, "sum": self.sum, "min": self.min, "max": self.max,
+                "p50": self.quantile(0.5), "p95": self.quantile(0.95), "p99": self.quantile(0.99)}
+
+
+class _QueryStat:
+    __slots__ = ("latency", "errors", "rowsAffected", "rowsReturned")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.rowsAffected = 0
+        self.rowsReturned = 0
+
+
+# thread-safe latency and row counts per query fingerprint, and connection setup times per kind
+# ("connect" opens a new connection, "checkout" is what a DBConnector waited for one)
+class QueryStats:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__queries = {}  # fingerprint -> _QueryStat
+        self.__connections = {}  # kind -> Histogram
+        self.__fingerprints = {}  # query text -> fingerprint(text)
+
+    def recordQuery(self, query: str, seconds: float, rowsAffected=0, rowsReturned=0, failed=False):
+        key = self.__fingerprints.get(query)
+        if key is None:
+            key = fingerprint(query)
+            if len(self.__fingerprints) >= FINGERPRINT_CACHE:
+                self.__fingerprints.clear()
+            self.__fingerprints[query] = key
+        with self.__lock:
+            stat = self.__queries.get(key)
+            if stat is None:
+                stat = self.__queries[key] = _QueryStat()
+            stat.latency.record(seconds)
+            stat.rowsAffected += rowsAffected
+            stat.rowsReturned += rowsReturned
+            if failed:
+                stat.errors += 1
+
+    def recordConnection(self, kind: str, seconds: float):
+        with self.__lock:
+            histogram = self.__connections.get(kind)
+            if histogram is None:
+                histogram = self.__connections[kind] = Histogram()
+            histogram.record(seconds)
+
+    def reset(self):
+        with self.__lock:
+            self.__queries = {}
+            self.__connections = {}
+
+    # {"queries": {fingerprint: {count, sum, min, max, p50, p95, p99, errors, rows_affected, rows_returned}},
+    #  "connections": {kind: {count, sum, min, max, p50, p95, p99}}}, the slowest queries (by total time) first
+    def snapshot(self) -> dict:
+        with self.__lock:
+            queries = {}
+            for key, stat in sorted(self.__queries.items(), key=lambda item: -item[1].latency.sum):
+                queries[key] = stat.latency.summary()
+                queries[key].update(errors=stat.errors, rows_affected=stat.rowsAffected,
+                                    rows_returned=stat.rowsReturned)
+            connections = {kind: histogram.summary() for kind, histogram in sorted(self.__connections.items())}
+        return {"queries": queries, "connections": connections}
+
+    def toJSON(self, indent: Optional[int] = 2) -> str:
+        return json.dumps(self.snapshot(), indent=indent)
+
+    # the Prometheus text exposition format
+    def toPrometheus(self, prefix="db") -> str:
+        lines = []
+        with self.__lock:
+            queries = [(_label(key), stat.latency, stat.errors, stat.rowsAffected, stat.rowsReturned)
+                       for key, stat in sorted(self.__queries.items())]
+            lines += _histogram(prefix + "_query_duration_seconds", "Statement latency by query fingerprint",
+                                "query", [(query, latency) for query, latency, _, _, _ in queries])
+            for name, help, column in (("errors", "Failed statements", 2),
+                                       ("rows_affected", "Rows inserted, updated or deleted", 3),
+                                       ("rows_returned", "Rows returned by SELECTs", 4)):
+                metric = prefix + "_query_" + name + "_total"
+                lines += ["# HELP " + metric + " " + help + " by query fingerprint", "# TYPE " + metric + " counter"]
+                lines += [metric + '{query="' + query[0] + '"} ' + str(query[column]) for query in queries]
+            lines += _histogram(prefix + "_connection_duration_seconds", "Connection setup time", "kind",
+                                [(_label(kind), histogram) for kind, histogram in sorted(self.__connections.items())])
+        return "\n".join(lines) + "\n"
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _histogram(metric: str, help: str, label: str, histograms: list) -> list:
+    lines = ["# HELP " + metric + " " + help, "# TYPE " + metric + " histogram"]
+    for value, histogram in histograms:
+        labels = label + '="' + value + '"'
+        for upper, count in histogram.cumulative():
+            lines.append(metric + "_bucket{" + labels + ',le="' + format(upper, ".6g") + '"} ' + str(count))
+        lines.append(metric + "_bucket{" + labels + ',le="+Inf"} ' + str(histogram.count))
+        lines.append(metric + "_sum{" + labels + "} " + repr(histogram.sum))
+        lines.append(metric + "_count{" + labels + "} " + str(histogram.count))
+    return lines
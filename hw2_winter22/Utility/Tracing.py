@@ -0,0 +1,165 @@
+import functools
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+from Utility.ReturnValue import ReturnValue
+
+# where a call's time went. DBConnector adds to the phases of the span running on its thread
+PHASES = ("connect", "execute", "fetch", "close")
+
+
+# one traced call. phases holds seconds per phase, anything not in them ("other") is Python time
+class Span:
+    __slots__ = ("name", "traceId", "spanId", "parentSpanId", "start", "duration", "phases", "outcome",
+                 "exception", "error")
+
+    def __init__(self, name: str, parent: "Span" = None):
+        self.name = name
+        self.traceId = parent.traceId if parent is not None else "%032x" % random.getrandbits(128)
+        self.spanId = "%016x" % random.getrandbits(64)
+        self.parentSpanId = parent.spanId if parent is not None else None
+        self.start = time.time_ns()
+        self.duration = 0.0
+        self.phases = {}
+        self.outcome = None  # the ReturnValue's name, or the type of whatever else was returned
+        self.exception = None  # the last DatabaseException the call's statements raised (and it mapped)
+        self.error = None  # the exception that escaped the call, if any
+
+    def other(self) -> float:
+        return max(self.duration - sum(self.phases.values()), 0.0)
+
+    # the span in OTLP/JSON form (opentelemetry-proto's Span message)
+    def toOTLP(self) -> dict:
+        attributes = [("solution.outcome", self.outcome), ("solution.exception", self.exception),
+                      ("exception.type", self.error)]
+        attributes = [{"key": key, "value": {"stringValue": value}} for key, value in attributes if value is not None]
+        for phase in PHASES:
+            if phase in self.phases:
+                attributes.append({"key": "solution.phase." + phase, "value": {"doubleValue": self.phases[phase]}})
+        attributes.append({"key": "solution.phase.other", "value": {"doubleValue": self.other()}})
+        span = {"traceId": self.traceId, "spanId": self.spanId, "name": self.name, "kind": 1,
+                "startTimeUnixNano": str(self.start), "endTimeUnixNano": str(self.start + int(self.duration * 1e9)),
+                "attributes": attributes,
+                # STATUS_CODE_ERROR for an escaped exception or ReturnValue.ERROR, STATUS_CODE_UNSET otherwise
+                "status": {"code": 2} if self.error is not None or self.outcome == "ERROR" else {}}
+        if self.parentSpanId is not None:
+            span["parentSpanId"] = self.parentSpanId
+        return span
+
+
+# writes finished spans to a file as OTLP/JSON lines (one ExportTraceServiceRequest per line, what the
+# OpenTelemetry collector's file receiver reads), batchSize spans at a time. thread-safe
+class FileSpanExporter:
+    def __init__(self, path: str, batchSize=100, serviceName="hw2.Solution"):
+        self.path = path
+        self.batchSize = batchSize
+        self.serviceName = serviceName
+        self.__pending = []
+        self.__lock = threading.Lock()
+        self.__file = open(path, "a")
+
+    def export(self, span: Span):
+        with self.__lock:
+            self.__pending.append(span)
+            if len(self.__pending) >= self.batchSize:
+                self.__write()
+
+    def flush(self):
+        with self.__lock:
+            self.__write()
+            self.__file.flush()
+
+    def close(self):
+        with self.__lock:
+            self.__write()
+            self.__file.close()
+
+    def __write(self):
+        if not self.__pending or self.__file.closed:
+            return
+        request = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.serviceName}},
+                                        {"key": "process.pid", "value": {"intValue": str(os.getpid())}}]},
+            "scopeSpans": [{"scope": {"name": "Utility.Tracing"}, "spans": [span.toOTLP() for span in self.__pending]}]}]}
+        self.__file.write(json.dumps(request) + "\n")
+        self.__pending = []
+
+
+_local = threading.local()  # the span running on this thread
+_buffer = None  # the last finished spans, None while tracing is off
+_exporter = None
+
+
+# starts tracing: the last bufferSize spans are kept for recentSpans(), and if exportPath is given every
+# span is also appended to that file (see FileSpanExporter)
+def enableTracing(bufferSize=1000, exportPath: str = None, batchSize=100):
+    global _buffer, _exporter
+    disableTracing()
+    _exporter = FileSpanExporter(exportPath, batchSize) if exportPath is not None else None
+    _buffer = deque(maxlen=bufferSize)
+
+
+# stops tracing and writes out the spans the exporter still holds
+def disableTracing():
+    global _buffer, _exporter
+    exporter, _exporter, _buffer = _exporter, None, None
+    if exporter is not None:
+        exporter.close()
+
+
+# the finished spans still in the ring buffer, oldest first
+def recentSpans() -> list:
+    buffer = _buffer
+    return list(buffer) if buffer is not None else []
+
+
+def currentSpan() -> Optional[Span]:
+    return getattr(_local, "span", None)
+
+
+def addPhase(phase: str, seconds: float):
+    span = getattr(_local, "span", None)
+    if span is not None:
+        span.phases[phase] = span.phases.get(phase, 0.0) + seconds
+
+
+def recordException(exception: BaseException):
+    span = getattr(_local, "span", None)
+    if span is not None:
+        span.exception = type(exception).__qualname__
+
+
+# wraps function so every call is a span while tracing is on. a traced call made inside another one is its
+# child. costs one global lookup per call while tracing is off
+def traced(function: Callable) -> Callable:
+    name = function.__module__ + "." + function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        buffer = _buffer
+        if buffer is None:
+            return function(*args, **kwargs)
+        parent = getattr(_local, "span", None)
+        span = Span(name, parent)
+        _local.span = span
+        start = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+            span.outcome = result.name if isinstance(result, ReturnValue) else type(result).__name__
+            return result
+        except BaseException as e:
+            span.error = type(e).__qualname__
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            _local.span = parent
+            buffer.append(span)
+            exporter = _exporter
+            if exporter is not None:
+                exporter.export(span)
+
+    return wrapper
@@ -1,12 +1,51 @@
+import os
 import unittest
 import Solution
+import Utility.DBConnector as Connector
+
+# how a test gets a clean database, from the fastest to the most isolated:
+#   "rollback" - the schema is built once per test class and each test runs inside Solution.transaction(),
+#                rolled back when it ends. only calls made from the test's own thread join that transaction,
+#                so tests that use other threads or connections, or commit on purpose, need "truncate"
+#   "truncate" - the schema is built once per test class and clearTables empties it after each test
+#   "rebuild"  - createTables before each test and dropTables after it
+# a test class picks one with FIXTURE. TEST_FIXTURE in the environment can make every class stricter,
+# e.g. TEST_FIXTURE=rebuild to run the suite the old way
+FIXTURES = ("rollback", "truncate", "rebuild")
 
 
 class AbstractTest(unittest.TestCase):
+    FIXTURE = "rollback"
+
+    @classmethod
+    def fixture(cls) -> str:
+        return max(cls.FIXTURE, os.environ.get("TEST_FIXTURE") or cls.FIXTURE, key=FIXTURES.index)
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        if cls.fixture() != "rebuild":
+            # whatever an interrupted run left behind
+            Solution.dropTables()
+            Solution.createTables()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        if cls.fixture() != "rebuild":
+            Solution.dropTables()
+
     # before each test, setUp is executed
     def setUp(self) -> None:
-        Solution.createTables()
+        if self.fixture() == "rebuild":
+            Solution.createTables()
+        elif self.fixture() == "rollback":
+            self.__transaction = Solution.transaction()
+            self.__transaction.__enter__()
 
     # after each test, tearDown is executed
     def tearDown(self) -> None:
-        Solution.dropTables()
+        if self.fixture() == "rebuild":
+            Solution.dropTables()
+        elif self.fixture() == "truncate":
+            Solution.clearTables()
+        else:
+            self.__transaction.__exit__(Connector.Rollback, Connector.Rollback(), None)
@@ -10,8 +10,8 @@ if __name__ == '__main__':
         # Illegal entries
         0, 6
     ]
-    for team in teams:
-        print(addTeam(team))
+    for result in addTeams(teams):
+        print(result)
 
     print("ADDING MATCHES")
     matches = [
@@ -40,8 +40,8 @@ if __name__ == '__main__':
         Match(100, 'International', None, 2),
         Match(100, 'International', 1, None),
     ]
-    for match in matches:
-        print(addMatch(match))
+    for result in addMatches(matches):
+        print(result)
 
     print("ADDING PLAYERS")
     players = [
@@ -76,8 +76,8 @@ if __name__ == '__main__':
         Player(101, 1, 10, None, "Left"),
         Player(101, 1, 10, 150, None),
     ]
-    for player in players:
-        print(addPlayer(player))
+    for result in addPlayers(players):
+        print(result)
 
     print("ADDING STADIUMS")
     stadiums = [
@@ -95,8 +95,8 @@ if __name__ == '__main__':
         Stadium(1, 5, 5),
     ]
 
-    for stadium in stadiums:
-        print(addStadium(stadium))
+    for result in addStadiums(stadiums):
+        print(result)
 
     print("GETTING MATCH PROFILES")
     for match in matches:
@@ -131,8 +131,8 @@ if __name__ == '__main__':
         # Illegal entries
         (matches[0], players[1], -3)
     ]
-    for score in player_scores:
-        print(playerScoredInMatch(*score))
+    for result in playersScoredInMatches(player_scores):
+        print(result)
 
     print("ADDING MATCH IN STADIUMS")
     match_in_stadiums = [
@@ -154,8 +154,8 @@ if __name__ == '__main__':
         (matches[3], Stadium(3, 3, 3), -5),
         (matches[2], stadiums[2], 3),
     ]
-    for match_in_stadium in match_in_stadiums:
-        print(matchInStadium(*match_in_stadium))
+    for result in matchesInStadiums(match_in_stadiums):
+        print(result)
 
     print("GETTING AVERAGE ATTENDANCE IN STADIUMS")
     for stadium in stadiums: